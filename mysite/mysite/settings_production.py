@@ -0,0 +1,40 @@
+# Settings for running the site in production, on SQLite:
+#
+#     python manage.py runpooled --settings=mysite.settings_production
+#
+# with `manage.py sync_replicas --settings=mysite.settings_production`
+# run regularly, to bring the replica up to date.  See polls/db.py.
+
+from mysite.settings import *
+
+# with DEBUG on, Django keeps every query it runs in memory
+DEBUG = False
+TEMPLATE_DEBUG = DEBUG
+
+DATABASES = {
+    'default': dict(DATABASES['default']),
+    # a copy of the primary, for the home page and the JSON API to read
+    'replica': dict(
+        DATABASES['default'], NAME='database-replica.sqlite', TEST_MIRROR='default'
+    ),
+}
+
+DATABASE_ROUTERS = ['polls.db.ReplicaRouter']
+
+POLLS_DATABASE = {
+    'PRAGMAS': (
+        # readers and the writer no longer block each other
+        ('journal_mode', 'WAL'),
+        # in WAL mode, only a power cut can lose the last commits
+        ('synchronous', 'NORMAL'),
+        # in KiB, when negative: 64MB of page cache per connection
+        ('cache_size', -65536),
+        ('mmap_size', 268435456),
+        # milliseconds to wait for a lock before giving up
+        ('busy_timeout', 5000),
+        ('temp_store', 'MEMORY'),
+    ),
+    'PERSISTENT': True,
+    'MAX_AGE': 600,
+    'REPLICAS': ('replica',),
+}
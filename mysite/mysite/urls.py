@@ -5,6 +5,16 @@ admin.autodiscover()
 urlpatterns = patterns('',
     url(r'^$', 'polls.views.home'),
     url(r'^poll/(\d+)/$', 'polls.views.poll'),
+    url(r'^poll/(\d+)/events/$', 'polls.events.poll_events'),
+    url(r'^search/$', 'polls.views.search'),
+    url(r'^api/polls/$', 'polls.api.poll_list'),
+    url(r'^api/polls/results/$', 'polls.api.bulk_results'),
+    url(r'^api/polls/search/$', 'polls.api.search'),
+    url(r'^api/polls/trending/$', 'polls.api.trending_polls'),
+    url(r'^api/polls/(\d+)/$', 'polls.api.poll_results'),
+    url(r'^api/polls/(\d+)/votes/$', 'polls.api.poll_votes'),
+    url(r'^api/votes/$', 'polls.api.vote_batch'),
+    url(r'^performance/$', 'polls.performance.performance_stats'),
     url(r'^admin/', include(admin.site.urls)),
 )
 
@@ -0,0 +1,209 @@
+"""
+Votes over time, per minute, hour or day.
+
+``Choice.votes`` is a running total, so it can't say when votes came in.
+With ``POLLS_VOTE_EVENTS`` set, each batch of votes recorded is also
+appended, in bulk, to the ``VoteEvent`` log::
+
+    POLLS_VOTE_EVENTS = {
+        'RETENTION_DAYS': 30,  # how long raw events are kept
+    }
+
+``manage.py roll_up_vote_events`` compacts new events into per-minute,
+per-hour and per-day ``VoteRollup`` rows, and prunes events older than
+the retention period once they're rolled up.  ``vote_series`` answers
+time-series questions from the rollups alone, so reads never scan the
+raw events; they are as fresh as the last rollup.
+
+Events are written after the votes are committed.  If writing them
+fails, the votes still stand, but the analytics miss them.
+"""
+import calendar
+from collections import defaultdict
+from datetime import datetime
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max, Sum
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.timezone import utc
+
+from polls.models import Choice, VoteEvent, VoteRollup, VoteRollupMark
+from polls.services import _batches, _bulk_increment
+from polls.signals import votes_recorded
+
+DEFAULT_RETENTION_DAYS = 30
+
+PERIOD_MINUTES = (
+    ('minute', 1),
+    ('hour', 60),
+    ('day', 60 * 24),
+)
+
+# events are rolled up this many at a time, each batch in a transaction
+ROLLUP_CHUNK_SIZE = 100000
+
+# keep each statement under sqlite's 999 parameter limit
+EVENT_BATCH_SIZE = 200
+ROLLUP_BATCH_SIZE = 150
+
+
+def epoch_minute(dt):
+    return calendar.timegm(dt.utctimetuple()) // 60
+
+
+def minute_start(minute):
+    return datetime.utcfromtimestamp(minute * 60).replace(tzinfo=utc)
+
+
+def vote_events_enabled():
+    return bool(getattr(settings, 'POLLS_VOTE_EVENTS', None))
+
+
+def log_vote_events(deltas, now=None):
+    """Appends ``{(poll_id, choice_id): count}`` to the event log."""
+    minute = epoch_minute(now or timezone.now())
+    events = [
+        VoteEvent(poll_id=poll_id, choice_id=choice_id, votes=count, minute=minute)
+        for (poll_id, choice_id), count in sorted(deltas.items())
+        if count
+    ]
+    for start in range(0, len(events), EVENT_BATCH_SIZE):
+        VoteEvent.objects.bulk_create(events[start:start + EVENT_BATCH_SIZE])
+    return len(events)
+
+
+@receiver(votes_recorded)
+def _log_votes(sender, deltas, **kwargs):
+    if vote_events_enabled():
+        log_vote_events(deltas)
+
+
+def roll_up_vote_events(chunk_size=ROLLUP_CHUNK_SIZE):
+    """
+    Adds every event logged since the last run to the rollups.  Returns
+    the number of votes rolled up.
+    """
+    mark, _ = VoteRollupMark.objects.get_or_create(pk=1)
+    upto = VoteEvent.objects.aggregate(Max('id'))['id__max'] or 0
+    rolled = 0
+    after = mark.last_event_id
+    while after < upto:
+        end = min(after + chunk_size, upto)
+        rolled += _roll_up_range(mark.pk, after, end)
+        after = end
+    return rolled
+
+
+@transaction.commit_on_success
+def _roll_up_range(mark_pk, after, upto):
+    # the database sums each choice's votes per minute...
+    rows = list(
+        VoteEvent.objects.filter(id__gt=after, id__lte=upto)
+        .values('poll_id', 'choice_id', 'minute')
+        .annotate(total=Sum('votes'))
+    )
+    # ...leaving few enough rows to bucket into hours and days here
+    valid = set()
+    for choice_ids in _batches(set(row['choice_id'] for row in rows)):
+        valid.update(
+            Choice.objects.filter(pk__in=choice_ids).values_list('poll_id', 'id')
+        )
+    buckets = dict((period, defaultdict(int)) for period, _ in PERIOD_MINUTES)
+    rolled = 0
+    for row in rows:
+        key = (row['poll_id'], row['choice_id'])
+        if key not in valid:
+            continue  # the choice has since been deleted
+        rolled += row['total']
+        for period, size in PERIOD_MINUTES:
+            bucket = row['minute'] - row['minute'] % size
+            buckets[period][key + (bucket,)] += row['total']
+
+    for period, counts in buckets.items():
+        _merge_rollups(period, counts)
+    VoteRollupMark.objects.filter(pk=mark_pk).update(last_event_id=upto)
+    return rolled
+
+
+def _merge_rollups(period, counts):
+    """Adds ``{(poll_id, choice_id, minute): votes}`` to the rollups."""
+    existing = {}
+    for minutes in _batches(set(minute for _, _, minute in counts)):
+        existing.update(
+            ((poll_id, choice_id, epoch_minute(start)), pk)
+            for pk, poll_id, choice_id, start in VoteRollup.objects.filter(
+                period=period, start__in=[minute_start(m) for m in minutes]
+            ).values_list('id', 'poll_id', 'choice_id', 'start')
+        )
+    increments = {}
+    missing = []
+    for key, votes in sorted(counts.items()):
+        if key in existing:
+            increments[existing[key]] = votes
+        else:
+            poll_id, choice_id, minute = key
+            missing.append(VoteRollup(
+                poll_id=poll_id, choice_id=choice_id, period=period,
+                start=minute_start(minute), votes=votes,
+            ))
+    _bulk_increment(VoteRollup, 'votes', increments)
+    for start in range(0, len(missing), ROLLUP_BATCH_SIZE):
+        VoteRollup.objects.bulk_create(missing[start:start + ROLLUP_BATCH_SIZE])
+
+
+@transaction.commit_on_success
+def prune_vote_events(retention_days=None, now=None):
+    """
+    Deletes events older than the retention period, as long as they have
+    been rolled up.  Returns the number deleted.
+    """
+    if retention_days is None:
+        retention_days = getattr(settings, 'POLLS_VOTE_EVENTS', {}).get(
+            'RETENTION_DAYS', DEFAULT_RETENTION_DAYS
+        )
+    marks = list(VoteRollupMark.objects.values_list('last_event_id', flat=True))
+    if not marks:
+        return 0
+    cutoff = epoch_minute(now or timezone.now()) - retention_days * 60 * 24
+    # straight SQL, as QuerySet.delete() would load every row first
+    qn = connection.ops.quote_name
+    cursor = connection.cursor()
+    cursor.execute(
+        'DELETE FROM %s WHERE %s <= %%s AND %s < %%s' % (
+            qn(VoteEvent._meta.db_table), qn('id'), qn('minute'),
+        ),
+        [marks[0], cutoff]
+    )
+    transaction.set_dirty()
+    return cursor.rowcount
+
+
+def vote_series(poll_id, period='hour', since=None, until=None, by_choice=False):
+    """
+    A poll's votes per ``period``, as ``[(start, votes), ...]`` in time
+    order, for the buckets from ``since`` up to ``until`` that had votes.
+    With ``by_choice``, votes is a ``{choice_id: votes}`` dict.  One query
+    on the rollups.
+    """
+    if period not in dict(PERIOD_MINUTES):
+        raise ValueError('Unknown period: %r' % (period,))
+    rollups = VoteRollup.objects.filter(poll=poll_id, period=period)
+    if since is not None:
+        rollups = rollups.filter(start__gte=since)
+    if until is not None:
+        rollups = rollups.filter(start__lt=until)
+
+    if not by_choice:
+        return [
+            (row['start'], row['total']) for row in
+            rollups.values('start').annotate(total=Sum('votes')).order_by('start')
+        ]
+    series = []
+    for start, choice_id, votes in rollups.order_by('start', 'choice').values_list(
+            'start', 'choice_id', 'votes'):
+        if not series or series[-1][0] != start:
+            series.append((start, {}))
+        series[-1][1][choice_id] = votes
+    return series
@@ -0,0 +1,257 @@
+"""
+A JSON API for dashboards, kiosks and other scripts:
+
+    /api/polls/                  polls, newest last, paginated by cursor
+    /api/polls/<id>/             one poll's results
+    /api/polls/<id>/votes/       votes per minute, hour or day
+    /api/polls/results/?ids=...  results for up to POLLS_API_MAX_BULK polls
+    /api/polls/search/?q=...     polls matching a search, best first
+    /api/polls/trending/?n=...   the polls with the most votes lately
+    /api/votes/                  POST a batch of votes
+
+Everything is serialised straight from ``values()`` rows, rather than
+model instances, and results for any number of polls take two queries.
+Reads can go to a replica; see ``polls.db``.
+"""
+import json
+import numbers
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.dateparse import parse_datetime
+from django.http import (
+    Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden
+)
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+from polls.analytics import vote_series
+from polls.db import reads_from_replica
+from polls.models import MAX_INTEGER, Choice, Poll, sharding_enabled
+from polls.pagination import keyset_page
+from polls.ratelimit import rate_limited
+from polls.search import search_polls
+from polls.services import InvalidVotes, record_votes
+from polls.trending import get_trending_board, trending
+
+DEFAULT_MAX_BULK = 100
+
+POLL_FIELDS = ('id', 'question', 'pub_date', 'votes')
+
+
+def _poll_id(value):
+    """The poll id in a URL, or a 404 if no poll could have it."""
+    poll_id = int(value)
+    if not _is_integer(poll_id, 0):
+        raise Http404
+    return poll_id
+
+
+def json_response(data, response_class=HttpResponse):
+    return response_class(
+        json.dumps(data, cls=DjangoJSONEncoder), content_type='application/json'
+    )
+
+
+@reads_from_replica
+def poll_list(request):
+    try:
+        page = keyset_page(
+            Poll.objects.values(*POLL_FIELDS),
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+        )
+    except ValueError:
+        return json_response({'error': 'bad cursor'}, HttpResponseBadRequest)
+    return json_response({
+        'polls': page.items,
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    })
+
+
+def results_for(poll_ids):
+    """
+    Results for each of ``poll_ids`` that exists, in the order asked for:
+    one query for the polls, and one for all of their choices.
+    """
+    polls = dict(
+        (row['id'], row)
+        for row in Poll.objects.filter(pk__in=poll_ids).values(*POLL_FIELDS)
+    )
+    choice_fields = ['id', 'poll_id', 'choice', 'votes']
+    choices = Choice.objects.filter(poll__in=polls.keys()).order_by('id')
+    if sharding_enabled():
+        choices = choices.with_votes()
+        choice_fields.append('shard_votes')
+
+    for poll in polls.values():
+        poll['choices'] = []
+    for row in choices.values(*choice_fields):
+        poll = polls[row.pop('poll_id')]
+        row['votes'] += row.pop('shard_votes', 0) or 0
+        row['percentage'] = 100.0 * row['votes'] / poll['votes'] if poll['votes'] else 0
+        poll['choices'].append(row)
+    return [polls[pk] for pk in poll_ids if pk in polls]
+
+
+@rate_limited('results')
+@reads_from_replica
+def poll_results(request, poll_id):
+    results = results_for([_poll_id(poll_id)])
+    if not results:
+        raise Http404
+    return json_response(results[0])
+
+
+def _parse_datetime(value):
+    if value is None:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError('bad datetime: %s' % (value,))
+    return parsed
+
+
+@rate_limited('results')
+@reads_from_replica
+def poll_votes(request, poll_id):
+    """
+    ``?period=minute|hour|day``, optionally ``since`` and ``until`` (ISO
+    8601) and ``by=choice``.  Answered from the rollups, in one query.
+    """
+    poll_id = _poll_id(poll_id)
+    period = request.GET.get('period', 'hour')
+    by_choice = request.GET.get('by') == 'choice'
+    try:
+        series = vote_series(
+            poll_id, period,
+            since=_parse_datetime(request.GET.get('since')),
+            until=_parse_datetime(request.GET.get('until')),
+            by_choice=by_choice,
+        )
+    except ValueError as e:
+        return json_response({'error': str(e)}, HttpResponseBadRequest)
+    key = 'choices' if by_choice else 'votes'
+    return json_response({
+        'poll': poll_id,
+        'period': period,
+        'series': [{'start': start, key: votes} for start, votes in series],
+    })
+
+
+@rate_limited('results')
+@reads_from_replica
+def bulk_results(request):
+    max_bulk = getattr(settings, 'POLLS_API_MAX_BULK', DEFAULT_MAX_BULK)
+    try:
+        poll_ids = [int(pk) for pk in request.GET.get('ids', '').split(',') if pk]
+    except ValueError:
+        poll_ids = None
+    if poll_ids is None or not all(_is_integer(pk, 0) for pk in poll_ids):
+        return json_response(
+            {'error': 'ids must be integers from 0 to %d' % (MAX_INTEGER,)},
+            HttpResponseBadRequest
+        )
+    if len(poll_ids) > max_bulk:
+        return json_response(
+            {'error': 'at most %d ids per request' % (max_bulk,)},
+            HttpResponseBadRequest
+        )
+    return json_response({'polls': results_for(poll_ids)})
+
+
+def _is_integer(value, minimum):
+    return (isinstance(value, numbers.Integral) and not isinstance(value, bool)
+            and minimum <= value <= MAX_INTEGER)
+
+
+@rate_limited('search')
+@reads_from_replica
+def search(request):
+    try:
+        number = int(request.GET.get('page', 1))
+    except ValueError:
+        number = 0
+    if number < 1:
+        return json_response({'error': 'bad page'}, HttpResponseBadRequest)
+    page = search_polls(request.GET.get('q', ''), number)
+    return json_response({
+        'polls': [
+            dict((field, getattr(poll, field)) for field in POLL_FIELDS)
+            for poll in page
+        ],
+        'page': page.number,
+        'has_next': page.has_next,
+    })
+
+
+@reads_from_replica
+def trending_polls(request):
+    """
+    The top ``n`` trending polls, or ``POLLS_TRENDING['SIZE']`` of them,
+    best first, each with its ``score``: its votes, decayed by age.
+    """
+    board = get_trending_board()
+    if board is None:
+        raise Http404
+    max_bulk = getattr(settings, 'POLLS_API_MAX_BULK', DEFAULT_MAX_BULK)
+    try:
+        n = int(request.GET.get('n', board.size))
+    except ValueError:
+        n = 0
+    if not 1 <= n <= max_bulk:
+        return json_response(
+            {'error': 'n must be from 1 to %d' % (max_bulk,)}, HttpResponseBadRequest
+        )
+    scores = trending(n)
+    polls = dict(
+        (row['id'], row) for row in
+        Poll.objects.filter(pk__in=[poll_id for poll_id, _ in scores])
+        .values(*POLL_FIELDS)
+    )
+    ranked = []
+    for poll_id, score in scores:
+        if poll_id in polls:
+            polls[poll_id]['score'] = round(score, 3)
+            ranked.append(polls[poll_id])
+    return json_response({'polls': ranked})
+
+
+@rate_limited('vote')
+@csrf_exempt
+@require_POST
+def vote_batch(request):
+    """
+    Records a batch of pre-aggregated votes, all or nothing::
+
+        {"votes": [{"poll": 1, "choice": 3, "count": 120}, ...]}
+
+    Callers identify themselves with an ``X-Api-Key`` header holding one
+    of ``POLLS_VOTE_API_KEYS``; with none configured, the endpoint is off.
+    """
+    if request.META.get('HTTP_X_API_KEY') not in getattr(
+            settings, 'POLLS_VOTE_API_KEYS', ()):
+        return json_response({'error': 'bad API key'}, HttpResponseForbidden)
+    try:
+        votes = [
+            (vote['poll'], vote['choice'], vote.get('count', 1))
+            for vote in json.loads(request.body)['votes']
+        ]
+        if not all(_is_integer(poll_id, 0) and _is_integer(choice_id, 0)
+                   and _is_integer(count, 1) for poll_id, choice_id, count in votes):
+            raise ValueError(
+                'poll and choice must be ids, and count from 1 to %d' % (MAX_INTEGER,)
+            )
+        if sum(count for _, _, count in votes) > MAX_INTEGER:
+            raise ValueError('counts add up to more than %d' % (MAX_INTEGER,))
+        recorded = record_votes(votes)
+    except InvalidVotes as e:
+        return json_response(
+            {'error': str(e), 'invalid': sorted(e.invalid)}, HttpResponseBadRequest
+        )
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        return json_response(
+            {'error': 'bad vote batch: %s' % (e,)}, HttpResponseBadRequest
+        )
+    return json_response({'recorded': recorded})
@@ -0,0 +1,749 @@
+"""
+Benchmarks for the polls hot paths.
+
+Each benchmark is a function registered with ``@benchmark``.  It gets the
+command-line options and returns a dict of named results.  Run them with::
+
+    python manage.py benchmark [name ...]
+
+They always run against a throwaway database, never database.sqlite.
+
+``hot_paths`` also counts each path's queries, and the command fails if
+any goes over its budget in ``QUERY_BUDGETS``.  With ``--json`` the results
+are saved, and ``--compare`` fails the run if anything got slower than a
+saved run by more than ``--threshold`` percent.
+"""
+import os
+import random
+import resource
+import threading
+import time
+import urllib2
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import get_cache
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.signals import request_started
+from django.core.servers.basehttp import WSGIServer
+from django.db import (
+    close_connection, connection, connections, reset_queries, router, transaction
+)
+from django.test.client import Client
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from mysite.settings_production import POLLS_DATABASE as PRODUCTION_DATABASE
+from polls.analytics import (
+    epoch_minute, minute_start, prune_vote_events, roll_up_vote_events,
+    vote_series
+)
+from polls.api import results_for
+from polls.db import ReplicaRouter, replica_reads, sync_replicas
+from polls.export import export_lines
+from polls.guard import LRUSet, RotatingBloomFilter, voter_digest
+from polls.importer import _insert_polls
+from polls.models import Choice, Poll, VoteEvent
+from polls.pagination import encode_cursor, page_size
+from polls.ratelimit import CacheBucketStore, MemoryBucketStore
+from polls.server import PooledWSGIServer, QuietRequestHandler
+from polls.search import create_search_index, drop_search_index, search_polls
+from polls.services import create_vote_shards, record_vote
+from polls.trending import TrendingBoard
+
+BENCHMARKS = {}
+
+
+def benchmark(func):
+    BENCHMARKS[func.__name__] = func
+    return func
+
+
+def run_concurrently(func, num_threads):
+    """
+    Runs ``func`` in ``num_threads`` threads at once, each on its own
+    database connection, and returns the wall-clock time taken.
+    """
+    def worker():
+        try:
+            func()
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(num_threads)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.time() - start
+
+
+def per_second(count, seconds):
+    return round(count / seconds, 1) if seconds else float('inf')
+
+
+def mean_ms(func, repeat=20):
+    """Calls ``func`` ``repeat`` times; returns the mean in milliseconds."""
+    start = time.time()
+    for _ in range(repeat):
+        func()
+    return round((time.time() - start) * 1000 / repeat, 3)
+
+
+def scales(options):
+    return [int(scale) for scale in options['scales'].split(',')]
+
+
+def count_queries(func):
+    """
+    Calls ``func``, and returns how many queries it made.  As with
+    ``assertNumQueries``, the query log isn't cleared at the start of
+    each request meanwhile, so requests through the test client count.
+    """
+    old_debug_cursor = connection.use_debug_cursor
+    connection.use_debug_cursor = True
+    request_started.disconnect(reset_queries)
+    first_query = len(connection.queries)
+    try:
+        func()
+        return len(connection.queries) - first_query
+    finally:
+        request_started.connect(reset_queries)
+        connection.use_debug_cursor = old_debug_cursor
+
+
+# keeps each INSERT under sqlite's 999 parameter limit
+SEED_BATCH_SIZE = 200
+
+def seed_polls(count):
+    """
+    Bulk-inserts polls, a second apart, until there are ``count`` of them.
+    """
+    existing = Poll.objects.count()
+    start = timezone.now()
+    for offset in range(existing, count, SEED_BATCH_SIZE):
+        Poll.objects.bulk_create([
+            Poll(question='poll %d' % (i,), pub_date=start + timedelta(seconds=i))
+            for i in range(offset, min(offset + SEED_BATCH_SIZE, count))
+        ])
+
+
+def seed_dataset(count, choices=5, poll_votes=100, seed=1):
+    """
+    Adds polls, each with ``choices`` choices, until there are ``count``
+    polls.  Each poll has up to twice ``poll_votes`` votes, spread unevenly
+    over its choices.  The ``n``th poll comes out the same for a given
+    ``seed``, however many runs it takes to get there.
+    """
+    existing = Poll.objects.count()
+    start = timezone.now() - timedelta(seconds=count)
+    for offset in range(existing, count, SEED_BATCH_SIZE):
+        batch = []
+        for i in range(offset, min(offset + SEED_BATCH_SIZE, count)):
+            rng = random.Random(seed * 1000003 + i)
+            weights = [rng.random() for _ in range(choices)]
+            total = rng.randint(0, 2 * poll_votes)
+            poll_choices = [
+                Choice(choice='choice %d' % (n,),
+                       votes=int(total * weight / sum(weights)))
+                for n, weight in enumerate(weights)
+            ]
+            batch.append((
+                Poll(question='poll %d' % (i,),
+                     pub_date=start + timedelta(seconds=i),
+                     votes=sum(choice.votes for choice in poll_choices)),
+                poll_choices,
+            ))
+        _insert_polls(batch)
+
+
+# the most queries each hot path may make, whatever the data
+QUERY_BUDGETS = {
+    'home_page': 1,
+    'poll_page': 2,
+    'vote': 2,
+    'poll_results': 1,
+    'total_votes': 0,
+    'percentage': 0,
+}
+
+def over_budget(results):
+    """Messages for each ``<...>_<path>_queries`` result over its budget."""
+    failures = []
+    for key, queries in sorted(results.items()):
+        for path, budget in QUERY_BUDGETS.items():
+            if key.endswith('_%s_queries' % (path,)) and queries > budget:
+                failures.append(
+                    '%s: %d queries, over the budget of %d' % (key, queries, budget)
+                )
+    return failures
+
+
+def _slower_by(key, baseline, current):
+    """How many percent worse ``current`` is, or None if not comparable."""
+    if key.endswith('_queries'):
+        return float('inf') if current > baseline else 0.0
+    if not baseline:
+        return None
+    change = 100.0 * (current - baseline) / baseline
+    if key.endswith('_ms') or key.endswith('_seconds'):
+        return change
+    if key.endswith('_per_sec'):
+        return -change
+    return None
+
+
+def compare_results(baseline, current, threshold):
+    """
+    Messages for each result in ``current`` that is more than ``threshold``
+    percent worse than in ``baseline``, or makes more queries.  Both are
+    ``{benchmark: {result: value}}``; results only in one are skipped.
+    """
+    regressions = []
+    for name, results in sorted(current.items()):
+        for key, value in sorted(results.items()):
+            try:
+                before = baseline[name][key]
+            except KeyError:
+                continue
+            slower = _slower_by(key, before, value)
+            if slower is not None and slower > threshold:
+                regressions.append(
+                    '%s.%s: %s, was %s' % (name, key, value, before)
+                )
+    return regressions
+
+
+@benchmark
+def hot_paths(options):
+    """
+    Latency and query counts for the home page, a poll page, a vote,
+    and a loaded poll's results, total and percentages, through the test
+    client and on the models, as the seeded data grows.
+    """
+    client = Client()
+    results = {}
+    for scale in scales(options):
+        seed_dataset(
+            scale, options['choices'], options['poll_votes'], options['seed']
+        )
+        choice = Choice.objects.select_related('poll').order_by('-id')[0]
+        poll, choice_id = choice.poll, choice.id
+        url = '/poll/%d/' % (poll.id,)
+        choices = poll.results()
+
+        paths = [
+            ('home_page', lambda: client.get('/'), 20),
+            ('poll_page', lambda: client.get(url), 20),
+            ('vote', lambda: client.post(url, {'vote': choice_id}), 20),
+            ('poll_results', poll.results, 100),
+            ('total_votes', poll.total_votes, 10000),
+            ('percentage', lambda: [c.percentage() for c in choices], 1000),
+        ]
+        for path, func, repeat in paths:
+            label = '%d_polls_%s' % (scale, path)
+            results[label + '_queries'] = count_queries(func)
+            results[label + '_ms'] = mean_ms(func, repeat=repeat)
+    return results
+
+
+@benchmark
+def vote_writes(options):
+    """Vote throughput on a single hot choice, with and without shards."""
+    num_threads = options['threads']
+    votes_per_thread = options['votes'] // num_threads
+    num_shards = options['shards']
+
+    results = {}
+    for shards in (0, num_shards):
+        poll = Poll.objects.create(question='hot poll', pub_date=timezone.now())
+        choice = Choice.objects.create(poll=poll, choice='hot choice')
+        if shards:
+            create_vote_shards(shards, Choice.objects.filter(pk=choice.pk))
+
+        def vote_lots():
+            for _ in range(votes_per_thread):
+                record_vote(poll.id, choice.id)
+
+        with override_settings(POLLS_VOTE_SHARDS=shards):
+            elapsed = run_concurrently(vote_lots, num_threads)
+            counted = Choice.objects.get(pk=choice.pk).vote_count()
+
+        label = 'sharded_%d' % shards if shards else 'unsharded'
+        results[label + '_votes_per_sec'] = per_second(counted, elapsed)
+    return results
+
+
+@benchmark
+def home_pages(options):
+    """
+    Latency of the first and a deep page of the home page as the table
+    grows, with keyset pagination, against the OFFSET query it replaced.
+    """
+    client = Client()
+    size = page_size()
+    results = {}
+    for scale in scales(options):
+        seed_polls(scale)
+        ordered = Poll.objects.order_by('pub_date', 'id')
+        deep = scale * 9 // 10
+        cursor = encode_cursor(ordered[deep])
+
+        results['%d_polls_first_page_ms' % scale] = mean_ms(
+            lambda: client.get('/')
+        )
+        results['%d_polls_deep_page_ms' % scale] = mean_ms(
+            lambda: client.get('/', {'after': cursor})
+        )
+        results['%d_polls_deep_offset_query_ms' % scale] = mean_ms(
+            lambda: list(ordered[deep:deep + size])
+        )
+    return results
+
+
+def start_server(server):
+    """Serves the site from ``server`` in a background thread."""
+    server.set_app(WSGIHandler())
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return 'http://%s:%d' % server.server_address[:2]
+
+
+@benchmark
+def wsgi_servers(options):
+    """
+    A load test: requests per second for the home and poll pages, fetched
+    over HTTP by ``--threads`` clients at once, from a server handling one
+    request at a time and from the pooled server.
+    """
+    seed_polls(page_size() * 2)
+    poll = Poll.objects.order_by('id')[0]
+    for i in range(5):
+        Choice.objects.create(poll=poll, choice='choice %d' % (i,), votes=i)
+
+    num_threads = options['threads']
+    requests_per_thread = options['requests'] // num_threads
+    servers = [
+        ('serial', WSGIServer(('127.0.0.1', 0), QuietRequestHandler)),
+        ('pooled', PooledWSGIServer(
+            ('127.0.0.1', 0), QuietRequestHandler, workers=num_threads,
+            backlog=num_threads * requests_per_thread,
+        )),
+    ]
+    results = {}
+    for label, server in servers:
+        base_url = start_server(server)
+        try:
+            for page, path in [('home', '/'), ('poll', '/poll/%d/' % poll.id)]:
+                def fetch_lots():
+                    for _ in range(requests_per_thread):
+                        urllib2.urlopen(base_url + path).read()
+                elapsed = run_concurrently(fetch_lots, num_threads)
+                results['%s_%s_requests_per_sec' % (label, page)] = per_second(
+                    requests_per_thread * num_threads, elapsed
+                )
+        finally:
+            server.shutdown()
+            server.server_close()
+    return results
+
+
+EVENT_INSERT_BATCH_SIZE = 10000
+
+@transaction.commit_on_success
+def _insert_events(rows):
+    qn = connection.ops.quote_name
+    connection.cursor().executemany(
+        'INSERT INTO %s (%s, %s, %s, %s) VALUES (%%s, %%s, %%s, %%s)' % (
+            qn(VoteEvent._meta.db_table),
+            qn('poll_id'), qn('choice_id'), qn('votes'), qn('minute'),
+        ),
+        rows
+    )
+
+
+@benchmark
+def vote_events(options):
+    """
+    Logging, rolling up and querying ``--events`` synthetic vote events,
+    spread over 30 days and 100 polls, and an hourly series read from the
+    rollups against the same series summed from the raw events.
+    """
+    num_events = options['events']
+    seed_polls(100)
+    polls = list(Poll.objects.order_by('id')[:100])
+    Choice.objects.bulk_create([
+        Choice(poll=poll, choice='choice %d' % (i,))
+        for poll in polls for i in range(4)
+    ])
+    pairs = list(Choice.objects.values_list('poll_id', 'id'))
+    end = epoch_minute(timezone.now())
+    span = 30 * 24 * 60
+
+    start = time.time()
+    for offset in range(0, num_events, EVENT_INSERT_BATCH_SIZE):
+        _insert_events([
+            random.choice(pairs) + (1, end - span + i * span // num_events)
+            for i in range(offset, min(offset + EVENT_INSERT_BATCH_SIZE, num_events))
+        ])
+    results = {'log_events_per_sec': per_second(num_events, time.time() - start)}
+
+    start = time.time()
+    roll_up_vote_events()
+    elapsed = time.time() - start
+    results['rollup_seconds'] = round(elapsed, 2)
+    results['rollup_events_per_sec'] = per_second(num_events, elapsed)
+
+    poll_id = polls[0].id
+    since = minute_start(end - span)
+    results['hourly_series_from_rollups_ms'] = mean_ms(
+        lambda: vote_series(poll_id, 'hour', since=since)
+    )
+    qn = connection.ops.quote_name
+    raw_sql = 'SELECT %s / 60, SUM(%s) FROM %s WHERE %s = %%s GROUP BY 1' % (
+        qn('minute'), qn('votes'), qn(VoteEvent._meta.db_table), qn('poll_id'),
+    )
+    def raw_series():
+        cursor = connection.cursor()
+        cursor.execute(raw_sql, [poll_id])
+        return cursor.fetchall()
+    results['hourly_series_from_raw_events_ms'] = mean_ms(raw_series, repeat=3)
+
+    start = time.time()
+    results['pruned_events'] = prune_vote_events(retention_days=7)
+    results['prune_seconds'] = round(time.time() - start, 2)
+    return results
+
+
+@benchmark
+def exports(options):
+    """
+    Export throughput, and how much the process's peak memory grows, as
+    the number of polls (with three choices each) grows.
+    """
+    results = {}
+    for scale in scales(options):
+        seed_polls(scale)
+        unchoiced = list(
+            Poll.objects.filter(choice__isnull=True).values_list('id', flat=True)
+        )
+        for start in range(0, len(unchoiced), SEED_BATCH_SIZE):
+            Choice.objects.bulk_create([
+                Choice(poll_id=poll_id, choice='choice %d' % (i,), votes=i)
+                for poll_id in unchoiced[start:start + SEED_BATCH_SIZE]
+                for i in range(3)
+            ])
+
+        for format in ('csv', 'ndjson'):
+            peak_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            start = time.time()
+            lines = 0
+            for line in export_lines(format):
+                lines += 1
+            elapsed = time.time() - start
+            peak_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            results['%d_polls_%s_lines_per_sec' % (scale, format)] = per_second(
+                lines, elapsed
+            )
+            results['%d_polls_%s_peak_rss_growth_kb' % (scale, format)] = (
+                peak_after - peak_before
+            )
+    return results
+
+
+@benchmark
+def instrumentation_overhead(options):
+    """
+    The poll page's mean latency with and without PerformanceMiddleware,
+    to show that instrumenting every request costs next to nothing.
+    """
+    poll = Poll.objects.create(question='timed poll', pub_date=timezone.now())
+    for i in range(5):
+        Choice.objects.create(poll=poll, choice='choice %d' % (i,), votes=i)
+    url = '/poll/%d/' % (poll.id,)
+    instrumented = (
+        ('polls.performance.PerformanceMiddleware',) + settings.MIDDLEWARE_CLASSES
+    )
+
+    results = {}
+    for label, middleware in (('plain', settings.MIDDLEWARE_CLASSES),
+                              ('instrumented', instrumented)):
+        with override_settings(MIDDLEWARE_CLASSES=middleware):
+            client = Client()
+            client.get(url)
+            results[label + '_poll_page_ms'] = mean_ms(
+                lambda: client.get(url), repeat=500
+            )
+    results['overhead_percent'] = round(
+        100.0 * (results['instrumented_poll_page_ms'] - results['plain_poll_page_ms'])
+        / results['plain_poll_page_ms'], 1
+    )
+    return results
+
+
+REPLICA_ALIAS = 'benchmark_replica'
+
+def _add_replica():
+    """Adds a replica of the benchmark database, and routes reads to it."""
+    connections.databases[REPLICA_ALIAS] = dict(
+        connection.settings_dict, NAME='benchmark-replica.sqlite'
+    )
+    replica_router = ReplicaRouter()
+    router.routers.append(replica_router)
+    return replica_router
+
+
+def _remove_replica(replica_router):
+    router.routers.remove(replica_router)
+    connections[REPLICA_ALIAS].close()
+    del connections._connections[REPLICA_ALIAS]
+    name = connections.databases.pop(REPLICA_ALIAS)['NAME']
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(name + suffix):
+            os.remove(name + suffix)
+
+
+@benchmark
+def database_profiles(options):
+    """
+    Reads of a poll's results and votes per second, with half of
+    ``--threads`` reading and half voting at once: first on SQLite's
+    defaults with a new connection for every request, as in development,
+    then on the production profile from mysite/settings_production.py,
+    with tuned pragmas, connections kept open and reads from a replica.
+    """
+    if connection.vendor != 'sqlite':
+        return {}
+    seed_dataset(1000, options['choices'], options['poll_votes'], options['seed'])
+    pairs = list(Choice.objects.values_list('poll_id', 'id'))
+    per_thread = options['requests'] // options['threads']
+    num_each = max(options['threads'] // 2, 1)
+
+    def mixed_load(persistent):
+        timings = {'reads': [], 'votes': []}
+        def requests(kind, func):
+            def run():
+                start = time.time()
+                for _ in range(per_thread):
+                    func()
+                    if not persistent:
+                        close_connection()
+                timings[kind].append(time.time() - start)
+            return run
+        def read():
+            with replica_reads():
+                results_for([random.choice(pairs)[0]])
+        roles = (
+            [requests('reads', read)] * num_each
+            + [requests('votes', lambda: record_vote(*random.choice(pairs)))] * num_each
+        )
+        run_concurrently(lambda: roles.pop()(), len(roles))
+        return dict(
+            (kind, per_second(per_thread * num_each, max(seconds)))
+            for kind, seconds in timings.items()
+        )
+
+    results = {}
+    profiles = [
+        ('default', {'PRAGMAS': (('journal_mode', 'DELETE'),)}, False),
+        ('production', dict(PRODUCTION_DATABASE, REPLICAS=(REPLICA_ALIAS,)), True),
+    ]
+    for label, config, production in profiles:
+        close_connection()
+        with override_settings(POLLS_DATABASE=config):
+            replica_router = _add_replica() if production else None
+            try:
+                if production:
+                    sync_replicas()
+                rates = mixed_load(persistent=production)
+            finally:
+                close_connection()
+                if replica_router is not None:
+                    _remove_replica(replica_router)
+        for kind, rate in rates.items():
+            results['%s_%s_per_sec' % (label, kind)] = rate
+
+    # leave the database as the other benchmarks expect it
+    connection.cursor().execute('PRAGMA journal_mode = DELETE')
+    return results
+
+
+GUARD_CAPACITY = 100000
+
+@benchmark
+def vote_guard(options):
+    """
+    For the duplicate-vote guard's Bloom filters, at several error rates,
+    and its LRU set: memory, checks per second, and how often new voters
+    were taken for repeat ones.  Then the latency of a new voter's vote
+    and of a refused repeat, with no guard, the guard, and the guard with
+    its VoteRecord table.
+    """
+    new_voters = [voter_digest(1, 'new %d' % (i,)) for i in range(GUARD_CAPACITY)]
+    strangers = [voter_digest(1, 'stranger %d' % (i,)) for i in range(GUARD_CAPACITY)]
+    backends = [
+        ('bloom_%g' % (rate,), RotatingBloomFilter(GUARD_CAPACITY, rate))
+        for rate in (0.01, 0.001, 0.0001)
+    ] + [('lru', LRUSet(GUARD_CAPACITY))]
+
+    results = {}
+    for label, seen in backends:
+        start = time.time()
+        for digest in new_voters:
+            seen.check_and_add(digest)
+        elapsed = time.time() - start
+        mistaken = sum(1 for digest in strangers if digest in seen)
+        results[label + '_checks_per_sec'] = per_second(len(new_voters), elapsed)
+        results[label + '_false_positive_rate'] = float(mistaken) / len(strangers)
+        if hasattr(seen, 'memory'):
+            results[label + '_memory_kb'] = seen.memory // 1024
+
+    poll = Poll.objects.create(question='guarded poll', pub_date=timezone.now())
+    choice = Choice.objects.create(poll=poll, choice='only choice')
+    url = '/poll/%d/' % (poll.id,)
+    data = {'vote': choice.id}
+    guards = [
+        ('unguarded', None),
+        ('guarded', {'KEY': 'cookie'}),
+        ('persistent_guard', {'KEY': 'cookie', 'PERSISTENT': True}),
+    ]
+    for label, config in guards:
+        with override_settings(POLLS_VOTE_GUARD=config):
+            results[label + '_new_voter_vote_ms'] = mean_ms(
+                lambda: Client().post(url, data), repeat=200
+            )
+            repeat_voter = Client()
+            repeat_voter.post(url, data)
+            results[label + '_repeat_vote_ms'] = mean_ms(
+                lambda: repeat_voter.post(url, data), repeat=200
+            )
+    return results
+
+
+@benchmark
+def rate_limits(options):
+    """
+    Bucket checks per second for each store, with 10000 clients, and the
+    latency of a vote let through against one turned away with a 429.
+    """
+    results = {}
+    clients = [
+        [('vote:client:10.0.%d.%d' % (i // 256, i % 256), 10, 60),
+         ('vote:poll:%d' % (i % 100,), 1000000, 1)]
+        for i in range(10000)
+    ]
+    stores = [
+        ('memory', MemoryBucketStore()),
+        ('cache', CacheBucketStore(get_cache(
+            'django.core.cache.backends.locmem.LocMemCache',
+            LOCATION='rate-limit-benchmark', OPTIONS={'MAX_ENTRIES': 100000},
+        ))),
+    ]
+    for label, store in stores:
+        start = time.time()
+        for limits in clients * 5:
+            store.take(limits)
+        results[label + '_checks_per_sec'] = per_second(
+            len(clients) * 5, time.time() - start
+        )
+
+    poll = Poll.objects.create(question='limited poll', pub_date=timezone.now())
+    choice = Choice.objects.create(poll=poll, choice='only choice')
+    url = '/poll/%d/' % (poll.id,)
+    repeat = 200
+    client = Client()
+    limits = {'LIMITS': {'vote': {'CLIENT': '%d/minute' % (repeat,)}}}
+    with override_settings(POLLS_RATE_LIMITS=limits):
+        results['allowed_vote_ms'] = mean_ms(
+            lambda: client.post(url, {'vote': choice.id}), repeat=repeat
+        )
+        results['rejected_vote_ms'] = mean_ms(
+            lambda: client.post(url, {'vote': choice.id}), repeat=repeat
+        )
+    return results
+
+
+@benchmark
+def search(options):
+    """
+    Full-text search at ``--search-polls`` polls: how long indexing them
+    all takes, then the latency of searches matching one poll, tens,
+    hundreds, thousands and every poll, of a deep page, and of the
+    icontains scan the index replaces.
+    """
+    if not create_search_index():
+        return {}
+    # the triggers index each row as it is written; for a bulk load, it's
+    # quicker to add them afterwards and fill the index in one go
+    drop_search_index()
+    num_polls = options['search_polls']
+    seed_dataset(num_polls, options['choices'], options['poll_votes'], options['seed'])
+    start = time.time()
+    create_search_index()
+    results = {'index_polls_per_sec': per_second(num_polls, time.time() - start)}
+
+    target = str(num_polls // 2)
+    searches = [
+        ('one_match', target, 1),
+        ('tens_of_matches', target[:-1], 1),
+        ('hundreds_of_matches', target[:-2], 1),
+        ('thousands_of_matches', target[:-3], 1),
+        ('every_poll', 'poll', 1),
+        ('every_poll_page_100', 'poll', 100),
+    ]
+    for label, query, page in searches:
+        results['search_%s_ms' % (label,)] = mean_ms(
+            lambda: search_polls(query, page), repeat=5
+        )
+    results['icontains_scan_ms'] = mean_ms(
+        lambda: list(Poll.objects.filter(question__icontains=target)[:page_size()]),
+        repeat=5
+    )
+    return results
+
+
+@benchmark
+def trending(options):
+    """
+    For the trending board, as the number of polls ranked grows: votes
+    recorded per second, the latency of reading the top 10, and of a
+    sync with every poll to save, against sorting the poll table by
+    votes in SQL.  Then the home page, with and without trending polls.
+    """
+    results = {}
+    rng = random.Random(options['seed'])
+    for scale in scales(options):
+        seed_polls(scale)
+        poll_ids = list(Poll.objects.values_list('id', flat=True)[:scale])
+        board = TrendingBoard(max_polls=scale)
+        # a few polls get most of the votes
+        votes = [
+            {poll_ids[int(rng.paretovariate(1)) % len(poll_ids)]: 1}
+            for _ in range(100000)
+        ]
+        start = time.time()
+        for vote in votes:
+            board.record(vote)
+        label = '%d_polls_' % (scale,)
+        results[label + 'record_per_sec'] = per_second(len(votes), time.time() - start)
+
+        board.record(dict((poll_id, 1) for poll_id in poll_ids))
+        results[label + 'top_10_ms'] = mean_ms(lambda: board.top(10), repeat=1000)
+        start = time.time()
+        board.sync()
+        results[label + 'sync_ms'] = round((time.time() - start) * 1000, 3)
+        results[label + 'order_by_votes_query_ms'] = mean_ms(
+            lambda: list(Poll.objects.order_by('-votes')[:10])
+        )
+
+    client = Client()
+    poll = Poll.objects.order_by('-id')[0]
+    choice = Choice.objects.create(poll=poll, choice='only choice')
+    for config in (None, {'SIZE': 10}):
+        with override_settings(POLLS_TRENDING=config):
+            record_vote(poll.id, choice.id)
+            label = 'trending_home_page_ms' if config else 'home_page_ms'
+            results[label] = mean_ms(lambda: client.get('/'))
+    return results
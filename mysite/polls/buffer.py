@@ -0,0 +1,272 @@
+"""
+Write-behind buffering for votes.
+
+With ``POLLS_VOTE_BUFFER`` set, ``polls.views.poll`` doesn't touch the
+database when someone votes: the vote is added to an in-process buffer,
+and the buffer is flushed as aggregated deltas, in one bulk UPDATE, once
+it holds ``BATCH_SIZE`` votes or ``FLUSH_INTERVAL`` seconds have passed::
+
+    POLLS_VOTE_BUFFER = {
+        'FLUSH_INTERVAL': 1.0,  # seconds
+        'BATCH_SIZE': 1000,     # votes
+        'SPOOL_DIR': None,      # set to journal votes to disk
+    }
+
+The buffer is flushed when the process exits normally, which includes
+``runpooled`` stopping on SIGTERM; a server that dies some other way
+loses what it had buffered.  If ``SPOOL_DIR`` is set, every vote is also
+journalled to a per-process spool file there, and ``manage.py
+drain_vote_buffer`` replays the spools left behind by processes that died
+before they could flush.  Set it wherever votes must not be lost.
+"""
+import atexit
+import glob
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.dispatch import receiver
+from django.test.signals import setting_changed
+
+from polls.services import apply_vote_deltas
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_INTERVAL = 1.0
+DEFAULT_BATCH_SIZE = 1000
+
+
+
+class MemoryVoteStore(object):
+    """Aggregates pending votes in memory, keyed by (poll_id, choice_id)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.deltas = defaultdict(int)
+        self.depth = 0
+
+    def add(self, poll_id, choice_id):
+        with self.lock:
+            self.deltas[(poll_id, choice_id)] += 1
+            self.depth += 1
+            return self.depth
+
+    def take(self):
+        """
+        Removes and returns everything pending, plus a token to pass to
+        ``commit`` once the votes are safely in the database.
+        """
+        with self.lock:
+            deltas, self.deltas = dict(self.deltas), defaultdict(int)
+            self.depth = 0
+            return deltas, None
+
+    def commit(self, token):
+        pass
+
+    def restore(self, deltas, token):
+        """Puts back votes that couldn't be flushed."""
+        with self.lock:
+            for key, count in deltas.items():
+                self.deltas[key] += count
+                self.depth += count
+
+
+
+class SpoolVoteStore(MemoryVoteStore):
+    """
+    A memory store that also journals each vote to a spool file, so that
+    votes survive a crash until ``drain_vote_buffer`` replays them.
+    """
+
+    def __init__(self, directory):
+        MemoryVoteStore.__init__(self)
+        self.directory = directory
+        self.pid = os.getpid()
+        self.path = os.path.join(directory, 'votes-%d.spool' % (self.pid,))
+        self._file = None
+        self._rotations = 0
+        self._uncommitted = []
+
+    def add(self, poll_id, choice_id):
+        with self.lock:
+            if self._file is None:
+                self._file = open(self.path, 'a', 1)
+            self._file.write('%d %d\n' % (poll_id, choice_id))
+            self.deltas[(poll_id, choice_id)] += 1
+            self.depth += 1
+            return self.depth
+
+    def take(self):
+        with self.lock:
+            deltas, self.deltas = dict(self.deltas), defaultdict(int)
+            self.depth = 0
+            if self._file is None:
+                return deltas, None
+            # move the journal aside, so new votes start a fresh one
+            self._file.close()
+            self._file = None
+            self._rotations += 1
+            flushing = '%s.%d.flushing' % (self.path, self._rotations)
+            os.rename(self.path, flushing)
+            return deltas, flushing
+
+    def commit(self, token):
+        with self.lock:
+            journals, self._uncommitted = self._uncommitted, []
+        for path in journals + ([token] if token else []):
+            os.remove(path)
+
+    def restore(self, deltas, token):
+        MemoryVoteStore.restore(self, deltas, token)
+        if token:
+            with self.lock:
+                self._uncommitted.append(token)
+
+
+
+def read_spool(path):
+    deltas = defaultdict(int)
+    with open(path) as spool:
+        for line in spool:
+            try:
+                poll_id, choice_id = [int(field) for field in line.split()]
+            except ValueError:
+                continue  # a torn write from a crash
+            deltas[(poll_id, choice_id)] += 1
+    return dict(deltas)
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+def orphaned_spools(directory):
+    """Spool files whose process has exited without flushing them."""
+    orphans = []
+    for path in glob.glob(os.path.join(directory, 'votes-*.spool*')):
+        pid = int(os.path.basename(path).split('.')[0].split('-')[1])
+        if pid != os.getpid() and not _process_alive(pid):
+            orphans.append(path)
+    return sorted(orphans)
+
+
+
+class VoteBuffer(object):
+
+    def __init__(self, store, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 batch_size=DEFAULT_BATCH_SIZE):
+        self.store = store
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.last_flush = time.time()
+        self._flush_lock = threading.Lock()
+        self._flusher = None
+        self.flushes = 0
+        self.votes_flushed = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.total_flush_seconds = 0.0
+
+    def add(self, poll_id, choice_id):
+        depth = self.store.add(poll_id, choice_id)
+        if (depth >= self.batch_size
+                or time.time() - self.last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """Writes every pending vote to the database.  Returns the count."""
+        with self._flush_lock:
+            self.last_flush = time.time()
+            deltas, token = self.store.take()
+            if not deltas:
+                return 0
+            start = time.time()
+            try:
+                applied = apply_vote_deltas(deltas)
+            except Exception:
+                self.store.restore(deltas, token)
+                raise
+            self.store.commit(token)
+            elapsed = time.time() - start
+
+            self.flushes += 1
+            self.votes_flushed += applied
+            self.last_flush_seconds = elapsed
+            self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+            self.total_flush_seconds += elapsed
+            logger.debug(
+                'flushed %d votes for %d choices in %.1fms',
+                applied, len(deltas), elapsed * 1000
+            )
+            return applied
+
+    def metrics(self):
+        return {
+            'depth': self.store.depth,
+            'flushes': self.flushes,
+            'votes_flushed': self.votes_flushed,
+            'last_flush_seconds': self.last_flush_seconds,
+            'max_flush_seconds': self.max_flush_seconds,
+            'mean_flush_seconds': (
+                self.total_flush_seconds / self.flushes if self.flushes else 0.0
+            ),
+        }
+
+    def start(self):
+        """
+        Starts a background thread that flushes every ``flush_interval``
+        seconds, so votes don't sit in the buffer when traffic goes quiet.
+        """
+        if self._flusher is not None:
+            return
+        def flush_periodically():
+            while True:
+                time.sleep(self.flush_interval)
+                try:
+                    self.flush()
+                except Exception:
+                    logger.exception('periodic vote flush failed')
+        self._flusher = threading.Thread(target=flush_periodically)
+        self._flusher.daemon = True
+        self._flusher.start()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+def get_vote_buffer():
+    """
+    The process's vote buffer, or None if ``POLLS_VOTE_BUFFER`` is unset.
+    """
+    global _buffer
+    config = getattr(settings, 'POLLS_VOTE_BUFFER', None)
+    if not config:
+        return None
+    with _buffer_lock:
+        if _buffer is None:
+            spool_dir = config.get('SPOOL_DIR')
+            store = SpoolVoteStore(spool_dir) if spool_dir else MemoryVoteStore()
+            _buffer = VoteBuffer(
+                store,
+                flush_interval=config.get('FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL),
+                batch_size=config.get('BATCH_SIZE', DEFAULT_BATCH_SIZE),
+            )
+            _buffer.start()
+            atexit.register(_buffer.flush)
+        return _buffer
+
+
+@receiver(setting_changed)
+def _reset_vote_buffer(sender, setting, **kwargs):
+    global _buffer
+    if setting == 'POLLS_VOTE_BUFFER':
+        with _buffer_lock:
+            _buffer = None
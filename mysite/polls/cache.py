@@ -0,0 +1,247 @@
+"""
+Caching for the rendered results on the poll page.
+
+Fragments are keyed by poll id plus a version number.  Each vote, and
+each edit to a poll or its choices, bumps the poll's version, so the next
+page view renders afresh while every other poll's fragment stays cached.
+Set ``POLLS_RESULTS_CACHE`` to turn it on::
+
+    POLLS_RESULTS_CACHE = {
+        'BACKEND': 'lru',       # or 'django'
+        'MAX_ENTRIES': 1000,    # for 'lru'
+        'CACHE': 'default',     # for 'django': which of settings.CACHES
+    }
+
+The 'lru' backend lives inside each process, so it only suits a single
+process deployment; 'django' shares fragments and versions through the
+cache framework (local memory by default, memcached in production).
+
+The ``(id, label)`` pairs for each poll's voting form can be cached too,
+through the cache framework, until the poll or its choices are edited::
+
+    POLLS_CHOICE_CACHE = {'CACHE': 'default', 'TIMEOUT': 3600}
+"""
+import itertools
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import get_cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.test.signals import setting_changed
+
+from polls.models import Choice, Poll
+from polls.signals import votes_recorded
+
+DEFAULT_MAX_ENTRIES = 1000
+DEFAULT_CHOICE_CACHE_TIMEOUT = 3600
+
+
+
+class ResultsCache(object):
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_render(self, poll_id, render):
+        """
+        Returns the poll's cached results fragment, or calls ``render()``
+        to make it, and caches that.
+        """
+        key = 'polls:results:%d:%s' % (poll_id, self.version(poll_id))
+        html = self.get(key)
+        if html is not None:
+            self.hits += 1
+            return html
+        self.misses += 1
+        html = render()
+        self.set(key, html)
+        return html
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+
+class LRUResultsCache(ResultsCache):
+    """An in-process cache that holds at most ``max_entries`` fragments."""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        ResultsCache.__init__(self)
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.fragments = OrderedDict()
+        self.versions = OrderedDict()
+        # versions are never reused, even by polls whose version has been
+        # evicted, so an old fragment can't come back to life
+        self._next_version = itertools.count(1)
+
+    def get(self, key):
+        with self.lock:
+            html = self.fragments.pop(key, None)
+            if html is not None:
+                self.fragments[key] = html
+            return html
+
+    def set(self, key, html):
+        with self.lock:
+            self.fragments.pop(key, None)
+            self.fragments[key] = html
+            while len(self.fragments) > self.max_entries:
+                self.fragments.popitem(last=False)
+
+    def version(self, poll_id):
+        with self.lock:
+            version = self.versions.pop(poll_id, None)
+            if version is None:
+                version = next(self._next_version)
+            self.versions[poll_id] = version
+            while len(self.versions) > self.max_entries:
+                self.versions.popitem(last=False)
+            return version
+
+    def bump(self, poll_id):
+        with self.lock:
+            self.versions.pop(poll_id, None)
+            self.versions[poll_id] = next(self._next_version)
+
+
+
+class DjangoResultsCache(ResultsCache):
+    """Keeps fragments and versions in one of ``settings.CACHES``."""
+
+    def __init__(self, alias='default'):
+        ResultsCache.__init__(self)
+        self.cache = get_cache(alias)
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, html):
+        self.cache.set(key, html)
+
+    def _version_key(self, poll_id):
+        return 'polls:results-version:%d' % (poll_id,)
+
+    def version(self, poll_id):
+        key = self._version_key(poll_id)
+        version = self.cache.get(key)
+        if version is None:
+            # start from the clock, so a version that was evicted from the
+            # cache can't collide with one used before
+            self.cache.add(key, int(time.time() * 1000000))
+            version = self.cache.get(key)
+        return version
+
+    def bump(self, poll_id):
+        try:
+            self.cache.incr(self._version_key(poll_id))
+        except ValueError:
+            pass  # no version yet, so nothing cached to invalidate
+
+
+_results_cache = None
+_results_cache_lock = threading.Lock()
+
+def get_results_cache():
+    """The configured results cache, or None if caching is off."""
+    global _results_cache
+    config = getattr(settings, 'POLLS_RESULTS_CACHE', None)
+    if not config:
+        return None
+    with _results_cache_lock:
+        if _results_cache is None:
+            if config.get('BACKEND', 'lru') == 'django':
+                _results_cache = DjangoResultsCache(config.get('CACHE', 'default'))
+            else:
+                _results_cache = LRUResultsCache(
+                    config.get('MAX_ENTRIES', DEFAULT_MAX_ENTRIES)
+                )
+        return _results_cache
+
+
+def invalidate_results(poll_id):
+    results_cache = get_results_cache()
+    if results_cache is not None:
+        results_cache.bump(poll_id)
+
+
+def _choice_cache():
+    config = getattr(settings, 'POLLS_CHOICE_CACHE', None)
+    if not config:
+        return None, None
+    return (
+        get_cache(config.get('CACHE', 'default')),
+        config.get('TIMEOUT', DEFAULT_CHOICE_CACHE_TIMEOUT),
+    )
+
+
+def _choice_key(poll_id):
+    return 'polls:choices:%d' % (int(poll_id),)
+
+
+def choice_labels(poll_id, choices=None):
+    """
+    ``(id, label)`` for each of a poll's choices, in id order.  They're
+    taken from ``choices``, if the caller has already loaded them, or
+    from the cache, or else from the database, in that order.
+    """
+    cache, timeout = _choice_cache()
+    if choices is None and cache is not None:
+        labels = cache.get(_choice_key(poll_id))
+        if labels is not None:
+            return labels
+    if choices is None:
+        labels = list(
+            Choice.objects.filter(poll=poll_id).order_by('id')
+            .values_list('id', 'choice')
+        )
+    else:
+        labels = [(choice.id, choice.choice) for choice in choices]
+    if cache is not None:
+        cache.set(_choice_key(poll_id), labels, timeout)
+    return labels
+
+
+def cached_choice_labels(poll_id):
+    """A poll's choice labels, or None if ``POLLS_CHOICE_CACHE`` is off."""
+    if _choice_cache()[0] is None:
+        return None
+    return choice_labels(poll_id)
+
+
+def forget_choice_labels(poll_id):
+    cache, _ = _choice_cache()
+    if cache is not None:
+        cache.delete(_choice_key(poll_id))
+
+
+@receiver(votes_recorded)
+def _invalidate_on_votes(sender, deltas, **kwargs):
+    for poll_id in set(poll_id for poll_id, _ in deltas):
+        invalidate_results(poll_id)
+
+
+@receiver(post_save, sender=Poll)
+@receiver(post_delete, sender=Poll)
+def _invalidate_on_poll_change(sender, instance, **kwargs):
+    invalidate_results(instance.pk)
+    forget_choice_labels(instance.pk)
+
+
+@receiver(post_save, sender=Choice)
+@receiver(post_delete, sender=Choice)
+def _invalidate_on_choice_change(sender, instance, **kwargs):
+    invalidate_results(instance.poll_id)
+    forget_choice_labels(instance.poll_id)
+
+
+@receiver(setting_changed)
+def _reset_results_cache(sender, setting, **kwargs):
+    global _results_cache
+    if setting == 'POLLS_RESULTS_CACHE':
+        with _results_cache_lock:
+            _results_cache = None
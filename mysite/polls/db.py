@@ -0,0 +1,218 @@
+"""
+Database tuning for production: SQLite pragmas, persistent connections
+and read replicas.  ``mysite/settings_production.py`` turns it all on::
+
+    POLLS_DATABASE = {
+        # run on every new SQLite connection
+        'PRAGMAS': (('journal_mode', 'WAL'), ('busy_timeout', 5000)),
+        # keep connections open between requests, for up to MAX_AGE seconds
+        'PERSISTENT': True,
+        'MAX_AGE': 600,
+        # database aliases that ReplicaRouter may send reads to
+        'REPLICAS': ('replica',),
+    }
+
+``ReplicaRouter`` sends everything to the primary, except reads made by
+views wrapped in ``reads_from_replica``, and only for GET and HEAD.  Those
+are the home page and the JSON API's reads; they can lag the primary by
+however often the replicas are brought up to date.  The poll page stays
+on the primary, as its results cache is invalidated by votes and would
+otherwise keep results rendered from a replica that hadn't caught up.
+
+SQLite has no replication, so a second database file stands in for a
+replica: ``manage.py sync_replicas`` copies the primary into it, in one
+transaction, which readers of the replica never see half done.
+"""
+import functools
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, close_connection, connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.test.signals import setting_changed
+
+DEFAULT_MAX_AGE = 600
+
+_local = threading.local()
+
+
+def _config():
+    return getattr(settings, 'POLLS_DATABASE', {})
+
+
+def replica_aliases():
+    return tuple(_config().get('REPLICAS', ()))
+
+
+@receiver(connection_created)
+def _tune_connection(sender, connection, **kwargs):
+    connection.opened_at = time.time()
+    pragmas = _config().get('PRAGMAS', ())
+    if connection.vendor != 'sqlite' or not pragmas:
+        return
+    # straight to sqlite, so they don't show up in the query log
+    cursor = connection.connection.cursor()
+    for name, value in pragmas:
+        cursor.execute('PRAGMA %s = %s' % (name, value))
+
+
+
+def _recycle_connections(**kwargs):
+    """
+    Instead of closing every connection at the end of each request, only
+    closes those older than ``MAX_AGE`` or in a bad state.  The others
+    are rolled back, so no transaction outlives its request.
+    """
+    max_age = _config().get('MAX_AGE', DEFAULT_MAX_AGE)
+    for connection in connections.all():
+        if connection.connection is None:
+            continue
+        if time.time() - getattr(connection, 'opened_at', 0) > max_age:
+            connection.close()
+            continue
+        try:
+            connection._rollback()
+        except DatabaseError:
+            connection.close()
+
+
+def _configure_persistence():
+    if _config().get('PERSISTENT'):
+        request_finished.disconnect(close_connection)
+        request_finished.connect(_recycle_connections)
+    else:
+        request_finished.disconnect(_recycle_connections)
+        request_finished.connect(close_connection)
+
+_configure_persistence()
+
+
+@receiver(setting_changed)
+def _reconfigure_persistence(sender, setting, **kwargs):
+    if setting == 'POLLS_DATABASE':
+        _configure_persistence()
+
+
+
+@contextmanager
+def replica_reads():
+    """Lets ReplicaRouter send the reads made inside it to a replica."""
+    old, _local.replica_reads = getattr(_local, 'replica_reads', False), True
+    try:
+        yield
+    finally:
+        _local.replica_reads = old
+
+
+def reads_from_replica(view):
+    """Runs the view under ``replica_reads`` for GET and HEAD requests."""
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return view(request, *args, **kwargs)
+        with replica_reads():
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+
+class ReplicaRouter(object):
+
+    def db_for_read(self, model, **hints):
+        replicas = replica_aliases()
+        if replicas and getattr(_local, 'replica_reads', False):
+            return random.choice(replicas)
+        # rather than None, which would follow an instance that came
+        # from a replica back to it
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replicas hold the same rows as the primary
+        databases = (DEFAULT_DB_ALIAS,) + replica_aliases()
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_syncdb(self, db, model):
+        # sync_replicas copies the tables along with the rows
+        if db in replica_aliases():
+            return False
+        return None
+
+
+
+def sync_sqlite_replica(primary_path, replica_path):
+    """
+    Makes the SQLite database at ``replica_path`` a copy of the one at
+    ``primary_path``, creating any tables it lacks, in one transaction.
+    Writers to the primary aren't held up, and readers of the replica see
+    either the old copy or the new one.  Returns the number of rows copied.
+    """
+    # isolation_level=None, so that the module doesn't commit for us
+    # before the CREATE TABLEs
+    db = sqlite3.connect(replica_path, isolation_level=None)
+    try:
+        db.execute('PRAGMA journal_mode = WAL')
+        db.execute('ATTACH DATABASE ? AS source', (primary_path,))
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            copied = _copy_tables(db)
+        except Exception:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+        return copied
+    finally:
+        db.close()
+
+
+def _copy_tables(db):
+    def names(schema, kind):
+        return set(name for (name,) in db.execute(
+            'SELECT name FROM %s.sqlite_master WHERE type = ?' % (schema,), (kind,)
+        ))
+
+    schema = db.execute(
+        "SELECT type, name, sql FROM source.sqlite_master"
+        " WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%' ORDER BY rowid"
+    ).fetchall()
+    for kind in ('table', 'index'):
+        for row_kind, name, sql in schema:
+            # looked up each time, as a virtual table makes tables of its own
+            if row_kind == kind and name not in names('main', kind):
+                db.execute(sql)
+
+    copied = 0
+    for kind, name, sql in schema:
+        # virtual tables are copied through the tables behind them
+        if kind != 'table' or sql.upper().startswith('CREATE VIRTUAL'):
+            continue
+        quoted = '"%s"' % (name.replace('"', '""'),)
+        db.execute('DELETE FROM main.%s' % (quoted,))
+        copied += db.execute(
+            'INSERT INTO main.%s SELECT * FROM source.%s' % (quoted, quoted)
+        ).rowcount
+    return copied
+
+
+def sync_replicas():
+    """Brings each SQLite replica up to date with the primary."""
+    primary = connections[DEFAULT_DB_ALIAS]
+    copied = {}
+    for alias in replica_aliases():
+        replica = connections[alias]
+        if primary.vendor != 'sqlite' or replica.vendor != 'sqlite':
+            raise ValueError('Only SQLite replicas can be synced: %s' % (alias,))
+        copied[alias] = sync_sqlite_replica(
+            primary.settings_dict['NAME'], replica.settings_dict['NAME']
+        )
+    return copied
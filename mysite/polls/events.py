@@ -0,0 +1,258 @@
+"""
+Live results for the poll page, as Server-Sent Events.
+
+With ``POLLS_EVENTS`` set, the poll page keeps its results up to date from
+``/poll/<id>/events/``, which sends a ``snapshot`` event with the poll's
+results, then a compact ``votes`` event whenever votes land on it::
+
+    event: votes
+    data: {"total": 3, "choices": {"12": 2, "14": 1}}
+
+The counts in a ``votes`` event are increments on what the client has
+already been sent.  No client ever queries the database after its
+snapshot.  Votes are published, from the ``votes_recorded`` signal, to
+one channel per poll, shared by everyone watching that poll.  A channel
+keeps running totals since it opened, and each stream sends the
+difference from what it last sent.  A slow client therefore just gets
+bigger increments, less often; nothing queues up for it.
+
+Settings::
+
+    POLLS_EVENTS = {
+        'MAX_CONNECTIONS': 4,    # per process; beyond it, 503
+        'KEEPALIVE': 15,         # seconds between keepalive comments
+        'MAX_AGE': 300,          # seconds before a stream ends
+    }
+
+Browsers reconnect when a stream ends, and start again from a fresh
+snapshot, which also corrects any vote counted twice because it landed
+while a snapshot was being taken.  Each open stream holds a server thread,
+so keep ``MAX_CONNECTIONS`` below ``runpooled --workers``; the default is
+half of runpooled's default.  Votes are only published within the
+process that recorded them.
+"""
+import json
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.dispatch import receiver
+from django.http import Http404, HttpResponse
+from django.test.signals import setting_changed
+
+from polls.api import _poll_id, results_for
+from polls.server import DEFAULT_WORKERS
+from polls.signals import votes_recorded
+
+# leaving the other workers for ordinary requests
+DEFAULT_MAX_CONNECTIONS = DEFAULT_WORKERS // 2
+DEFAULT_KEEPALIVE = 15
+DEFAULT_MAX_AGE = 300
+
+RECONNECT_MS = 2000
+
+
+class TooManyConnections(Exception):
+    pass
+
+
+
+class PollChannel(object):
+    """Running vote totals for one poll, since the channel opened."""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.version = 0
+        self.totals = defaultdict(int)
+        self.subscribers = 0
+
+    def publish(self, choice_deltas):
+        with self.condition:
+            for choice_id, count in choice_deltas.items():
+                self.totals[choice_id] += count
+            self.version += 1
+            self.condition.notify_all()
+
+    def current(self):
+        with self.condition:
+            return self.version, dict(self.totals)
+
+    def wait(self, version, timeout):
+        """
+        Waits up to ``timeout`` seconds for a version newer than
+        ``version``, and returns ``(version, totals)`` as they then are.
+        """
+        with self.condition:
+            if self.version == version:
+                self.condition.wait(timeout)
+            return self.version, dict(self.totals)
+
+
+
+class EventHub(object):
+
+    def __init__(self, max_connections=DEFAULT_MAX_CONNECTIONS):
+        self.max_connections = max_connections
+        self.lock = threading.Lock()
+        self.channels = {}
+        self.connections = 0
+
+    def subscribe(self, poll_id):
+        with self.lock:
+            if self.connections >= self.max_connections:
+                raise TooManyConnections
+            channel = self.channels.get(poll_id)
+            if channel is None:
+                channel = self.channels[poll_id] = PollChannel()
+            channel.subscribers += 1
+            self.connections += 1
+            return channel
+
+    def unsubscribe(self, poll_id):
+        with self.lock:
+            channel = self.channels[poll_id]
+            channel.subscribers -= 1
+            self.connections -= 1
+            if not channel.subscribers:
+                del self.channels[poll_id]
+
+    def publish(self, deltas):
+        by_poll = defaultdict(dict)
+        for (poll_id, choice_id), count in deltas.items():
+            by_poll[poll_id][choice_id] = count
+        with self.lock:
+            channels = [
+                (self.channels[poll_id], choice_deltas)
+                for poll_id, choice_deltas in by_poll.items()
+                if poll_id in self.channels
+            ]
+        for channel, choice_deltas in channels:
+            channel.publish(choice_deltas)
+
+    def stats(self):
+        with self.lock:
+            return {'connections': self.connections, 'channels': len(self.channels)}
+
+
+_hub = None
+_hub_lock = threading.Lock()
+
+def _config():
+    return getattr(settings, 'POLLS_EVENTS', None) or {}
+
+
+def events_enabled():
+    return bool(getattr(settings, 'POLLS_EVENTS', None))
+
+
+def get_event_hub():
+    global _hub
+    with _hub_lock:
+        if _hub is None:
+            _hub = EventHub(
+                _config().get('MAX_CONNECTIONS', DEFAULT_MAX_CONNECTIONS)
+            )
+        return _hub
+
+
+@receiver(votes_recorded)
+def _publish_votes(sender, deltas, **kwargs):
+    if _hub is not None:
+        _hub.publish(deltas)
+
+
+@receiver(setting_changed)
+def _reset_event_hub(sender, setting, **kwargs):
+    global _hub
+    if setting == 'POLLS_EVENTS':
+        with _hub_lock:
+            _hub = None
+
+
+
+def format_event(event, data):
+    return 'event: %s\ndata: %s\n\n' % (
+        event, json.dumps(data, cls=DjangoJSONEncoder)
+    )
+
+
+class EventStream(object):
+    """
+    The body of an event stream response.  WSGI servers call ``close``
+    when the client goes away, or when the stream ends, which gives the
+    subscription back even if the stream was never read.
+    """
+
+    def __init__(self, hub, poll_id, keepalive=DEFAULT_KEEPALIVE,
+                 max_age=DEFAULT_MAX_AGE):
+        self.hub = hub
+        self.poll_id = poll_id
+        self.keepalive = keepalive
+        self.max_age = max_age
+        self.channel = hub.subscribe(poll_id)
+        self.closed = False
+        try:
+            # taken before the snapshot, so a vote that lands in between
+            # is sent twice rather than not at all
+            self.version, self.sent = self.channel.current()
+            results = results_for([poll_id])
+        except Exception:
+            self.close()
+            raise
+        if not results:
+            self.close()
+            raise Http404
+        self.snapshot = results[0]
+
+    def __iter__(self):
+        yield 'retry: %d\n\n' % (RECONNECT_MS,)
+        yield format_event('snapshot', self.snapshot)
+        deadline = time.time() + self.max_age
+        while not self.closed:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            version, totals = self.channel.wait(
+                self.version, min(self.keepalive, remaining)
+            )
+            if version == self.version:
+                yield ': keepalive\n\n'
+                continue
+            choices = dict(
+                (str(choice_id), count - self.sent.get(choice_id, 0))
+                for choice_id, count in totals.items()
+                if count != self.sent.get(choice_id, 0)
+            )
+            self.version, self.sent = version, totals
+            yield format_event(
+                'votes', {'total': sum(choices.values()), 'choices': choices}
+            )
+        self.close()
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.hub.unsubscribe(self.poll_id)
+
+
+def poll_events(request, poll_id):
+    if not events_enabled():
+        raise Http404
+    config = _config()
+    try:
+        stream = EventStream(
+            get_event_hub(), _poll_id(poll_id),
+            keepalive=config.get('KEEPALIVE', DEFAULT_KEEPALIVE),
+            max_age=config.get('MAX_AGE', DEFAULT_MAX_AGE),
+        )
+    except TooManyConnections:
+        response = HttpResponse(
+            'Too many open event streams', status=503, content_type='text/plain'
+        )
+        response['Retry-After'] = str(RECONNECT_MS // 1000)
+        return response
+    response = HttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    return response
@@ -0,0 +1,95 @@
+"""
+Streaming exports of every poll, with its choices, votes and percentages.
+
+Polls are read a chunk at a time, by primary key, with their choices and
+vote totals fetched for each chunk the same way the results API does.
+So an export holds one chunk in memory however many polls there are, and
+its rows can be written out as they are made.
+"""
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from polls.api import results_for
+from polls.models import Poll
+
+EXPORT_CHUNK_SIZE = 500
+
+CSV_COLUMNS = (
+    'poll_id', 'question', 'pub_date', 'poll_votes',
+    'choice_id', 'choice', 'votes', 'percentage',
+)
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def iter_poll_results(queryset=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yields each poll in ``queryset`` as a results dict, like the JSON API's,
+    in id order, with three queries per ``chunk_size`` polls.
+    """
+    if queryset is None:
+        queryset = Poll.objects.all()
+    last_id = 0
+    while True:
+        ids = list(
+            queryset.filter(pk__gt=last_id).order_by('id')
+            .values_list('id', flat=True)[:chunk_size]
+        )
+        if not ids:
+            return
+        for poll in results_for(ids):
+            yield poll
+        last_id = ids[-1]
+
+
+
+class _Line(object):
+    """A file-like object that hands back what's written to it."""
+
+    def write(self, value):
+        return value
+
+
+def _encode(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+
+def csv_lines(polls):
+    """One CSV line per choice, or per poll for polls with no choices."""
+    writer = csv.writer(_Line())
+    yield writer.writerow(CSV_COLUMNS)
+    for poll in polls:
+        poll_fields = [
+            poll['id'], _encode(poll['question']),
+            poll['pub_date'].isoformat(), poll['votes'],
+        ]
+        if not poll['choices']:
+            yield writer.writerow(poll_fields + ['', '', '', ''])
+        for choice in poll['choices']:
+            yield writer.writerow(poll_fields + [
+                choice['id'], _encode(choice['choice']),
+                choice['votes'], '%.2f' % (choice['percentage'],),
+            ])
+
+
+def ndjson_lines(polls):
+    """One JSON document per poll, with its choices, per line."""
+    for poll in polls:
+        yield json.dumps(poll, cls=DjangoJSONEncoder) + '\n'
+
+
+FORMATS = {
+    'csv': csv_lines,
+    'ndjson': ndjson_lines,
+}
+
+
+def export_lines(format, queryset=None, chunk_size=EXPORT_CHUNK_SIZE):
+    return FORMATS[format](iter_poll_results(queryset, chunk_size))
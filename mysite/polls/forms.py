@@ -1,8 +1,22 @@
 from django import forms
+from polls.cache import choice_labels
 
 class PollVoteForm(forms.Form):
     vote = forms.ChoiceField(widget=forms.RadioSelect())
 
-    def __init__(self, poll):
-        forms.Form.__init__(self)
-        self.fields['vote'].choices = [(c.id, c.choice) for c in poll.choice_set.all()]
+    def __init__(self, poll=None, choices=None, data=None):
+        """
+        ``choices`` can be the poll's Choices, if they're already loaded,
+        or ``(id, label)`` pairs; otherwise they come from the cache or
+        the database.  Either way, validating a vote needs no queries.
+        """
+        forms.Form.__init__(self, data)
+        if choices is None:
+            choices = choice_labels(poll.id)
+        self.fields['vote'].choices = [
+            choice if isinstance(choice, tuple) else (choice.id, choice.choice)
+            for choice in choices
+        ]
+
+    def clean_vote(self):
+        return int(self.cleaned_data['vote'])
@@ -0,0 +1,316 @@
+"""
+Duplicate-vote suppression.
+
+With ``POLLS_VOTE_GUARD`` set, ``polls.views.poll`` lets each voter vote
+once per poll, and turns later votes away with a 403 before anything is
+written::
+
+    POLLS_VOTE_GUARD = {
+        'KEY': 'cookie',      # or 'session' or 'ip': who counts as a voter
+        'BACKEND': 'bloom',   # or 'lru'
+        # for 'bloom': voters remembered per generation, and how often a
+        # new voter may be mistaken for a repeat one.  Give MEMORY (bytes)
+        # instead of CAPACITY to size the filters by memory.
+        'CAPACITY': 1000000,
+        'ERROR_RATE': 0.001,
+        # for 'lru': at most MAX_ENTRIES voters, each for TTL seconds
+        'MAX_ENTRIES': 100000,
+        'TTL': 86400,
+        # seconds before a Bloom filter generation is retired
+        'ROTATE': 86400,
+        # also keep a VoteRecord row per voter, for exact enforcement
+        'PERSISTENT': False,
+    }
+
+Both backends are bounded in memory.  The Bloom filter remembers far more
+voters in the same space, but it rotates: voters are remembered for one
+to two generations, and a generation ends after ``ROTATE`` seconds or
+``CAPACITY`` voters, whichever comes first.  It can also mistake a new
+voter for a repeat one, at about ``ERROR_RATE``; the LRU set never does,
+but forgets the least recent voters once it is full.
+
+Either way the guard lives in the process.  With ``PERSISTENT`` on, every
+admitted vote also claims a unique ``VoteRecord`` row, which catches
+repeats across processes and after the memory has forgotten them, and a
+voter that a Bloom filter thinks it has seen is looked up in the table
+before being turned away.
+
+Voters are keyed by a signed ``polls_voter`` cookie, handed out with the
+poll page, by session, or by IP address.  Votes without the cookie, or
+with one that wasn't ours, from clients that drop it, never loaded the
+page or made one up, are keyed by IP address instead, as ``'session'``
+does for those without a session.  None of them
+stop a determined ballot-stuffer, but they make it cost more than a loop
+of POSTs.
+"""
+import hashlib
+import math
+import struct
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.dispatch import receiver
+from django.test.signals import setting_changed
+
+from polls.models import VoteRecord
+
+DEFAULT_CAPACITY = 1000000
+DEFAULT_ERROR_RATE = 0.001
+DEFAULT_MAX_ENTRIES = 100000
+DEFAULT_TTL = 24 * 60 * 60
+DEFAULT_ROTATE = 24 * 60 * 60
+
+VOTER_COOKIE = 'polls_voter'
+VOTER_COOKIE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+
+class BloomFilter(object):
+    """A fixed-size set of ``num_bits`` bits, ``num_hashes`` per item."""
+
+    def __init__(self, num_bits, num_hashes):
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.bits = bytearray((num_bits + 7) // 8)
+        self.count = 0
+
+    @classmethod
+    def for_capacity(cls, capacity, error_rate):
+        """The smallest filter that holds ``capacity`` items at ``error_rate``."""
+        num_bits = int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        return cls(num_bits, max(int(round(float(num_bits) / capacity * math.log(2))), 1))
+
+    def _positions(self, digest):
+        # enhanced double hashing: k positions from the two halves of one
+        # digest.  The step grows each time, so a step that is a multiple
+        # of num_bits doesn't land every position on the same bit.
+        num_bits = self.num_bits
+        first, second = struct.unpack('<QQ', digest[:16])
+        position, step = first % num_bits, second % num_bits
+        positions = []
+        for i in range(self.num_hashes):
+            positions.append(position)
+            position = (position + step) % num_bits
+            step = (step + i + 1) % num_bits
+        return positions
+
+    def __contains__(self, digest):
+        bits = self.bits
+        return all(
+            bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(digest)
+        )
+
+    def add(self, digest):
+        bits = self.bits
+        for position in self._positions(digest):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+
+
+def capacity_for_memory(memory, error_rate):
+    """How many items each of a RotatingBloomFilter's two filters can hold."""
+    num_bits = memory * 8 // 2
+    return max(int(num_bits * math.log(2) ** 2 / -math.log(error_rate)), 1)
+
+
+class RotatingBloomFilter(object):
+    """
+    Two Bloom filters, the current one and the one before, each sized
+    for half the error rate so that checking both stays within it.  The
+    current one is retired after ``rotate`` seconds or ``capacity`` items.
+    """
+    exact = False
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, error_rate=DEFAULT_ERROR_RATE,
+                 rotate=DEFAULT_ROTATE):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.rotate = rotate
+        self.lock = threading.Lock()
+        self.previous = self._new_filter()
+        self.current = self._new_filter()
+        self.started = time.time()
+
+    def _new_filter(self):
+        return BloomFilter.for_capacity(self.capacity, self.error_rate / 2)
+
+    @property
+    def memory(self):
+        return len(self.current.bits) + len(self.previous.bits)
+
+    def __contains__(self, digest):
+        return digest in self.current or digest in self.previous
+
+    def check_and_add(self, digest):
+        """True if ``digest`` has probably been added before; adds it if not."""
+        with self.lock:
+            if digest in self:
+                return True
+            if (self.current.count >= self.capacity
+                    or time.time() - self.started >= self.rotate):
+                self.previous, self.current = self.current, self._new_filter()
+                self.started = time.time()
+            self.current.add(digest)
+            return False
+
+    def discard(self, digest):
+        pass  # Bloom filters can't forget
+
+
+
+class LRUSet(object):
+    """The ``max_entries`` most recently added items, each for ``ttl`` seconds."""
+    exact = True
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.expiries = OrderedDict()
+
+    def __contains__(self, digest):
+        expires = self.expiries.get(digest)
+        return expires is not None and expires > time.time()
+
+    def check_and_add(self, digest):
+        now = time.time()
+        with self.lock:
+            if digest in self:
+                return True
+            self.expiries.pop(digest, None)
+            self.expiries[digest] = now + self.ttl
+            while len(self.expiries) > self.max_entries:
+                self.expiries.popitem(last=False)
+            return False
+
+    def discard(self, digest):
+        with self.lock:
+            self.expiries.pop(digest, None)
+
+
+
+def voter_digest(poll_id, voter):
+    return hashlib.md5((u'%d:%s' % (poll_id, voter)).encode('utf-8')).digest()
+
+
+def _voter_cookie(request):
+    """The voter id in the request's cookie, if it's one we signed."""
+    return request.get_signed_cookie(
+        VOTER_COOKIE, default=None, max_age=VOTER_COOKIE_MAX_AGE
+    )
+
+
+def voter_id(request, key):
+    """Who ``request`` is from, told apart by ``key``."""
+    if key == 'cookie':
+        voter = _voter_cookie(request)
+        if voter:
+            return 'cookie:' + voter
+    elif key == 'session':
+        session = getattr(request, 'session', None)
+        if session is not None and session.session_key:
+            return 'session:' + session.session_key
+    return 'ip:' + request.META.get('REMOTE_ADDR', '')
+
+
+def set_voter_cookie(request, response, key):
+    """
+    With ``key`` 'cookie', hands a voter id to a visitor without one, so
+    it's in place by the time they vote.
+    """
+    if key == 'cookie' and not _voter_cookie(request):
+        response.set_signed_cookie(
+            VOTER_COOKIE, uuid.uuid4().hex, max_age=VOTER_COOKIE_MAX_AGE
+        )
+
+
+class VoteGuard(object):
+
+    def __init__(self, seen, key='cookie', persistent=False):
+        self.seen = seen
+        self.key = key
+        self.persistent = persistent
+        self.refused = 0
+
+    def admit(self, poll_id, voter):
+        """
+        True if ``voter`` hasn't voted on the poll, and is now recorded as
+        having done so.
+        """
+        digest = voter_digest(poll_id, voter)
+        if self.seen.check_and_add(digest):
+            if (not self.persistent or self.seen.exact
+                    or VoteRecord.objects.filter(
+                        poll=poll_id, voter=digest.encode('hex')).exists()):
+                self.refused += 1
+                return False
+        if self.persistent and not _claim(poll_id, digest.encode('hex')):
+            self.refused += 1
+            return False
+        return True
+
+    def release(self, poll_id, voter):
+        """Forgets a voter whose vote didn't count after all, where it can."""
+        digest = voter_digest(poll_id, voter)
+        self.seen.discard(digest)
+        if self.persistent:
+            VoteRecord.objects.filter(poll=poll_id, voter=digest.encode('hex')).delete()
+
+
+def _claim(poll_id, voter):
+    try:
+        _insert_vote_record(poll_id, voter)
+    except IntegrityError:
+        return False
+    return True
+
+
+@transaction.commit_on_success
+def _insert_vote_record(poll_id, voter):
+    VoteRecord.objects.create(poll_id=poll_id, voter=voter)
+
+
+
+_guard = None
+_guard_lock = threading.Lock()
+
+def get_vote_guard():
+    """The process's vote guard, or None if ``POLLS_VOTE_GUARD`` is unset."""
+    global _guard
+    config = getattr(settings, 'POLLS_VOTE_GUARD', None)
+    if not config:
+        return None
+    with _guard_lock:
+        if _guard is None:
+            if config.get('BACKEND', 'bloom') == 'lru':
+                seen = LRUSet(
+                    config.get('MAX_ENTRIES', DEFAULT_MAX_ENTRIES),
+                    config.get('TTL', DEFAULT_TTL),
+                )
+            else:
+                error_rate = config.get('ERROR_RATE', DEFAULT_ERROR_RATE)
+                if 'MEMORY' in config:
+                    capacity = capacity_for_memory(config['MEMORY'], error_rate / 2)
+                else:
+                    capacity = config.get('CAPACITY', DEFAULT_CAPACITY)
+                seen = RotatingBloomFilter(
+                    capacity, error_rate, config.get('ROTATE', DEFAULT_ROTATE)
+                )
+            _guard = VoteGuard(
+                seen, config.get('KEY', 'cookie'), config.get('PERSISTENT', False)
+            )
+        return _guard
+
+
+@receiver(setting_changed)
+def _reset_vote_guard(sender, setting, **kwargs):
+    global _guard
+    if setting == 'POLLS_VOTE_GUARD':
+        with _guard_lock:
+            _guard = None
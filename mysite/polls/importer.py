@@ -0,0 +1,284 @@
+"""
+Bulk imports of polls and their choices.
+
+Each record is a poll::
+
+    {"question": "...", "pub_date": "2012-06-01T09:00:00Z",
+     "choices": ["Yes", {"choice": "No", "votes": 3}]}
+
+``pub_date`` defaults to now, and a choice can be a plain string or carry
+a starting vote count.  Records are read as a stream from NDJSON (one per
+line), a JSON array, or CSV with ``question``, ``pub_date``, ``choice`` and
+``votes`` columns, where consecutive rows for the same question and date
+make up one poll, so ``export_polls`` output can be imported again.
+
+Polls and choices go in with ``bulk_create``, a batch of polls per
+transaction.  A record that doesn't make a valid poll is passed to the
+``reject`` callback with the reason, and the import carries on; so is a
+CSV row that isn't UTF-8, on its own.
+"""
+import csv
+import json
+import time
+
+from django.core.management.color import no_style
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from polls.models import Choice, Poll
+
+DEFAULT_BATCH_SIZE = 1000
+
+# keep each INSERT under sqlite's 999 parameter limit
+POLL_INSERT_SIZE = 150
+CHOICE_INSERT_SIZE = 200
+
+# the most an integer column holds, for a choice or a poll's total
+MAX_VOTES = 2 ** 31 - 1
+
+# times to retry a batch whose ids were taken by a concurrent insert
+ID_RETRIES = 3
+
+READ_SIZE = 64 * 1024
+
+
+class InvalidRecord(ValueError):
+    pass
+
+
+class MalformedInput(ValueError):
+    """Input that can't be read any further, as opposed to one bad record."""
+
+
+
+def read_ndjson(lines):
+    """Yields ``(line number, record or InvalidRecord)``."""
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError as e:
+            yield number, InvalidRecord('bad JSON: %s' % (e,))
+
+
+def read_json_array(stream):
+    """
+    Yields ``(index, record)`` for each item of a top-level JSON array,
+    decoding them one at a time as the stream is read.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    index = 0
+    eof = False
+    while True:
+        # skip whitespace and separators, reading more as they run out
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position < len(buffer) or eof:
+                break
+            chunk = stream.read(READ_SIZE)
+            buffer, position, eof = buffer[position:] + chunk, 0, not chunk
+        if position >= len(buffer):
+            raise MalformedInput('unterminated JSON array')
+        if not started:
+            if buffer[position] != '[':
+                raise MalformedInput('expected a JSON array')
+            started = True
+            position += 1
+            continue
+        if buffer[position] == ']':
+            return
+        try:
+            record, end = decoder.raw_decode(buffer, position)
+        except ValueError:
+            if eof:
+                raise MalformedInput('bad JSON after item %d' % (index,))
+            # probably half an item: read more and try again
+            chunk = stream.read(READ_SIZE)
+            buffer, position, eof = buffer[position:] + chunk, 0, not chunk
+            continue
+        index += 1
+        yield index, record
+        position = end
+
+
+def read_csv(lines):
+    """
+    Yields ``(line number, record)``, a record per run of rows for the
+    same question and pub_date.
+    """
+    rows = csv.DictReader(lines)
+    if not set(['question', 'choice']).issubset(rows.fieldnames or []):
+        raise MalformedInput('CSV needs question and choice columns')
+    record, record_line, key = None, None, None
+    for row in rows:
+        number = rows.line_num
+        if None in row or None in row.values():
+            yield number, InvalidRecord('wrong number of columns')
+            continue
+        try:
+            question = row['question'].decode('utf-8')
+            choice = row['choice'].decode('utf-8')
+        except UnicodeDecodeError as e:
+            yield number, InvalidRecord('not UTF-8: %s' % (e,))
+            continue
+        row_key = (question, row.get('pub_date', ''))
+        if row_key != key:
+            if record is not None:
+                yield record_line, record
+            key, record_line = row_key, number
+            record = {
+                'question': question,
+                'pub_date': row.get('pub_date') or None,
+                'choices': [],
+            }
+        if choice:
+            votes = row.get('votes') or '0'
+            record['choices'].append({
+                'choice': choice,
+                'votes': int(votes) if votes.isdigit() else votes,
+            })
+    if record is not None:
+        yield record_line, record
+
+
+READERS = {
+    'ndjson': read_ndjson,
+    'json': read_json_array,
+    'csv': read_csv,
+}
+
+
+
+def _text(value, name, max_length):
+    if not isinstance(value, basestring) or not value.strip():
+        raise InvalidRecord('%s must be a non-empty string' % (name,))
+    if len(value) > max_length:
+        raise InvalidRecord('%s is longer than %d characters' % (name, max_length))
+    return value
+
+
+def build_poll(record, now):
+    """Checks a record, and returns an unsaved Poll and its Choices."""
+    if isinstance(record, InvalidRecord):
+        raise record
+    if not isinstance(record, dict):
+        raise InvalidRecord('not an object')
+    question = _text(
+        record.get('question'), 'question',
+        Poll._meta.get_field('question').max_length
+    )
+    pub_date = record.get('pub_date')
+    if pub_date is None:
+        pub_date = now
+    else:
+        try:
+            pub_date = parse_datetime(pub_date)
+        except (ValueError, TypeError):
+            pub_date = None
+        if pub_date is None:
+            raise InvalidRecord('bad pub_date: %r' % (record['pub_date'],))
+        if timezone.is_naive(pub_date):
+            pub_date = timezone.make_aware(pub_date, timezone.get_default_timezone())
+
+    choices = []
+    choice_max_length = Choice._meta.get_field('choice').max_length
+    for item in record.get('choices') or []:
+        if isinstance(item, dict):
+            text, votes = item.get('choice'), item.get('votes', 0)
+        else:
+            text, votes = item, 0
+        if (not isinstance(votes, (int, long)) or isinstance(votes, bool)
+                or not 0 <= votes <= MAX_VOTES):
+            raise InvalidRecord('bad vote count: %r' % (votes,))
+        choices.append(Choice(
+            choice=_text(text, 'choice', choice_max_length), votes=votes
+        ))
+    total = sum(choice.votes for choice in choices)
+    if total > MAX_VOTES:
+        raise InvalidRecord('too many votes in all: %d' % (total,))
+    poll = Poll(question=question, pub_date=pub_date, votes=total)
+    return poll, choices
+
+
+
+class ImportStats(object):
+
+    def __init__(self):
+        self.polls = 0
+        self.choices = 0
+        self.rejected = 0
+        self.started = time.time()
+
+    @property
+    def seconds(self):
+        return time.time() - self.started
+
+    def rows_per_second(self):
+        seconds = self.seconds
+        return (self.polls + self.choices) / seconds if seconds else 0.0
+
+
+def import_polls(records, batch_size=DEFAULT_BATCH_SIZE, reject=None):
+    """
+    Imports ``(position, record)`` pairs, as the readers yield them.
+    ``reject(position, record, reason)`` is called for each one skipped.
+    Returns an ImportStats.
+    """
+    stats = ImportStats()
+    batch = []
+    now = timezone.now()
+    for position, record in records:
+        try:
+            batch.append(build_poll(record, now))
+        except InvalidRecord as e:
+            stats.rejected += 1
+            if reject is not None:
+                reject(position, record, str(e))
+            continue
+        if len(batch) >= batch_size:
+            _insert_batch(batch, stats)
+            batch = []
+    if batch:
+        _insert_batch(batch, stats)
+    return stats
+
+
+def _insert_batch(batch, stats):
+    for attempt in range(ID_RETRIES):
+        try:
+            _insert_polls(batch)
+            break
+        except IntegrityError:
+            if attempt == ID_RETRIES - 1:
+                raise
+    stats.polls += len(batch)
+    stats.choices += sum(len(choices) for _, choices in batch)
+
+
+@transaction.commit_on_success
+def _insert_polls(batch):
+    # bulk_create can't tell us the ids it made, so we hand them out
+    # ourselves, to link each choice to its poll
+    next_poll_id = (Poll.objects.aggregate(Max('id'))['id__max'] or 0) + 1
+    polls, choices = [], []
+    for offset, (poll, poll_choices) in enumerate(batch):
+        poll.id = next_poll_id + offset
+        polls.append(poll)
+        for choice in poll_choices:
+            choice.poll_id = poll.id
+            choices.append(choice)
+    for start in range(0, len(polls), POLL_INSERT_SIZE):
+        Poll.objects.bulk_create(polls[start:start + POLL_INSERT_SIZE])
+    for start in range(0, len(choices), CHOICE_INSERT_SIZE):
+        Choice.objects.bulk_create(choices[start:start + CHOICE_INSERT_SIZE])
+    # as loaddata does, so the next poll saved doesn't reuse an id
+    cursor = connection.cursor()
+    for sql in connection.ops.sequence_reset_sql(no_style(), [Poll, Choice]):
+        cursor.execute(sql)
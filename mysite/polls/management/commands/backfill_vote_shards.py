@@ -0,0 +1,34 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from polls.models import vote_shard_count
+from polls.services import create_vote_shards, fold_vote_shards
+
+
+class Command(BaseCommand):
+    help = (
+        'Creates the counter shards for every choice, ready for '
+        'POLLS_VOTE_SHARDS.  With --fold, moves sharded votes back onto '
+        'the choices instead, so sharding can be switched off.'
+    )
+    option_list = BaseCommand.option_list + (
+        make_option('--shards', type='int', dest='shards', default=None,
+            help='Number of shards per choice (default: POLLS_VOTE_SHARDS)'),
+        make_option('--fold', action='store_true', dest='fold', default=False,
+            help='Fold all shards back into Choice.votes and delete them'),
+    )
+
+    def handle(self, *args, **options):
+        if options['fold']:
+            folded = fold_vote_shards()
+            self.stdout.write('Folded shards back into %d choices\n' % folded)
+            return
+
+        num_shards = options['shards'] or vote_shard_count()
+        if num_shards < 2:
+            raise CommandError(
+                'Set POLLS_VOTE_SHARDS (or pass --shards) to 2 or more'
+            )
+        created = create_vote_shards(num_shards)
+        self.stdout.write('Created %d vote shards\n' % created)
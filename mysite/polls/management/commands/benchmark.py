@@ -0,0 +1,98 @@
+import json
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from polls.benchmarks import BENCHMARKS, compare_results, over_budget
+
+# the options that change what is measured, saved alongside the results
+RECORDED_OPTIONS = (
+    'votes', 'threads', 'requests', 'shards', 'events', 'scales',
+    'choices', 'poll_votes', 'seed', 'search_polls',
+)
+
+
+class Command(BaseCommand):
+    args = '[benchmark ...]'
+    help = (
+        'Runs the polls benchmarks (all of them, by default) against a '
+        'throwaway copy of the database.  Available: %s'
+        % ', '.join(sorted(BENCHMARKS))
+    )
+    option_list = BaseCommand.option_list + (
+        make_option('--votes', type='int', dest='votes', default=2000,
+            help='Number of votes to cast in the write benchmarks'),
+        make_option('--threads', type='int', dest='threads', default=4,
+            help='Number of concurrent voters or HTTP clients'),
+        make_option('--requests', type='int', dest='requests', default=400,
+            help='Number of HTTP requests to make in the load tests'),
+        make_option('--shards', type='int', dest='shards', default=8,
+            help='Number of shards to compare against unsharded counters'),
+        make_option('--events', type='int', dest='events', default=10000000,
+            help='Number of synthetic vote events for the analytics benchmark'),
+        make_option('--scales', dest='scales', default='1000,10000,100000',
+            help='Comma-separated table sizes for the scaling benchmarks'),
+        make_option('--search-polls', type='int', dest='search_polls',
+            default=1000000, help='Number of polls for the search benchmark'),
+        make_option('--choices', type='int', dest='choices', default=5,
+            help='Choices per poll in the seeded data'),
+        make_option('--poll-votes', type='int', dest='poll_votes', default=100,
+            help='Mean votes per poll in the seeded data'),
+        make_option('--seed', type='int', dest='seed', default=1,
+            help='Random seed for the seeded data'),
+        make_option('--json', dest='json', default=None,
+            help='File to save the results to, as JSON'),
+        make_option('--compare', dest='compare', default=None,
+            help='Results saved by an earlier --json run to compare against'),
+        make_option('--threshold', type='float', dest='threshold', default=10.0,
+            help='Percent slower than --compare that counts as a regression'),
+    )
+
+    def handle(self, *names, **options):
+        names = names or sorted(BENCHMARKS)
+        unknown = [name for name in names if name not in BENCHMARKS]
+        if unknown:
+            raise CommandError('Unknown benchmark(s): %s' % ', '.join(unknown))
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as saved:
+                baseline = json.load(saved)['results']
+
+        # the concurrent benchmarks need a database file that each thread
+        # can open for itself, rather than sqlite's private :memory: db
+        if connection.vendor == 'sqlite':
+            connection.settings_dict['TEST_NAME'] = 'benchmark.sqlite'
+        old_name = connection.creation.create_test_db(
+                verbosity=0, autoclobber=True
+        )
+        all_results = {}
+        try:
+            for name in names:
+                self.stdout.write('%s\n' % name)
+                results = all_results[name] = BENCHMARKS[name](options)
+                for key, value in sorted(results.items()):
+                    self.stdout.write('    %-40s %s\n' % (key, value))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if options['json']:
+            with open(options['json'], 'w') as output:
+                json.dump({
+                    'options': dict(
+                        (name, options[name]) for name in RECORDED_OPTIONS
+                    ),
+                    'results': all_results,
+                }, output, indent=2, sort_keys=True)
+
+        failures = []
+        for results in all_results.values():
+            failures.extend(over_budget(results))
+        if baseline is not None:
+            failures.extend(
+                compare_results(baseline, all_results, options['threshold'])
+            )
+        if failures:
+            raise CommandError(
+                'Performance regressions:\n    %s' % '\n    '.join(failures)
+            )
@@ -0,0 +1,38 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from polls.buffer import get_vote_buffer, orphaned_spools, read_spool
+from polls.services import apply_vote_deltas
+
+
+class Command(BaseCommand):
+    help = (
+        'Flushes buffered votes to the database, including any spool files '
+        'left behind by processes that exited without flushing.'
+    )
+
+    def handle(self, *args, **options):
+        vote_buffer = get_vote_buffer()
+        if vote_buffer is None:
+            raise CommandError('POLLS_VOTE_BUFFER is not set; there is nothing to drain')
+        spool_dir = settings.POLLS_VOTE_BUFFER.get('SPOOL_DIR')
+        if not spool_dir:
+            # this process's own buffer is empty, and other processes'
+            # are out of reach
+            raise CommandError(
+                'POLLS_VOTE_BUFFER has no SPOOL_DIR, so there are no spools '
+                'to replay'
+            )
+
+        flushed = vote_buffer.flush()
+        for path in orphaned_spools(spool_dir):
+            applied = apply_vote_deltas(read_spool(path))
+            os.remove(path)
+            flushed += applied
+            self.stdout.write('Replayed %d votes from %s\n' % (applied, path))
+
+        self.stdout.write('Drained %d votes\n' % (flushed,))
+        for key, value in sorted(vote_buffer.metrics().items()):
+            self.stdout.write('    %-20s %s\n' % (key, value))
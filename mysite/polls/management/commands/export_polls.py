@@ -0,0 +1,32 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from polls.export import EXPORT_CHUNK_SIZE, FORMATS, export_lines
+
+
+class Command(BaseCommand):
+    help = (
+        'Writes every poll, with its choices, votes and percentages, as CSV '
+        'or NDJSON, a chunk of polls at a time.'
+    )
+    option_list = BaseCommand.option_list + (
+        make_option('--format', dest='format', default='csv',
+            help='csv (one row per choice) or ndjson (one line per poll)'),
+        make_option('--output', dest='output', default=None,
+            help='File to write to, rather than stdout'),
+        make_option('--chunk-size', type='int', dest='chunk_size',
+            default=EXPORT_CHUNK_SIZE, help='Polls to read per query'),
+    )
+
+    def handle(self, *args, **options):
+        if options['format'] not in FORMATS:
+            raise CommandError('Unknown format: %s' % (options['format'],))
+        lines = export_lines(options['format'], chunk_size=options['chunk_size'])
+        output = open(options['output'], 'wb') if options['output'] else self.stdout
+        try:
+            for line in lines:
+                output.write(line)
+        finally:
+            if options['output']:
+                output.close()
@@ -0,0 +1,78 @@
+import json
+import os
+import sys
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from polls.importer import (
+    DEFAULT_BATCH_SIZE, READERS, InvalidRecord, MalformedInput, import_polls
+)
+
+EXTENSIONS = {
+    '.csv': 'csv',
+    '.json': 'json',
+    '.ndjson': 'ndjson',
+    '.jsonl': 'ndjson',
+}
+
+
+class Command(BaseCommand):
+    args = '<file, or - for stdin>'
+    help = (
+        'Bulk-imports polls and choices from CSV, JSON or NDJSON, skipping '
+        'bad records into a rejects file.'
+    )
+    option_list = BaseCommand.option_list + (
+        make_option('--format', dest='format', default=None,
+            help='csv, json or ndjson (default: from the file extension)'),
+        make_option('--batch-size', type='int', dest='batch_size',
+            default=DEFAULT_BATCH_SIZE, help='Polls per transaction'),
+        make_option('--rejects', dest='rejects', default=None,
+            help='Where to write skipped records, as NDJSON '
+                 '(default: the input file name plus .rejects)'),
+    )
+
+    def handle(self, path=None, *args, **options):
+        if path is None:
+            raise CommandError('Give a file to import, or - for stdin')
+        format = options['format'] or EXTENSIONS.get(os.path.splitext(path)[1])
+        if format not in READERS:
+            raise CommandError('Use --format to say whether %s is csv, json or ndjson' % (path,))
+        rejects_path = options['rejects'] or (
+            'import_polls.rejects' if path == '-' else path + '.rejects'
+        )
+
+        stream = sys.stdin if path == '-' else open(path, 'rb')
+        # written as they're found, rather than held until the end
+        rejects_file = open(rejects_path, 'w')
+        def reject(position, record, reason):
+            if isinstance(record, InvalidRecord):
+                record = None
+            rejects_file.write(json.dumps(
+                {'position': position, 'reason': reason, 'record': record}
+            ) + '\n')
+        try:
+            stats = import_polls(
+                READERS[format](stream), batch_size=options['batch_size'],
+                reject=reject,
+            )
+        except MalformedInput as e:
+            raise CommandError('Stopped reading %s: %s' % (path, e))
+        finally:
+            if path != '-':
+                stream.close()
+            empty = rejects_file.tell() == 0
+            rejects_file.close()
+            if empty:
+                os.remove(rejects_path)
+
+        self.stdout.write(
+            'Imported %d polls and %d choices in %.1fs (%.0f rows/sec)\n' % (
+                stats.polls, stats.choices, stats.seconds, stats.rows_per_second()
+            )
+        )
+        if stats.rejected:
+            self.stdout.write(
+                'Skipped %d records; see %s\n' % (stats.rejected, rejects_path)
+            )
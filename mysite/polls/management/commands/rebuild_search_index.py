@@ -0,0 +1,28 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from polls.search import create_search_index, rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = (
+        'Creates the full-text search index over polls and their choices, '
+        'and the triggers that keep it up to date, if they are missing, '
+        'and refills it from scratch.'
+    )
+    option_list = BaseCommand.option_list + (
+        make_option('--database', dest='database', default=DEFAULT_DB_ALIAS,
+            help='The database to index'),
+    )
+
+    def handle(self, *args, **options):
+        using = options['database']
+        if not create_search_index(using):
+            raise CommandError(
+                'Full-text search needs SQLite with FTS5; searches will '
+                'scan the poll and choice tables instead.'
+            )
+        indexed = rebuild_search_index(using)
+        self.stdout.write('Indexed %d polls\n' % (indexed,))
@@ -0,0 +1,37 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from polls.models import Poll
+from polls.services import repair_poll_totals
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes every poll's stored vote total from its choices, and "
+        "reports the polls that had drifted."
+    )
+    option_list = BaseCommand.option_list + (
+        make_option('--dry-run', action='store_true', dest='dry_run',
+            default=False, help='Report drift without fixing it'),
+    )
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            drifted = Poll.objects.drifted().order_by('id').values_list(
+                    'id', 'votes', 'vote_total'
+            )
+        else:
+            drifted = repair_poll_totals()
+
+        total_drift = 0
+        for poll_id, stored, actual in drifted:
+            total_drift += abs(actual - stored)
+            self.stdout.write(
+                'Poll %d: stored total %d, actual %d\n' % (poll_id, stored, actual)
+            )
+        self.stdout.write('%d polls %s, %d votes of drift\n' % (
+            len(drifted),
+            'have drifted' if options['dry_run'] else 'repaired',
+            total_drift,
+        ))
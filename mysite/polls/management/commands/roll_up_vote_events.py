@@ -0,0 +1,25 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from polls.analytics import prune_vote_events, roll_up_vote_events
+
+
+class Command(BaseCommand):
+    help = (
+        'Compacts new vote events into per-minute, hour and day rollups, '
+        'and optionally prunes raw events past their retention period.'
+    )
+    option_list = BaseCommand.option_list + (
+        make_option('--prune', action='store_true', dest='prune',
+            default=False, help='Delete rolled-up events past retention'),
+        make_option('--retention-days', type='int', dest='retention_days',
+            default=None, help="Override POLLS_VOTE_EVENTS['RETENTION_DAYS']"),
+    )
+
+    def handle(self, *args, **options):
+        rolled = roll_up_vote_events()
+        self.stdout.write('Rolled up %d votes\n' % (rolled,))
+        if options['prune']:
+            pruned = prune_vote_events(options['retention_days'])
+            self.stdout.write('Pruned %d events\n' % (pruned,))
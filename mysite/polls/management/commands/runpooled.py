@@ -0,0 +1,49 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import get_internal_wsgi_application
+
+from polls.server import DEFAULT_WORKERS, run_pooled
+
+DEFAULT_ADDR = '127.0.0.1'
+DEFAULT_PORT = 8000
+
+
+class Command(BaseCommand):
+    args = '[optional port number, or ipaddr:port]'
+    help = (
+        'Serves the site from a bounded pool of worker threads, so requests '
+        'waiting on the database overlap instead of queueing one by one.'
+    )
+    option_list = BaseCommand.option_list + (
+        make_option('--workers', type='int', dest='workers',
+            default=DEFAULT_WORKERS,
+            help='Number of worker threads (and so database connections)'),
+        make_option('--backlog', type='int', dest='backlog', default=None,
+            help='Connections to queue for a free worker before answering '
+                 '503 (default: four per worker)'),
+    )
+
+    def handle(self, addrport='', *args, **options):
+        addr, port = DEFAULT_ADDR, DEFAULT_PORT
+        if addrport:
+            if ':' in addrport:
+                addr, _, port = addrport.rpartition(':')
+            else:
+                port = addrport
+            try:
+                port = int(port)
+            except ValueError:
+                raise CommandError('"%s" is not a valid port number' % (port,))
+
+        self.stdout.write(
+            'Serving on http://%s:%d/ with %d workers\n'
+            % (addr, port, options['workers'])
+        )
+        try:
+            run_pooled(
+                addr, port, get_internal_wsgi_application(),
+                workers=options['workers'], backlog=options['backlog'],
+            )
+        except KeyboardInterrupt:
+            pass
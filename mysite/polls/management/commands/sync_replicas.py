@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from polls.db import replica_aliases, sync_replicas
+
+
+class Command(BaseCommand):
+    help = (
+        "Copies the primary SQLite database into each of the replicas in "
+        "POLLS_DATABASE['REPLICAS'].  Run it as often as the replicas "
+        "should catch up, eg from cron."
+    )
+
+    def handle(self, *args, **options):
+        if not replica_aliases():
+            raise CommandError("No replicas in POLLS_DATABASE['REPLICAS']")
+        try:
+            copied = sync_replicas()
+        except ValueError as e:
+            raise CommandError(str(e))
+        for alias, rows in sorted(copied.items()):
+            self.stdout.write('Copied %d rows to %s\n' % (rows, alias))
@@ -1,14 +1,183 @@
-from django.db import models
+from django.conf import settings
+from django.db import connection, models
+from django.db.models import F, Sum
+from django.db.models.query import QuerySet
+from django.utils import timezone
+
+# the most an integer column holds, on every database we run on, and so
+# the bound for ids and counts that come from outside
+MAX_INTEGER = 2 ** 31 - 1
+
+
+def vote_shard_count():
+    """
+    How many counter rows each choice's votes are spread over.  Set
+    ``POLLS_VOTE_SHARDS`` to 2 or more to turn sharded counters on.
+    """
+    return getattr(settings, 'POLLS_VOTE_SHARDS', 0)
+
+
+def sharding_enabled():
+    return vote_shard_count() > 1
+
+
+
+def _column(model, field_name):
+    qn = connection.ops.quote_name
+    return '%s.%s' % (qn(model._meta.db_table), qn(field_name))
+
+
+def _shard_votes_sql(choice_id):
+    qn = connection.ops.quote_name
+    return 'COALESCE((SELECT SUM(s.%s) FROM %s s WHERE s.%s = %s), 0)' % (
+        qn('votes'), qn(ChoiceVoteShard._meta.db_table), qn('choice_id'),
+        choice_id,
+    )
+
+
+def _poll_total_sql(poll_id):
+    qn = connection.ops.quote_name
+    sql = 'COALESCE((SELECT SUM(c.%s) FROM %s c WHERE c.%s = %s), 0)' % (
+        qn('votes'), qn(Choice._meta.db_table), qn('poll_id'), poll_id,
+    )
+    if sharding_enabled():
+        sql += (
+            ' + COALESCE((SELECT SUM(s.%s) FROM %s s INNER JOIN %s c'
+            ' ON s.%s = c.%s WHERE c.%s = %s), 0)' % (
+                qn('votes'), qn(ChoiceVoteShard._meta.db_table),
+                qn(Choice._meta.db_table), qn('choice_id'), qn('id'),
+                qn('poll_id'), poll_id,
+            )
+        )
+    return sql
+
+
+
+class PollQuerySet(QuerySet):
+
+    def with_totals(self):
+        """
+        Annotates each poll with ``vote_total``, summed by the database,
+        so listing thousands of polls with their totals is one query.
+        """
+        return self.extra(select={
+            'vote_total': _poll_total_sql(_column(Poll, 'id')),
+        })
+
+    def drifted(self):
+        """
+        Polls whose stored ``votes`` total no longer matches their choices,
+        annotated with the right total as ``vote_total``.
+        """
+        return self.with_totals().extra(where=['%s != %s' % (
+            _column(Poll, 'votes'), _poll_total_sql(_column(Poll, 'id')),
+        )])
+
+
+
+class PollManager(models.Manager):
+
+    def get_query_set(self):
+        return PollQuerySet(self.model, using=self._db)
+
+    def with_totals(self):
+        return self.get_query_set().with_totals()
+
+    def drifted(self):
+        return self.get_query_set().drifted()
+
+
 
 class Poll(models.Model):
+    # indexed by sql/poll.sqlite3.sql, ignoring case, for the admin's search
     question = models.CharField(max_length=200)
-    pub_date = models.DateTimeField(verbose_name='Date published')
+    pub_date = models.DateTimeField(verbose_name='Date published', db_index=True)
+    # the poll's total, kept up to date by every vote, so that reading it
+    # costs nothing.  repair_poll_totals fixes it up if it ever drifts.
+    votes = models.IntegerField(default=0, editable=False)
+    # moved on by votes and by edits to the poll or its choices, for
+    # conditional GETs of the poll page
+    updated = models.DateTimeField(auto_now=True)
+
+    objects = PollManager()
 
     def __unicode__(self):
         return self.question
 
+    def save(self, force_insert=False, force_update=False, using=None):
+        """
+        Saves the poll, leaving its stored total as the database has it:
+        votes move that with UPDATEs of their own, which saving a poll
+        loaded before them would otherwise undo.
+        """
+        if self._state.adding or force_insert:
+            models.Model.save(self, force_insert, force_update, using)
+            return
+        votes, self.votes = self.votes, F('votes')
+        try:
+            # an UPDATE, as an F() can't be inserted
+            models.Model.save(self, force_update=True, using=using)
+        finally:
+            self.votes = votes
+
     def total_votes(self):
-        return sum(c.votes for c in self.choice_set.all())
+        if hasattr(self, 'vote_total'):
+            return self.vote_total
+        return self.votes
+
+    def results(self):
+        """
+        Fetches the poll's choices in a single query, and works out the
+        total and every percentage from them, without going back to the
+        database.
+        """
+        choices = list(self.choice_set.with_votes().order_by('id'))
+        self.vote_total = sum(c.vote_count() for c in choices)
+        for choice in choices:
+            choice._poll_cache = self
+        return choices
+
+
+
+class ChoiceQuerySet(QuerySet):
+
+    def with_votes(self):
+        """
+        Annotates the sum of each choice's shards as ``shard_votes``, if
+        sharded counters are on, so ``vote_count()`` needs no query.
+        """
+        if not sharding_enabled():
+            return self
+        return self.extra(select={
+            'shard_votes': _shard_votes_sql(_column(Choice, 'id')),
+        })
+
+    def with_percentages(self):
+        """
+        Annotates each choice's share of its poll's votes, worked out by
+        the database, as ``vote_percentage``.
+        """
+        votes = _column(Choice, 'votes')
+        if sharding_enabled():
+            votes = '(%s + %s)' % (votes, _shard_votes_sql(_column(Choice, 'id')))
+        total = _poll_total_sql(_column(Choice, 'poll_id'))
+        return self.with_votes().extra(select={
+            'vote_percentage':
+                'COALESCE(100.0 * %s / NULLIF(%s, 0), 0)' % (votes, total),
+        })
+
+
+
+class ChoiceManager(models.Manager):
+
+    def get_query_set(self):
+        return ChoiceQuerySet(self.model, using=self._db)
+
+    def with_votes(self):
+        return self.get_query_set().with_votes()
+
+    def with_percentages(self):
+        return self.get_query_set().with_percentages()
 
 
 
@@ -17,8 +186,142 @@ class Choice(models.Model):
     choice = models.CharField(max_length=200)
     votes = models.IntegerField(default=0)
 
+    objects = ChoiceManager()
+
+    def __init__(self, *args, **kwargs):
+        models.Model.__init__(self, *args, **kwargs)
+        self._saved_votes = self.votes if self.pk else 0
+
+    def save(self, *args, **kwargs):
+        """
+        Saves the choice, moves its poll's stored total by however much
+        ``votes`` has changed since the choice was loaded, and marks the
+        poll as updated.
+        """
+        models.Model.save(self, *args, **kwargs)
+        delta, self._saved_votes = self.votes - self._saved_votes, self.votes
+        Poll.objects.filter(pk=self.poll_id).update(
+                votes=F('votes') + delta, updated=timezone.now()
+        )
+        if delta and hasattr(self, '_poll_cache'):
+            self._poll_cache.votes += delta
+
+    def delete(self, *args, **kwargs):
+        votes = self.vote_count()
+        models.Model.delete(self, *args, **kwargs)
+        Poll.objects.filter(pk=self.poll_id).update(
+                votes=F('votes') - votes, updated=timezone.now()
+        )
+
+    def vote_count(self):
+        """
+        The choice's votes, including any still spread over its shards.
+        Querysets can save the extra query by annotating ``shard_votes``.
+        """
+        if not sharding_enabled():
+            return self.votes
+        if hasattr(self, 'shard_votes'):
+            return self.votes + (self.shard_votes or 0)
+        sharded = self.shards.aggregate(total=Sum('votes'))
+        return self.votes + (sharded['total'] or 0)
+
     def percentage(self):
+        if hasattr(self, 'vote_percentage'):
+            return self.vote_percentage
         try:
-            return 100.0 * self.votes / self.poll.total_votes()
+            return 100.0 * self.vote_count() / self.poll.total_votes()
         except ZeroDivisionError:
             return 0
+
+
+
+class ChoiceVoteShard(models.Model):
+    """
+    One of several counter rows for a popular choice.  Votes land on a
+    random shard, so concurrent voters don't all queue on the same row;
+    reading a choice's votes means adding its shards back together.
+    """
+    choice = models.ForeignKey(Choice, related_name='shards')
+    shard = models.IntegerField()
+    votes = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = (('choice', 'shard'),)
+
+
+
+class VoteEvent(models.Model):
+    """
+    One row per batch of votes for a choice, appended in bulk whenever
+    votes are recorded, if ``POLLS_VOTE_EVENTS`` is set.  A log, rather
+    than a relation: events outlive their polls, and there are no foreign
+    keys to check or cascade on the insert path.
+    """
+    poll_id = models.IntegerField()
+    choice_id = models.IntegerField()
+    votes = models.IntegerField()
+    # whole minutes since the epoch, which the database can group by
+    minute = models.IntegerField(db_index=True)
+
+
+class VoteRollup(models.Model):
+    """
+    Votes for a choice in one minute, hour or day, compacted from the
+    event log by ``polls.analytics.roll_up_vote_events``.
+    """
+    PERIODS = (
+        ('minute', 'Minute'),
+        ('hour', 'Hour'),
+        ('day', 'Day'),
+    )
+    poll = models.ForeignKey(Poll)
+    choice = models.ForeignKey(Choice)
+    period = models.CharField(max_length=6, choices=PERIODS)
+    start = models.DateTimeField()
+    votes = models.IntegerField(default=0)
+
+    class Meta:
+        # poll first, so a poll's time series is a range scan of this index
+        unique_together = (('poll', 'period', 'start', 'choice'),)
+
+
+class VoteRollupMark(models.Model):
+    """The last event rolled up, so each run picks up where the last ended."""
+    last_event_id = models.IntegerField(default=0)
+
+
+
+class VoteRecord(models.Model):
+    """
+    That someone has voted on a poll, for exact duplicate-vote checks
+    when ``POLLS_VOTE_GUARD['PERSISTENT']`` is on.  ``voter`` is a hash of
+    the poll and the voter's cookie, session or IP, never the raw value.
+    """
+    poll = models.ForeignKey(Poll)
+    voter = models.CharField(max_length=32)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = (('poll', 'voter'),)
+
+
+
+
+class TrendScore(models.Model):
+    """
+    A poll's trending score, saved periodically by ``polls.trending`` so
+    that every process ranks by every process's votes: the log, base 2,
+    of its votes, each weighted by how recently it came in.
+    """
+    poll = models.OneToOneField(Poll, primary_key=True)
+    score = models.FloatField(db_index=True)
+
+
+# connect the signal handlers that keep cached results up to date, that
+# log vote events, that tune database connections, that create the
+# search index, and that rank trending polls
+import polls.analytics
+import polls.cache
+import polls.db
+import polls.search
+import polls.trending
@@ -0,0 +1,175 @@
+"""
+Keyset ("cursor") pagination for polls, in (pub_date, id) order.
+
+Rather than ``OFFSET n``, which makes the database walk past every earlier
+row, each page asks for the rows either side of a cursor taken from the
+edge of the page before.  With the index on ``pub_date``, a page deep into
+the catalogue is as cheap as the first one.
+
+For the admin, which pages by number, there's ``EstimatedCountPaginator``,
+which doesn't COUNT every row of a big table just to number the pages.
+"""
+import calendar
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.db.models.query import QuerySet
+from django.utils.timezone import utc
+
+DEFAULT_PAGE_SIZE = 50
+
+# below this, an exact COUNT is cheap, and estimates are at their worst
+ESTIMATE_COUNTS_ABOVE = 10000
+
+
+def page_size():
+    return getattr(settings, 'POLLS_PAGE_SIZE', DEFAULT_PAGE_SIZE)
+
+
+def _micros(dt):
+    return calendar.timegm(dt.utctimetuple()) * 1000000 + dt.microsecond
+
+EPOCH = datetime(1970, 1, 1, tzinfo=utc)
+
+# what a cursor can hold: any datetime, and an id an integer column can
+MIN_MICROS, MAX_MICROS = _micros(datetime.min), _micros(datetime.max)
+MAX_ID = 2 ** 31 - 1
+
+
+def encode_cursor(poll):
+    """
+    The cursor for a poll, which can also be a ``values()`` row, so that
+    querysets of either kind can be paginated.
+    """
+    if isinstance(poll, dict):
+        pub_date, pk = poll['pub_date'], poll['id']
+    else:
+        pub_date, pk = poll.pub_date, poll.id
+    return '%d_%d' % (_micros(pub_date), pk)
+
+
+def decode_cursor(cursor):
+    """Returns ``(pub_date, id)``, or raises ValueError for a bad cursor."""
+    micros, pk = [int(part) for part in cursor.split('_')]
+    if not (MIN_MICROS <= micros <= MAX_MICROS and 0 <= pk <= MAX_ID):
+        raise ValueError('Cursor out of range: %r' % (cursor,))
+    return EPOCH + timedelta(microseconds=micros), pk
+
+
+
+class KeysetPage(object):
+
+    def __init__(self, items, next_cursor=None, previous_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def keyset_page(queryset, after=None, before=None, size=None):
+    """
+    Fetches the page of ``queryset`` following the ``after`` cursor, or
+    preceding the ``before`` cursor, or else the first page.  One query,
+    for one row more than the page holds, tells us if there's another page.
+    """
+    size = size or page_size()
+    if before:
+        pub_date, pk = decode_cursor(before)
+        rows = list(
+            queryset.filter(Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, pk__lt=pk))
+            .order_by('-pub_date', '-id')[:size + 1]
+        )
+        has_previous = len(rows) > size
+        items = rows[:size][::-1]
+        has_next = True
+    else:
+        if after:
+            pub_date, pk = decode_cursor(after)
+            queryset = queryset.filter(
+                Q(pub_date__gt=pub_date) | Q(pub_date=pub_date, pk__gt=pk)
+            )
+        rows = list(queryset.order_by('pub_date', 'id')[:size + 1])
+        items = rows[:size]
+        has_next = len(rows) > size
+        has_previous = bool(after)
+
+    return KeysetPage(
+        items,
+        next_cursor=encode_cursor(items[-1]) if items and has_next else None,
+        previous_cursor=encode_cursor(items[0]) if items and has_previous else None,
+    )
+
+
+
+def estimated_row_count(model, using='default'):
+    """
+    Roughly how many rows ``model``'s table has, from the database's own
+    statistics where it keeps them, or else from the span of primary keys.
+    Either way, it doesn't scan the table.  The span counts every row ever
+    deleted from between the first and last, so it can overcount by as
+    many; ``EstimatedCountPaginator`` copes with the pages that go missing.
+    """
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    table = model._meta.db_table
+    cursor = connection.cursor()
+    if connection.vendor == 'postgresql':
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class WHERE relname = %s', [table]
+        )
+    elif connection.vendor == 'mysql':
+        cursor.execute(
+            'SELECT table_rows FROM information_schema.tables'
+            ' WHERE table_schema = DATABASE() AND table_name = %s', [table]
+        )
+    else:
+        pk = qn(model._meta.pk.column)
+        cursor.execute('SELECT MAX(%s) - MIN(%s) + 1 FROM %s' % (pk, pk, qn(table)))
+    row = cursor.fetchone()
+    return int(row[0]) if row and row[0] is not None else None
+
+
+def estimated_count(queryset):
+    """
+    The number of rows in ``queryset``: estimated if it's a whole big
+    table, and counted exactly if it's filtered, sliced or small.
+    """
+    query = queryset.query
+    if (not query.where and not query.extra and not query.distinct
+            and not query.low_mark and query.high_mark is None):
+        estimate = estimated_row_count(queryset.model, queryset.db)
+        if estimate is not None and estimate > ESTIMATE_COUNTS_ABOVE:
+            return estimate
+    return QuerySet.count(queryset)
+
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    A Paginator that estimates how many rows a big, unfiltered table has.
+    An estimate that's too high shows pages past the real end; asked for
+    one, it counts exactly, and so finds there's no such page after all.
+    """
+
+    def _get_count(self):
+        if self._count is None and isinstance(self.object_list, QuerySet):
+            self._count = estimated_count(self.object_list)
+        return Paginator._get_count(self)
+    count = property(_get_count)
+
+    def page(self, number):
+        page = Paginator.page(self, number)
+        # fetches the page, which its user was about to do anyway
+        if not page.object_list and isinstance(self.object_list, QuerySet):
+            self._count = QuerySet.count(self.object_list)
+            self._num_pages = None
+            page = Paginator.page(self, number)
+        return page
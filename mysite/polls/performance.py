@@ -0,0 +1,219 @@
+"""
+Per-request performance instrumentation.
+
+Add the middleware near the top of ``MIDDLEWARE_CLASSES``, so that it
+times as much of the request as possible::
+
+    MIDDLEWARE_CLASSES = (
+        'polls.performance.PerformanceMiddleware',
+        ...
+    )
+
+For each request it measures the wall time, the number of database
+queries and the time they took, the time spent rendering templates, and
+the response size.  These go out three ways:
+
+- as a ``Server-Timing`` header, which browsers' developer tools show;
+- as a JSON log line on the ``polls.performance`` logger;
+- into rolling p50/p95/p99 figures for each view, which staff can see at
+  ``/performance/``.
+
+Settings, all optional::
+
+    POLLS_PERFORMANCE = {
+        'WINDOW': 1000,         # requests per view kept for percentiles
+        'SERVER_TIMING': True,  # send the Server-Timing header
+    }
+"""
+import json
+import logging
+import math
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import connections
+from django.dispatch import receiver
+from django.template.base import Template
+from django.test.signals import setting_changed
+
+from polls.api import json_response
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WINDOW = 1000
+
+_local = threading.local()
+
+
+
+class RequestTimer(object):
+
+    def __init__(self):
+        self.start = time.time()
+        self.view = None
+        self.template_seconds = 0.0
+        self.rendering = False
+        # Django's own query log, which assertNumQueries uses too
+        self.connections = []
+        for connection in connections.all():
+            self.connections.append(
+                (connection, connection.use_debug_cursor, len(connection.queries))
+            )
+            connection.use_debug_cursor = True
+
+    def finish(self):
+        """Stops timing, and returns the figures for the request."""
+        queries, db_seconds = 0, 0.0
+        for connection, use_debug_cursor, first_query in self.connections:
+            connection.use_debug_cursor = use_debug_cursor
+            logged = connection.queries[first_query:]
+            queries += len(logged)
+            db_seconds += sum(float(query['time']) for query in logged)
+        return {
+            'view': self.view,
+            'ms': round((time.time() - self.start) * 1000, 3),
+            'db_queries': queries,
+            'db_ms': round(db_seconds * 1000, 3),
+            'template_ms': round(self.template_seconds * 1000, 3),
+        }
+
+
+def _timed_render(self, context):
+    timer = getattr(_local, 'timer', None)
+    # only the outermost template, as includes render inside it
+    if timer is None or timer.rendering:
+        return _untimed_render(self, context)
+    timer.rendering = True
+    start = time.time()
+    try:
+        return _untimed_render(self, context)
+    finally:
+        timer.template_seconds += time.time() - start
+        timer.rendering = False
+
+_untimed_render = None
+_install_lock = threading.Lock()
+
+def _time_templates():
+    global _untimed_render
+    with _install_lock:
+        if _untimed_render is None:
+            _untimed_render = Template.render
+            Template.render = _timed_render
+
+
+
+class PerformanceStats(object):
+    """The last ``window`` request times for each view, for percentiles."""
+
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.window = window
+        self.lock = threading.Lock()
+        self.timings = {}
+        self.counts = {}
+
+    def add(self, view, ms):
+        with self.lock:
+            if view not in self.timings:
+                self.timings[view] = deque(maxlen=self.window)
+                self.counts[view] = 0
+            self.timings[view].append(ms)
+            self.counts[view] += 1
+
+    def percentiles(self):
+        with self.lock:
+            timings = dict((view, sorted(ms)) for view, ms in self.timings.items())
+            counts = dict(self.counts)
+        return dict(
+            (view, {
+                'requests': counts[view],
+                'p50_ms': _percentile(ms, 50),
+                'p95_ms': _percentile(ms, 95),
+                'p99_ms': _percentile(ms, 99),
+            })
+            for view, ms in timings.items()
+        )
+
+
+def _percentile(ordered, percent):
+    """Nearest-rank percentile of an already sorted list."""
+    rank = int(math.ceil(percent / 100.0 * len(ordered)))
+    return ordered[max(rank, 1) - 1]
+
+
+_stats = None
+_stats_lock = threading.Lock()
+
+def _config():
+    return getattr(settings, 'POLLS_PERFORMANCE', {})
+
+
+def get_performance_stats():
+    global _stats
+    with _stats_lock:
+        if _stats is None:
+            _stats = PerformanceStats(_config().get('WINDOW', DEFAULT_WINDOW))
+        return _stats
+
+
+@receiver(setting_changed)
+def _reset_performance_stats(sender, setting, **kwargs):
+    global _stats
+    if setting == 'POLLS_PERFORMANCE':
+        with _stats_lock:
+            _stats = None
+
+
+
+def _view_name(view_func):
+    return '%s.%s' % (
+        view_func.__module__, getattr(view_func, '__name__', type(view_func).__name__)
+    )
+
+
+def server_timing(figures):
+    return (
+        'total;dur=%(ms).1f, db;dur=%(db_ms).1f;desc="%(db_queries)d queries", '
+        'tpl;dur=%(template_ms).1f' % figures
+    )
+
+
+class PerformanceMiddleware(object):
+
+    def __init__(self):
+        _time_templates()
+
+    def process_request(self, request):
+        _local.timer = RequestTimer()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timer = getattr(_local, 'timer', None)
+        if timer is not None:
+            timer.view = _view_name(view_func)
+
+    def process_response(self, request, response):
+        timer = getattr(_local, 'timer', None)
+        if timer is None:
+            return response
+        _local.timer = None
+        figures = timer.finish()
+        figures['status'] = response.status_code
+        figures['path'] = request.path
+        if not getattr(response, '_base_content_is_iter', False):
+            figures['bytes'] = len(response.content)
+
+        if timer.view is not None:
+            get_performance_stats().add(timer.view, figures['ms'])
+        if _config().get('SERVER_TIMING', True):
+            response['Server-Timing'] = server_timing(figures)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps(figures, sort_keys=True))
+        return response
+
+
+@staff_member_required
+def performance_stats(request):
+    return json_response({'views': get_performance_stats().percentiles()})
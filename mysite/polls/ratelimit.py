@@ -0,0 +1,215 @@
+"""
+Token-bucket rate limits for votes and results.
+
+With ``POLLS_RATE_LIMITS`` set, views wrapped in ``rate_limited`` take a
+token from the client's bucket for the scope, and from the poll's, before
+they do anything else.  A request that finds a bucket empty gets a 429
+with ``Retry-After``, without touching the database::
+
+    POLLS_RATE_LIMITS = {
+        'LIMITS': {
+            # 'N/period': up to N at once, refilling at N per period
+            'vote': {'CLIENT': '10/minute', 'POLL': '100/second'},
+            'results': {'CLIENT': '120/minute'},
+            'search': {'CLIENT': '30/minute'},
+        },
+        'STORE': 'memory',       # or 'cache', to share buckets
+        'MAX_BUCKETS': 100000,   # for 'memory'
+        'CACHE': 'default',      # for 'cache': which of settings.CACHES
+        'CLIENT_KEY': 'REMOTE_ADDR',  # the request.META key for the client
+    }
+
+The 'memory' store keeps the ``MAX_BUCKETS`` most recently used buckets in
+each process; forgetting a bucket only ever refills it.  The 'cache' store
+shares them through the cache framework, so that every process counts
+against the same limits; the local memory cache stands in for memcached
+in development.  Its updates aren't atomic, so concurrent requests can
+get slightly more than their share.  Behind a proxy, set ``CLIENT_KEY``
+to the header it puts the client's address in.
+"""
+import functools
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import get_cache
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django.test.signals import setting_changed
+
+DEFAULT_MAX_BUCKETS = 100000
+
+PERIODS = {
+    's': 1, 'second': 1,
+    'm': 60, 'minute': 60,
+    'h': 60 * 60, 'hour': 60 * 60,
+    'd': 24 * 60 * 60, 'day': 24 * 60 * 60,
+}
+
+
+def parse_rate(rate):
+    """``'10/minute'`` -> ``(10, 60)``: the burst size, and seconds to refill."""
+    count, _, period = rate.partition('/')
+    try:
+        return int(count), PERIODS[period.strip()]
+    except (KeyError, ValueError):
+        raise ValueError('Bad rate: %r' % (rate,))
+
+
+def _refill(bucket, burst, seconds, now):
+    """The tokens in a ``(tokens, updated)`` bucket at ``now``."""
+    if bucket is None:
+        return burst
+    tokens, updated = bucket
+    return min(burst, tokens + (now - updated) * float(burst) / seconds)
+
+
+def _take_all(buckets, limits, now):
+    """
+    Given the current ``buckets`` for each of ``limits``, a list of
+    ``(key, burst, seconds)``, returns ``(seconds to wait, new buckets)``.
+    A token is taken from every bucket, or from none of them.
+    """
+    wait = 0
+    refilled = []
+    for bucket, (key, burst, seconds) in zip(buckets, limits):
+        tokens = _refill(bucket, burst, seconds, now)
+        if tokens < 1:
+            wait = max(wait, (1 - tokens) * float(seconds) / burst)
+        refilled.append(tokens)
+    if wait:
+        return wait, None
+    return 0, [(tokens - 1, now) for tokens in refilled]
+
+
+
+class MemoryBucketStore(object):
+
+    def __init__(self, max_buckets=DEFAULT_MAX_BUCKETS):
+        self.max_buckets = max_buckets
+        self.lock = threading.Lock()
+        self.buckets = OrderedDict()
+
+    def take(self, limits, now=None):
+        now = time.time() if now is None else now
+        with self.lock:
+            wait, taken = _take_all(
+                [self.buckets.get(key) for key, _, _ in limits], limits, now
+            )
+            if taken is not None:
+                for (key, _, _), bucket in zip(limits, taken):
+                    self.buckets.pop(key, None)
+                    self.buckets[key] = bucket
+                while len(self.buckets) > self.max_buckets:
+                    self.buckets.popitem(last=False)
+            return wait
+
+
+
+class CacheBucketStore(object):
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def take(self, limits, now=None):
+        now = time.time() if now is None else now
+        keys = ['polls:ratelimit:%s' % (key,) for key, _, _ in limits]
+        found = self.cache.get_many(keys)
+        wait, taken = _take_all([found.get(key) for key in keys], limits, now)
+        if taken is not None:
+            for key, (_, _, seconds), bucket in zip(keys, limits, taken):
+                # by when it would be full again, and so can be forgotten
+                self.cache.set(key, bucket, int(math.ceil(seconds)) + 1)
+        return wait
+
+
+
+class RateLimiter(object):
+
+    def __init__(self, store, limits, client_key='REMOTE_ADDR'):
+        self.store = store
+        self.client_key = client_key
+        self.limits = {}
+        for scope, rates in limits.items():
+            self.limits[scope] = dict(
+                (kind, parse_rate(rate)) for kind, rate in rates.items()
+            )
+        self.rejected = 0
+
+    def check(self, scope, request, poll_id=None):
+        """Takes a token; returns 0, or the seconds to wait before retrying."""
+        rates = self.limits.get(scope)
+        if not rates:
+            return 0
+        limits = []
+        if 'CLIENT' in rates:
+            client = request.META.get(self.client_key, '')
+            limits.append(('%s:client:%s' % (scope, client),) + rates['CLIENT'])
+        if 'POLL' in rates and poll_id is not None:
+            limits.append(('%s:poll:%s' % (scope, poll_id),) + rates['POLL'])
+        wait = self.store.take(limits)
+        if wait:
+            self.rejected += 1
+        return wait
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+def get_rate_limiter():
+    """The process's rate limiter, or None if ``POLLS_RATE_LIMITS`` is unset."""
+    global _limiter
+    config = getattr(settings, 'POLLS_RATE_LIMITS', None)
+    if not config:
+        return None
+    with _limiter_lock:
+        if _limiter is None:
+            if config.get('STORE', 'memory') == 'cache':
+                store = CacheBucketStore(get_cache(config.get('CACHE', 'default')))
+            else:
+                store = MemoryBucketStore(
+                    config.get('MAX_BUCKETS', DEFAULT_MAX_BUCKETS)
+                )
+            _limiter = RateLimiter(
+                store, config.get('LIMITS', {}),
+                config.get('CLIENT_KEY', 'REMOTE_ADDR'),
+            )
+        return _limiter
+
+
+@receiver(setting_changed)
+def _reset_rate_limiter(sender, setting, **kwargs):
+    global _limiter
+    if setting == 'POLLS_RATE_LIMITS':
+        with _limiter_lock:
+            _limiter = None
+
+
+
+def too_many_requests(retry_after):
+    response = HttpResponse(
+        'Too many requests', status=429, content_type='text/plain'
+    )
+    response['Retry-After'] = str(int(math.ceil(retry_after)))
+    return response
+
+
+def rate_limited(scope, methods=None):
+    """
+    Limits a view's requests, or just those made with ``methods``, under
+    ``scope``.  The view's first argument, if any, is taken as the poll id.
+    Put it above every other decorator, so nothing runs before it.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            limiter = get_rate_limiter()
+            if limiter is not None and (methods is None or request.method in methods):
+                retry_after = limiter.check(scope, request, args[0] if args else None)
+                if retry_after:
+                    return too_many_requests(retry_after)
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,216 @@
+"""
+Full-text search over poll questions and their choices.
+
+On SQLite, polls are indexed in ``polls_search``, an FTS5 table with a
+row per poll: its question, and its choices run together.  Triggers on
+the poll and choice tables keep it up to date, so polls are indexed
+however they get written, ``bulk_create`` and raw SQL included, and
+votes, which don't change any text, don't touch it.  The table and its
+triggers are created by syncdb; ``manage.py rebuild_search_index``
+creates them for an existing database, and refills the index from
+scratch.
+
+Every word searched for must appear, as a whole word or the start of
+one, and matches in the question count for more than matches in the
+choices.  Databases without FTS5 fall back to ``icontains``, which has
+to scan every poll.
+"""
+import re
+
+from django.db import DatabaseError, connections, router, transaction
+from django.db.models import Q
+from django.db.models.signals import post_syncdb
+from django.dispatch import receiver
+
+from polls.models import Choice, Poll
+from polls.pagination import page_size
+
+SEARCH_TABLE = 'polls_search'
+
+# how much more a match in the question counts than one in the choices
+QUESTION_WEIGHT = 2.0
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+MAX_WORDS = 10
+
+
+def _schema():
+    poll_table = Poll._meta.db_table
+    choice_table = Choice._meta.db_table
+    choices_sql = (
+        "COALESCE((SELECT group_concat(choice, ' ') FROM %s"
+        " WHERE poll_id = %%s), '')" % (choice_table,)
+    )
+    reindex_choices = 'UPDATE %s SET choices = %s WHERE rowid = %%(poll)s;' % (
+        SEARCH_TABLE, choices_sql % ('%(poll)s',),
+    )
+    return [
+        # prefix indexes, so that searching for the start of a word
+        # doesn't mean scanning every word that starts the same way
+        "CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5("
+        "question, choices, tokenize = 'unicode61 remove_diacritics 1',"
+        " prefix = '2 3 4')" % (SEARCH_TABLE,),
+
+        "CREATE TRIGGER IF NOT EXISTS %(search)s_poll_insert AFTER INSERT ON %(poll)s"
+        " BEGIN INSERT INTO %(search)s (rowid, question, choices)"
+        " VALUES (new.id, new.question, ''); END" % {
+            'search': SEARCH_TABLE, 'poll': poll_table,
+        },
+        "CREATE TRIGGER IF NOT EXISTS %(search)s_poll_update"
+        " AFTER UPDATE OF question ON %(poll)s"
+        " BEGIN UPDATE %(search)s SET question = new.question"
+        " WHERE rowid = new.id; END" % {
+            'search': SEARCH_TABLE, 'poll': poll_table,
+        },
+        "CREATE TRIGGER IF NOT EXISTS %(search)s_poll_delete AFTER DELETE ON %(poll)s"
+        " BEGIN DELETE FROM %(search)s WHERE rowid = old.id; END" % {
+            'search': SEARCH_TABLE, 'poll': poll_table,
+        },
+
+        "CREATE TRIGGER IF NOT EXISTS %s_choice_insert AFTER INSERT ON %s"
+        " BEGIN %s END" % (
+            SEARCH_TABLE, choice_table, reindex_choices % {'poll': 'new.poll_id'},
+        ),
+        "CREATE TRIGGER IF NOT EXISTS %s_choice_update"
+        " AFTER UPDATE OF choice, poll_id ON %s BEGIN %s %s END" % (
+            SEARCH_TABLE, choice_table,
+            reindex_choices % {'poll': 'old.poll_id'},
+            reindex_choices % {'poll': 'new.poll_id'},
+        ),
+        "CREATE TRIGGER IF NOT EXISTS %s_choice_delete AFTER DELETE ON %s"
+        " BEGIN %s END" % (
+            SEARCH_TABLE, choice_table, reindex_choices % {'poll': 'old.poll_id'},
+        ),
+    ]
+
+
+def has_search_index(using='default'):
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return False
+    cursor = connection.cursor()
+    cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+        [SEARCH_TABLE]
+    )
+    return cursor.fetchone() is not None
+
+
+def create_search_index(using='default'):
+    """
+    Creates the index and its triggers, if the database can have them,
+    and fills the index if it's new.  Returns True if there is an index.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return False
+    existed = has_search_index(using)
+    cursor = connection.cursor()
+    try:
+        for sql in _schema():
+            cursor.execute(sql)
+    except DatabaseError:
+        return False  # built without FTS5
+    if not existed:
+        rebuild_search_index(using)
+    transaction.commit_unless_managed(using=using)
+    return True
+
+
+def drop_search_index(using='default'):
+    cursor = connections[using].cursor()
+    for event in ('poll_insert', 'poll_update', 'poll_delete',
+                  'choice_insert', 'choice_update', 'choice_delete'):
+        cursor.execute('DROP TRIGGER IF EXISTS %s_%s' % (SEARCH_TABLE, event))
+    cursor.execute('DROP TABLE IF EXISTS %s' % (SEARCH_TABLE,))
+
+
+def rebuild_search_index(using='default'):
+    """Refills the index from the poll and choice tables, in one statement."""
+    cursor = connections[using].cursor()
+    cursor.execute('DELETE FROM %s' % (SEARCH_TABLE,))
+    cursor.execute(
+        "INSERT INTO %s (rowid, question, choices)"
+        " SELECT p.id, p.question, COALESCE((SELECT group_concat(c.choice, ' ')"
+        " FROM %s c WHERE c.poll_id = p.id), '') FROM %s p" % (
+            SEARCH_TABLE, Choice._meta.db_table, Poll._meta.db_table,
+        )
+    )
+    transaction.commit_unless_managed(using=using)
+    return cursor.rowcount
+
+
+@receiver(post_syncdb)
+def _create_search_index(sender, db, **kwargs):
+    # by name, as polls.models is still being imported when this is
+    if sender.__name__ == Poll.__module__ and router.allow_syncdb(db, Poll):
+        create_search_index(db)
+
+
+
+def search_words(query):
+    return WORD_RE.findall(query)[:MAX_WORDS]
+
+
+def match_expression(words):
+    """Each word as a quoted FTS5 prefix query, all of them required."""
+    return ' '.join('"%s"*' % (word.replace('"', '""'),) for word in words)
+
+
+class SearchPage(object):
+
+    def __init__(self, items, number, has_next):
+        self.items = items
+        self.number = number
+        self.has_next = has_next
+
+    @property
+    def has_previous(self):
+        return self.number > 1
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def search_polls(query, page=1, size=None, using=None):
+    """
+    The ``page``th page of polls matching ``query``, best matches first.
+    Three queries: that the index exists, the ranked ids from the index,
+    and then those polls.
+    """
+    size = size or page_size()
+    using = using or router.db_for_read(Poll)
+    words = search_words(query)
+    if not words:
+        return SearchPage([], page, False)
+    if has_search_index(using):
+        cursor = connections[using].cursor()
+        cursor.execute(
+            'SELECT rowid FROM %(search)s WHERE %(search)s MATCH %%s'
+            ' ORDER BY bm25(%(search)s, %(weight)s, 1.0), rowid'
+            ' LIMIT %%s OFFSET %%s' % {
+                'search': SEARCH_TABLE, 'weight': QUESTION_WEIGHT,
+            },
+            [match_expression(words), size + 1, (page - 1) * size]
+        )
+        ids = [row[0] for row in cursor.fetchall()]
+        polls = Poll.objects.using(using).in_bulk(ids[:size])
+        items = [polls[pk] for pk in ids[:size] if pk in polls]
+    else:
+        polls = Poll.objects.using(using)
+        for word in words:
+            polls = polls.filter(
+                Q(question__icontains=word) | Q(id__in=Choice.objects.using(using)
+                    .filter(choice__icontains=word).values('poll_id'))
+            )
+        ids = list(
+            polls.order_by('-pub_date', '-id').values_list('id', flat=True)
+            [(page - 1) * size:page * size + 1]
+        )
+        found = Poll.objects.using(using).in_bulk(ids[:size])
+        items = [found[pk] for pk in ids[:size]]
+    return SearchPage(items, page, len(ids) > size)
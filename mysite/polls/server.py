@@ -0,0 +1,109 @@
+"""
+A WSGI server that serves requests from a bounded pool of worker threads.
+
+Our views spend most of their time waiting on the database.  Rather than
+one thread per connection, with no upper limit, or one request at a time,
+as ``runserver --nothreading`` does, this server hands each connection to
+a fixed pool of ``workers`` threads.  Up to ``backlog`` more connections
+wait in a queue for a free worker.  Beyond that, new connections get an
+immediate 503, so a burst of traffic can't pile up unbounded threads and
+database connections::
+
+    python manage.py runpooled --workers 16 --backlog 64 0.0.0.0:8000
+
+It serves ``settings.WSGI_APPLICATION``, the same ``mysite.wsgi.application``
+that any other WSGI server would.
+"""
+import Queue
+import signal
+import threading
+
+from django.core.servers.basehttp import WSGIRequestHandler, WSGIServer
+
+DEFAULT_WORKERS = 8
+
+OVERLOADED_RESPONSE = (
+    'HTTP/1.0 503 Service Unavailable\r\n'
+    'Content-Type: text/plain\r\n'
+    'Retry-After: 1\r\n'
+    'Connection: close\r\n'
+    '\r\n'
+    'The server is too busy to take this request.\n'
+)
+
+
+
+class PooledWSGIServer(WSGIServer):
+
+    def __init__(self, server_address, handler_class, workers=DEFAULT_WORKERS,
+                 backlog=None, **kwargs):
+        WSGIServer.__init__(self, server_address, handler_class, **kwargs)
+        self.workers = workers
+        self.backlog = workers * 4 if backlog is None else backlog
+        # a Queue with maxsize 0 would be unbounded
+        self.requests = Queue.Queue(maxsize=max(self.backlog, 1))
+        self.rejected = 0
+        self._threads = []
+        for _ in range(workers):
+            thread = threading.Thread(target=self._work)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def process_request(self, request, client_address):
+        try:
+            self.requests.put_nowait((request, client_address))
+        except Queue.Full:
+            self.rejected += 1
+            try:
+                request.sendall(OVERLOADED_RESPONSE)
+            finally:
+                self.shutdown_request(request)
+
+    def _work(self):
+        while True:
+            request, client_address = self.requests.get()
+            if request is None:
+                return
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    def server_close(self):
+        # wake each worker with a sentinel once it has finished its queue
+        for _ in self._threads:
+            self.requests.put((None, None))
+        for thread in self._threads:
+            thread.join()
+        WSGIServer.server_close(self)
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    """Doesn't log each request to stderr, for tests and load tests."""
+
+    def log_message(self, *args):
+        pass
+
+
+def run_pooled(addr, port, wsgi_handler, workers=DEFAULT_WORKERS,
+               backlog=None, ipv6=False, handler_class=WSGIRequestHandler):
+    """Like ``django.core.servers.basehttp.run``, with a worker pool."""
+    httpd = PooledWSGIServer(
+        (addr, port), handler_class, workers=workers, backlog=backlog,
+        ipv6=ipv6,
+    )
+    httpd.set_app(wsgi_handler)
+    # stop on SIGTERM as on Ctrl-C: finish the requests in hand, then exit
+    # normally, so that atexit handlers, such as the vote buffer's flush, run
+    signal.signal(signal.SIGTERM, _stop)
+    try:
+        httpd.serve_forever()
+    finally:
+        httpd.server_close()
+
+
+def _stop(signum, frame):
+    raise SystemExit(0)
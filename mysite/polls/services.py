@@ -0,0 +1,274 @@
+import random
+import zlib
+
+from django.db import connection, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from polls.models import (
+    MAX_INTEGER, Choice, ChoiceVoteShard, Poll, vote_shard_count
+)
+from polls.signals import votes_recorded
+
+
+def pick_shard(num_shards, shard_key=None):
+    """
+    Picks a counter shard, at random or by hashing ``shard_key`` (eg a
+    session id) so that the same voter always lands on the same row.
+    """
+    if shard_key is None:
+        return random.randrange(num_shards)
+    return zlib.crc32(str(shard_key)) % num_shards
+
+
+def record_vote(poll_id, choice_id, shard_key=None):
+    """
+    Adds a single vote to a choice, and to its poll's stored total, with
+    atomic UPDATEs in one transaction.
+
+    The increments happen in the database (``votes = votes + 1``), so
+    overlapping requests can't lose votes the way a read-modify-write
+    would.  Returns False if there is no such choice on that poll.
+    """
+    recorded = _record_vote(poll_id, choice_id, shard_key)
+    if recorded:
+        votes_recorded.send(
+                sender=Choice, deltas={(int(poll_id), int(choice_id)): 1}
+        )
+    return recorded
+
+
+@transaction.commit_on_success
+def _record_vote(poll_id, choice_id, shard_key):
+    num_shards = vote_shard_count()
+    if num_shards > 1:
+        recorded = _record_sharded_vote(
+                poll_id, choice_id, pick_shard(num_shards, shard_key)
+        )
+    else:
+        recorded = Choice.objects.filter(pk=choice_id, poll=poll_id).update(
+                votes=F('votes') + 1
+        ) == 1
+    if recorded:
+        Poll.objects.filter(pk=poll_id).update(
+                votes=F('votes') + 1, updated=timezone.now()
+        )
+    return recorded
+
+
+def _record_sharded_vote(poll_id, choice_id, shard):
+    shard_rows = ChoiceVoteShard.objects.filter(
+            choice=choice_id, choice__poll=poll_id, shard=shard
+    )
+    if shard_rows.update(votes=F('votes') + 1):
+        return True
+    # either the choice doesn't exist, or nobody has voted on this shard
+    # yet (backfill_vote_shards creates them all up front)
+    if not Choice.objects.filter(pk=choice_id, poll=poll_id).exists():
+        return False
+    ChoiceVoteShard.objects.get_or_create(choice_id=choice_id, shard=shard)
+    shard_rows.update(votes=F('votes') + 1)
+    return True
+
+
+class InvalidVotes(ValueError):
+    """
+    Raised for a batch of votes that names choices that don't exist, or
+    that aren't on the poll given for them.
+    """
+
+    def __init__(self, invalid):
+        ValueError.__init__(
+            self, 'No such choice on that poll: %s' % (
+                ', '.join('%s/%s' % pair for pair in sorted(invalid)),
+            )
+        )
+        self.invalid = invalid
+
+
+# keeps the membership check to one query, inside sqlite's parameter limit
+MAX_BATCH_CHOICES = 500
+
+def record_votes(votes):
+    """
+    Records a batch of votes, given as ``(poll_id, choice_id, count)``
+    tuples, all or nothing.  Membership is checked with one query for the
+    whole batch, and the increments take a couple of UPDATEs, however many
+    votes there are.  Raises InvalidVotes, having recorded nothing, if any
+    choice isn't on its poll.
+    """
+    deltas = {}
+    for poll_id, choice_id, count in votes:
+        if count < 0:
+            raise ValueError('Vote counts can not be negative')
+        key = (int(poll_id), int(choice_id))
+        deltas[key] = deltas.get(key, 0) + count
+    if len(deltas) > MAX_BATCH_CHOICES:
+        raise ValueError(
+            'At most %d different choices per batch' % (MAX_BATCH_CHOICES,)
+        )
+    applied = _apply_vote_deltas(deltas, strict=True)
+    if applied:
+        votes_recorded.send(sender=Choice, deltas=applied)
+    return sum(applied.values())
+
+
+def apply_vote_deltas(deltas):
+    """
+    Applies a batch of aggregated votes, ``{(poll_id, choice_id): count}``,
+    in one transaction: a query per 500 choices to check which really
+    belong to their polls, then bulk UPDATEs of the choices and of their polls'
+    stored totals.  Votes for unknown choices are dropped.  Returns the
+    number of votes applied.
+    """
+    applied = _apply_vote_deltas(deltas)
+    if applied:
+        votes_recorded.send(sender=Choice, deltas=applied)
+    return sum(applied.values())
+
+
+@transaction.commit_on_success
+def _apply_vote_deltas(deltas, strict=False):
+    if not deltas:
+        return {}
+    # ids no row could have are invalid, rather than an OverflowError
+    # that would fail every flush of a buffer holding them
+    choice_ids = set(
+        choice_id for poll_id, choice_id in deltas
+        if 0 <= poll_id <= MAX_INTEGER and 0 <= choice_id <= MAX_INTEGER
+    )
+    valid = set()
+    for batch in _batches(choice_ids):
+        valid.update(
+                Choice.objects.filter(pk__in=batch)
+                .values_list('poll_id', 'id')
+        )
+    if strict and not valid.issuperset(deltas):
+        raise InvalidVotes(set(deltas) - valid)
+    applied = dict(
+            (key, count) for key, count in deltas.items()
+            if count and key in valid
+    )
+    increments, poll_increments = {}, {}
+    for (poll_id, choice_id), count in applied.items():
+        increments[choice_id] = increments.get(choice_id, 0) + count
+        poll_increments[poll_id] = poll_increments.get(poll_id, 0) + count
+    _bulk_increment(Choice, 'votes', increments)
+    _bulk_increment(Poll, 'votes', poll_increments, touch='updated')
+    return applied
+
+
+@transaction.commit_on_success
+def repair_poll_totals():
+    """
+    Finds every poll whose stored total has drifted from its choices, and
+    resets them all in bulk.  Returns ``(poll_id, stored, actual)`` for
+    each poll it fixed.
+    """
+    drifted = list(
+            Poll.objects.drifted().order_by('id')
+            .values_list('id', 'votes', 'vote_total')
+    )
+    _bulk_set(
+        Poll, 'votes', dict((pk, actual) for pk, _, actual in drifted),
+        touch='updated'
+    )
+    return drifted
+
+
+# keep each lookup under sqlite's 999 parameter limit
+LOOKUP_BATCH_SIZE = 500
+
+def _batches(values, size=LOOKUP_BATCH_SIZE):
+    values = sorted(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+# sqlite allows 999 parameters per statement, and each row takes three
+BULK_UPDATE_BATCH_SIZE = 300
+
+def _bulk_increment(model, field_name, increments, touch=None):
+    """
+    Adds ``increments[pk]`` to ``field_name`` on each row, using one
+    ``UPDATE ... SET f = f + CASE pk WHEN ... END`` per batch of rows.
+    The ``touch`` field, if given, is set to the current time as well.
+    """
+    _bulk_update(model, field_name, increments, relative=True, touch=touch)
+
+
+def _bulk_set(model, field_name, values, touch=None):
+    """Sets ``field_name`` to ``values[pk]`` on each row, in bulk."""
+    _bulk_update(model, field_name, values, relative=False, touch=touch)
+
+
+def _bulk_update(model, field_name, values, relative, touch):
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    pk_column = qn(model._meta.pk.column)
+    column = qn(model._meta.get_field(field_name).column)
+    touch_sql, touch_params = '', []
+    if touch is not None:
+        touch_field = model._meta.get_field(touch)
+        touch_sql = ', %s = %%s' % (qn(touch_field.column),)
+        touch_params = [
+            touch_field.get_db_prep_save(timezone.now(), connection=connection)
+        ]
+    # always lock rows in the same order, so concurrent flushes can't deadlock
+    rows = sorted(values.items())
+    cursor = connection.cursor()
+    for start in range(0, len(rows), BULK_UPDATE_BATCH_SIZE):
+        batch = rows[start:start + BULK_UPDATE_BATCH_SIZE]
+        sql = 'UPDATE %s SET %s = %sCASE %s %s END%s WHERE %s IN (%s)' % (
+            table, column, column + ' + ' if relative else '', pk_column,
+            ' '.join(['WHEN %s THEN %s'] * len(batch)),
+            touch_sql,
+            pk_column, ', '.join(['%s'] * len(batch)),
+        )
+        params = [value for row in batch for value in row]
+        params.extend(touch_params)
+        params.extend(pk for pk, _ in batch)
+        cursor.execute(sql, params)
+    transaction.set_dirty()
+
+
+def create_vote_shards(num_shards, choices=None):
+    """
+    Makes sure every choice has all ``num_shards`` counter rows, so that
+    votes never need an INSERT.  Returns the number of rows created.
+    """
+    if choices is None:
+        choices = Choice.objects.all()
+    existing = set(
+            ChoiceVoteShard.objects.filter(choice__in=choices)
+            .values_list('choice_id', 'shard')
+    )
+    missing = [
+        ChoiceVoteShard(choice_id=choice_id, shard=shard, votes=0)
+        for choice_id in choices.values_list('id', flat=True)
+        for shard in range(num_shards)
+        if (choice_id, shard) not in existing
+    ]
+    ChoiceVoteShard.objects.bulk_create(missing)
+    return len(missing)
+
+
+@transaction.commit_on_success
+def fold_vote_shards():
+    """
+    Adds every shard's votes back onto ``Choice.votes`` and deletes the
+    shards.  Run this before turning sharding off, or the votes still
+    sitting in shards would stop being counted.
+    """
+    sharded = ChoiceVoteShard.objects.values('choice_id').annotate(
+            total=Sum('votes')
+    )
+    folded = 0
+    for row in sharded:
+        if row['total']:
+            Choice.objects.filter(pk=row['choice_id']).update(
+                    votes=F('votes') + row['total']
+            )
+            folded += 1
+    ChoiceVoteShard.objects.all().delete()
+    return folded
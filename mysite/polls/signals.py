@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# sent once a batch of votes has been committed, with
+# ``deltas = {(poll_id, choice_id): votes}``
+votes_recorded = Signal(providing_args=['deltas'])
@@ -0,0 +1,4 @@
+-- Ignoring case, as the admin's prefix search does; it searches by range
+-- (see polls.admin) because SQLite won't use an index for a LIKE pattern
+-- passed as a parameter.
+CREATE INDEX polls_poll_question_nocase ON polls_poll (question COLLATE NOCASE);
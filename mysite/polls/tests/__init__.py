@@ -1,3 +1,20 @@
+from polls.tests.test_admin import *
+from polls.tests.test_analytics import *
+from polls.tests.test_api import *
+from polls.tests.test_benchmarks import *
+from polls.tests.test_buffer import *
+from polls.tests.test_cache import *
+from polls.tests.test_db import *
+from polls.tests.test_events import *
+from polls.tests.test_export import *
 from polls.tests.test_forms import *
+from polls.tests.test_guard import *
+from polls.tests.test_importer import *
 from polls.tests.test_models import *
+from polls.tests.test_performance import *
+from polls.tests.test_ratelimit import *
+from polls.tests.test_search import *
+from polls.tests.test_server import *
+from polls.tests.test_services import *
+from polls.tests.test_trending import *
 from polls.tests.test_views import *
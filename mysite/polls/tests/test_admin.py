@@ -0,0 +1,140 @@
+import sqlite3
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.paginator import EmptyPage
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+import polls.pagination
+from polls.models import Choice, Poll
+from polls.pagination import EstimatedCountPaginator, estimated_count
+
+
+def make_polls(count, choices_each=3):
+    start = timezone.now()
+    for i in range(count):
+        poll = Poll(question='poll %d' % (i,), pub_date=start - timedelta(days=i))
+        poll.save()
+        for j in range(choices_each):
+            Choice(poll=poll, choice='choice %d' % (j,), votes=j).save()
+    return poll
+
+
+
+class PollAdminTest(TestCase):
+
+    def setUp(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'adm1n')
+        self.client.login(username='admin', password='adm1n')
+
+
+    def test_changelist_queries_dont_grow_with_the_table(self):
+        for count in (3, 30):
+            make_polls(count)
+            with self.assertNumQueries(7):
+                response = self.client.get('/admin/polls/poll/')
+            self.assertEquals(response.status_code, 200)
+            # plus the unfiltered total, for "n results (m total)"
+            with self.assertNumQueries(8):
+                response = self.client.get(
+                    '/admin/polls/poll/', {'o': '-3', 'q': 'poll'}
+                )
+            self.assertEquals(response.status_code, 200)
+
+
+    def test_change_view_queries_dont_grow_with_the_choices(self):
+        for choices in (2, 20):
+            poll = make_polls(1, choices)
+            # counting the content types the page looks up, wherever the
+            # cache of them stands
+            ContentType.objects.clear_cache()
+            with self.assertNumQueries(6):
+                response = self.client.get('/admin/polls/poll/%d/' % (poll.id,))
+            self.assertEquals(response.status_code, 200)
+
+
+    def test_changelist_sorts_by_stored_vote_totals(self):
+        make_polls(3)
+        Choice.objects.filter(poll__question='poll 2').update(votes=100)
+        Poll.objects.filter(question='poll 2').update(votes=300)
+
+        response = self.client.get('/admin/polls/poll/', {'o': '-3'})
+
+        self.assertEquals(
+            [poll.question for poll in response.context['cl'].result_list][:1],
+            ['poll 2']
+        )
+
+
+    def search(self, query):
+        response = self.client.get('/admin/polls/poll/', {'q': query})
+        return response.context['cl']
+
+
+    def test_searches_by_question_prefix(self):
+        for question in ('Favourite colour?', 'favourite food?', 'Least favourite?',
+                         'Best pizza?'):
+            Poll(question=question, pub_date=timezone.now()).save()
+        for query in ('fav', 'FAVOURITE'):
+            self.assertEquals(
+                sorted(poll.question for poll in self.search(query).result_list),
+                ['Favourite colour?', 'favourite food?']
+            )
+        self.assertEquals(list(self.search('pizza').result_list), [])
+
+
+    def test_prefix_searches_use_the_question_index(self):
+        sql, params = self.search('fav').query_set.query.sql_with_params()
+        # on a connection of its own, as the sqlite3 module commits before
+        # an EXPLAIN, which would end the test's transaction
+        db = sqlite3.connect(connection.settings_dict['NAME'])
+        try:
+            plan = db.execute('EXPLAIN QUERY PLAN ' + sql.replace('%s', '?'), params)
+            self.assertIn(
+                'USING INDEX polls_poll_question_nocase',
+                ' '.join(row[-1] for row in plan.fetchall())
+            )
+        finally:
+            db.close()
+
+
+
+class EstimatedCountTest(TestCase):
+
+    def setUp(self):
+        self.addCleanup(
+            setattr, polls.pagination, 'ESTIMATE_COUNTS_ABOVE',
+            polls.pagination.ESTIMATE_COUNTS_ABOVE
+        )
+
+
+    def test_counts_small_tables_exactly(self):
+        make_polls(3, choices_each=0)
+        Poll.objects.filter(question='poll 1').delete()
+        self.assertEquals(EstimatedCountPaginator(Poll.objects.all(), 10).count, 2)
+
+
+    def test_estimates_big_unfiltered_tables(self):
+        polls.pagination.ESTIMATE_COUNTS_ABOVE = 0
+        make_polls(3, choices_each=0)
+        Poll.objects.filter(question='poll 1').delete()
+
+        with self.assertNumQueries(1):
+            self.assertEquals(EstimatedCountPaginator(Poll.objects.all(), 10).count, 3)
+        self.assertEquals(
+            estimated_count(Poll.objects.filter(question__startswith='poll')), 2
+        )
+
+
+    def test_counts_exactly_once_the_estimate_turns_out_too_high(self):
+        polls.pagination.ESTIMATE_COUNTS_ABOVE = 0
+        make_polls(5, choices_each=0)
+        Poll.objects.filter(question__in=['poll 1', 'poll 2', 'poll 3']).delete()
+        paginator = EstimatedCountPaginator(Poll.objects.order_by('id'), 2)
+        self.assertEquals(paginator.num_pages, 3)
+
+        self.assertEquals(len(paginator.page(1).object_list), 2)
+        self.assertRaises(EmptyPage, paginator.page, 3)
+        self.assertEquals((paginator.count, paginator.num_pages), (2, 1))
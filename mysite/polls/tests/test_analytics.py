@@ -0,0 +1,124 @@
+from datetime import datetime
+
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+from django.utils.timezone import utc
+from polls.analytics import (
+    log_vote_events, prune_vote_events, roll_up_vote_events, vote_series
+)
+from polls.models import Choice, Poll, VoteEvent, VoteRollup
+from polls.services import apply_vote_deltas, record_vote
+
+
+def at(hour, minute=0, day=1):
+    return datetime(2012, 6, day, hour, minute, tzinfo=utc)
+
+
+
+class VoteEventLogTest(TestCase):
+
+    def setUp(self):
+        self.poll = Poll(question='6 times 7', pub_date=timezone.now())
+        self.poll.save()
+        self.choice1 = Choice(poll=self.poll, choice='42', votes=0)
+        self.choice1.save()
+        self.choice2 = Choice(poll=self.poll, choice='The Ultimate Answer', votes=0)
+        self.choice2.save()
+
+
+    def test_votes_are_not_logged_by_default(self):
+        record_vote(self.poll.id, self.choice1.id)
+        self.assertEquals(VoteEvent.objects.count(), 0)
+
+
+    @override_settings(POLLS_VOTE_EVENTS={'RETENTION_DAYS': 7})
+    def test_logs_each_batch_of_votes_in_bulk(self):
+        record_vote(self.poll.id, self.choice1.id)
+        with self.assertNumQueries(4):
+            apply_vote_deltas({
+                (self.poll.id, self.choice1.id): 10,
+                (self.poll.id, self.choice2.id): 5,
+            })
+
+        self.assertEquals(
+            list(VoteEvent.objects.order_by('id').values_list('choice_id', 'votes')),
+            [(self.choice1.id, 1), (self.choice1.id, 10), (self.choice2.id, 5)]
+        )
+
+
+
+class RollupTest(TestCase):
+
+    def setUp(self):
+        self.poll = Poll(question='6 times 7', pub_date=timezone.now())
+        self.poll.save()
+        self.choice1 = Choice(poll=self.poll, choice='42', votes=0)
+        self.choice1.save()
+        self.choice2 = Choice(poll=self.poll, choice='The Ultimate Answer', votes=0)
+        self.choice2.save()
+        self.key1 = (self.poll.id, self.choice1.id)
+        self.key2 = (self.poll.id, self.choice2.id)
+
+
+    def test_rolls_events_up_into_minutes_hours_and_days(self):
+        log_vote_events({self.key1: 2, self.key2: 1}, now=at(9, 5))
+        log_vote_events({self.key1: 3}, now=at(9, 5))
+        log_vote_events({self.key1: 4}, now=at(10, 30))
+        log_vote_events({self.key2: 7}, now=at(10, 30, day=2))
+
+        self.assertEquals(roll_up_vote_events(), 17)
+
+        self.assertEquals(
+            vote_series(self.poll.id, 'minute'),
+            [(at(9, 5), 6), (at(10, 30), 4), (at(10, 30, day=2), 7)]
+        )
+        self.assertEquals(
+            vote_series(self.poll.id, 'hour', since=at(10), until=at(0, day=2)),
+            [(at(10), 4)]
+        )
+        with self.assertNumQueries(1):
+            self.assertEquals(
+                vote_series(self.poll.id, 'day', by_choice=True),
+                [
+                    (at(0), {self.choice1.id: 9, self.choice2.id: 1}),
+                    (at(0, day=2), {self.choice2.id: 7}),
+                ]
+            )
+
+
+    def test_each_run_adds_only_new_events(self):
+        log_vote_events({self.key1: 2}, now=at(9, 5))
+        roll_up_vote_events()
+        log_vote_events({self.key1: 3}, now=at(9, 5))
+        log_vote_events({self.key1: 1}, now=at(9, 6))
+
+        self.assertEquals(roll_up_vote_events(), 4)
+        self.assertEquals(roll_up_vote_events(), 0)
+        self.assertEquals(vote_series(self.poll.id, 'hour'), [(at(9), 6)])
+        self.assertEquals(
+            VoteRollup.objects.filter(period='hour').count(), 1
+        )
+
+
+    def test_skips_events_for_deleted_choices(self):
+        log_vote_events({self.key1: 2, self.key2: 5}, now=at(9, 5))
+        self.choice2.delete()
+
+        self.assertEquals(roll_up_vote_events(), 2)
+        self.assertEquals(vote_series(self.poll.id, 'day'), [(at(0), 2)])
+
+
+    def test_prunes_only_old_events_that_were_rolled_up(self):
+        log_vote_events({self.key1: 1}, now=at(9, day=1))
+        log_vote_events({self.key1: 1}, now=at(9, day=9))
+        roll_up_vote_events()
+        log_vote_events({self.key1: 1}, now=at(9, day=2))
+
+        self.assertEquals(prune_vote_events(retention_days=7, now=at(12, day=10)), 1)
+        self.assertEquals(VoteEvent.objects.count(), 2)
+        self.assertEquals(vote_series(self.poll.id, 'day')[0], (at(0), 1))
+
+
+    def test_refuses_unknown_periods(self):
+        self.assertRaises(ValueError, vote_series, self.poll.id, 'fortnight')
@@ -0,0 +1,220 @@
+import json
+from datetime import timedelta
+
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+from polls.analytics import log_vote_events, roll_up_vote_events
+from polls.models import Choice, Poll
+from polls.services import record_vote
+
+
+
+class PollListApiTest(TestCase):
+
+    @override_settings(POLLS_PAGE_SIZE=2)
+    def test_lists_polls_a_page_at_a_time(self):
+        start = timezone.now()
+        for i in range(3):
+            Poll(question='poll %d' % (i,), pub_date=start + timedelta(minutes=i)).save()
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/polls/')
+        self.assertEquals(response['Content-Type'], 'application/json')
+        data = json.loads(response.content)
+        self.assertEquals([p['question'] for p in data['polls']], ['poll 0', 'poll 1'])
+        self.assertEquals(
+            sorted(data['polls'][0].keys()), ['id', 'pub_date', 'question', 'votes']
+        )
+        self.assertEquals(data['previous'], None)
+
+        data = json.loads(self.client.get('/api/polls/', {'after': data['next']}).content)
+        self.assertEquals([p['question'] for p in data['polls']], ['poll 2'])
+        self.assertEquals(data['next'], None)
+
+
+    def test_bad_cursors_are_bad_requests(self):
+        for cursor in ('nonsense', '1_%d' % (2 ** 64,), '-%d_1' % (10 ** 30,)):
+            response = self.client.get('/api/polls/', {'after': cursor})
+            self.assertEquals(response.status_code, 400)
+
+
+
+class PollResultsApiTest(TestCase):
+
+    def setUp(self):
+        self.polls = []
+        for i in range(3):
+            poll = Poll(question='poll %d' % (i,), pub_date=timezone.now())
+            poll.save()
+            Choice(poll=poll, choice='yes', votes=3).save()
+            Choice(poll=poll, choice='no', votes=1).save()
+            self.polls.append(poll)
+
+
+    def test_shows_one_polls_results(self):
+        poll = self.polls[1]
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/polls/%d/' % (poll.id,))
+
+        data = json.loads(response.content)
+        self.assertEquals(data['question'], 'poll 1')
+        self.assertEquals(data['votes'], 4)
+        self.assertEquals(
+            [(c['choice'], c['votes'], c['percentage']) for c in data['choices']],
+            [('yes', 3, 75.0), ('no', 1, 25.0)]
+        )
+
+
+    def test_missing_polls_are_404s(self):
+        for poll_id in (self.polls[-1].id + 1, 2 ** 64):
+            response = self.client.get('/api/polls/%d/' % (poll_id,))
+            self.assertEquals(response.status_code, 404)
+
+
+    def test_bulk_results_take_two_queries_however_many_polls(self):
+        ids = [self.polls[2].id, self.polls[0].id, self.polls[2].id + 100]
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                '/api/polls/results/', {'ids': ','.join(str(pk) for pk in ids)}
+            )
+
+        polls = json.loads(response.content)['polls']
+        self.assertEquals([p['question'] for p in polls], ['poll 2', 'poll 0'])
+        self.assertEquals([len(p['choices']) for p in polls], [2, 2])
+
+
+    @override_settings(POLLS_API_MAX_BULK=2)
+    def test_bulk_results_are_limited(self):
+        ids = ','.join(str(poll.id) for poll in self.polls)
+        response = self.client.get('/api/polls/results/', {'ids': ids})
+        self.assertEquals(response.status_code, 400)
+
+        for ids in ('1,two', '1,%d' % (2 ** 64,)):
+            response = self.client.get('/api/polls/results/', {'ids': ids})
+            self.assertEquals(response.status_code, 400)
+
+
+    @override_settings(POLLS_VOTE_SHARDS=4)
+    def test_results_include_sharded_votes(self):
+        poll = self.polls[0]
+        no = poll.choice_set.get(choice='no')
+        for _ in range(4):
+            record_vote(poll.id, no.id)
+
+        data = json.loads(self.client.get('/api/polls/%d/' % (poll.id,)).content)
+        self.assertEquals(
+            [(c['choice'], c['votes'], c['percentage']) for c in data['choices']],
+            [('yes', 3, 37.5), ('no', 5, 62.5)]
+        )
+
+
+
+@override_settings(POLLS_VOTE_API_KEYS=['kiosk-key'])
+class VoteBatchApiTest(TestCase):
+
+    def setUp(self):
+        self.poll = Poll(question='6 times 7', pub_date=timezone.now())
+        self.poll.save()
+        self.choice1 = Choice(poll=self.poll, choice='42', votes=0)
+        self.choice1.save()
+        self.choice2 = Choice(poll=self.poll, choice='The Ultimate Answer', votes=0)
+        self.choice2.save()
+
+
+    def post_votes(self, payload, api_key='kiosk-key'):
+        return self.client.post(
+            '/api/votes/', json.dumps(payload), content_type='application/json',
+            HTTP_X_API_KEY=api_key
+        )
+
+
+    def test_records_a_batch_of_votes(self):
+        response = self.post_votes({'votes': [
+            {'poll': self.poll.id, 'choice': self.choice1.id, 'count': 250},
+            {'poll': self.poll.id, 'choice': self.choice2.id, 'count': 50},
+            {'poll': self.poll.id, 'choice': self.choice2.id},
+        ]})
+
+        self.assertEquals(json.loads(response.content), {'recorded': 301})
+        self.assertEquals(Choice.objects.get(pk=self.choice1.id).votes, 250)
+        self.assertEquals(Choice.objects.get(pk=self.choice2.id).votes, 51)
+        self.assertEquals(Poll.objects.get(pk=self.poll.id).votes, 301)
+
+
+    def test_rejects_the_whole_batch_if_a_choice_is_on_the_wrong_poll(self):
+        response = self.post_votes({'votes': [
+            {'poll': self.poll.id, 'choice': self.choice1.id, 'count': 250},
+            {'poll': self.poll.id + 1, 'choice': self.choice2.id, 'count': 1},
+        ]})
+
+        self.assertEquals(response.status_code, 400)
+        self.assertEquals(
+            json.loads(response.content)['invalid'],
+            [[self.poll.id + 1, self.choice2.id]]
+        )
+        self.assertEquals(Choice.objects.get(pk=self.choice1.id).votes, 0)
+
+
+    def test_rejects_malformed_batches(self):
+        for payload in [
+            {},
+            {'votes': [{'poll': self.poll.id}]},
+            {'votes': [{'poll': self.poll.id, 'choice': self.choice1.id, 'count': '3'}]},
+            {'votes': [{'poll': self.poll.id, 'choice': self.choice1.id, 'count': -3}]},
+            {'votes': [{'poll': self.poll.id, 'choice': self.choice1.id, 'count': 0}]},
+            {'votes': [{'poll': self.poll.id, 'choice': self.choice1.id, 'count': 2 ** 31}]},
+            {'votes': [{'poll': self.poll.id, 'choice': self.choice1.id, 'count': 2 ** 64}]},
+            {'votes': [{'poll': 2 ** 64, 'choice': self.choice1.id}]},
+            {'votes': [
+                {'poll': self.poll.id, 'choice': self.choice1.id, 'count': 2 ** 31 - 1},
+                {'poll': self.poll.id, 'choice': self.choice2.id, 'count': 1},
+            ]},
+            {'votes': 'lots'},
+        ]:
+            self.assertEquals(self.post_votes(payload).status_code, 400)
+        self.assertEquals(Poll.objects.get(pk=self.poll.id).votes, 0)
+
+
+    def test_needs_an_api_key(self):
+        payload = {'votes': [{'poll': self.poll.id, 'choice': self.choice1.id}]}
+        self.assertEquals(self.post_votes(payload, api_key='guess').status_code, 403)
+        self.assertEquals(self.client.get('/api/votes/').status_code, 405)
+
+
+
+class PollVotesApiTest(TestCase):
+
+    def test_serves_a_time_series_from_the_rollups(self):
+        poll = Poll(question='6 times 7', pub_date=timezone.now())
+        poll.save()
+        choice = Choice(poll=poll, choice='42', votes=0)
+        choice.save()
+        noon = timezone.now().replace(hour=12, minute=0, second=0, microsecond=0)
+        log_vote_events({(poll.id, choice.id): 3}, now=noon + timedelta(minutes=5))
+        log_vote_events({(poll.id, choice.id): 2}, now=noon + timedelta(hours=1))
+        roll_up_vote_events()
+
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                '/api/polls/%d/votes/' % (poll.id,), {'period': 'hour'}
+            )
+        data = json.loads(response.content)
+        self.assertEquals(data['period'], 'hour')
+        self.assertEquals([row['votes'] for row in data['series']], [3, 2])
+
+        data = json.loads(self.client.get(
+            '/api/polls/%d/votes/' % (poll.id,), {'period': 'day', 'by': 'choice'}
+        ).content)
+        self.assertEquals(data['series'][0]['choices'], {str(choice.id): 5})
+
+
+    def test_400s_for_a_bad_query(self):
+        for params in [{'period': 'fortnight'}, {'since': 'last tuesday'}]:
+            response = self.client.get('/api/polls/1/votes/', params)
+            self.assertEquals(response.status_code, 400)
+
+
+    def test_404s_for_an_id_no_poll_could_have(self):
+        response = self.client.get('/api/polls/%d/votes/' % (2 ** 64,))
+        self.assertEquals(response.status_code, 404)
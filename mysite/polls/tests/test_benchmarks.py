@@ -0,0 +1,115 @@
+from django.test import TestCase
+from django.test.client import Client
+from polls.benchmarks import (
+    QUERY_BUDGETS, compare_results, count_queries, hot_paths, over_budget,
+    seed_dataset
+)
+from polls.models import Choice, Poll
+
+
+class SeedDatasetTest(TestCase):
+
+    def test_seeds_polls_with_choices_and_consistent_totals(self):
+        seed_dataset(10, choices=3, poll_votes=50)
+
+        self.assertEquals(Poll.objects.count(), 10)
+        self.assertEquals(Choice.objects.count(), 30)
+        for poll in Poll.objects.all():
+            self.assertEquals(
+                poll.votes, sum(c.votes for c in poll.choice_set.all())
+            )
+            self.assertTrue(0 <= poll.votes <= 100)
+
+
+    def test_the_same_seed_gives_the_same_data(self):
+        def votes():
+            return list(Choice.objects.order_by('id').values_list('votes', flat=True))
+
+        seed_dataset(5, seed=3)
+        first = votes()
+        Poll.objects.all().delete()
+        seed_dataset(5, seed=3)
+        self.assertEquals(votes(), first)
+
+        Poll.objects.all().delete()
+        seed_dataset(5, seed=4)
+        self.assertNotEquals(votes(), first)
+
+
+    def test_grows_the_table_without_redoing_earlier_polls(self):
+        seed_dataset(5)
+        seed_dataset(8)
+        self.assertEquals(Poll.objects.count(), 8)
+        self.assertEquals(
+            list(Poll.objects.order_by('id').values_list('question', flat=True)),
+            ['poll %d' % (i,) for i in range(8)]
+        )
+
+
+
+class RegressionCheckTest(TestCase):
+
+    def test_over_budget_query_counts_fail(self):
+        self.assertEquals(over_budget({
+            '1000_polls_home_page_queries': 1,
+            '1000_polls_poll_page_queries': 3,
+            '1000_polls_poll_page_ms': 30,
+        }), ['1000_polls_poll_page_queries: 3 queries, over the budget of 2'])
+
+
+    def test_compares_each_kind_of_result_the_right_way_round(self):
+        baseline = {'hot_paths': {
+            'page_ms': 10.0,
+            'votes_per_sec': 100.0,
+            'page_queries': 2,
+            'rows': 5,
+        }}
+        self.assertEquals(compare_results(baseline, baseline, 10), [])
+        self.assertEquals(compare_results(baseline, {'hot_paths': {
+            'page_ms': 10.9,
+            'votes_per_sec': 91.0,
+            'page_queries': 1,
+            'rows': 50,
+        }}, 10), [])
+        self.assertEquals(compare_results(baseline, {'hot_paths': {
+            'page_ms': 11.5,
+            'votes_per_sec': 80.0,
+            'page_queries': 3,
+        }}, 10), [
+            'hot_paths.page_ms: 11.5, was 10.0',
+            'hot_paths.page_queries: 3, was 2',
+            'hot_paths.votes_per_sec: 80.0, was 100.0',
+        ])
+
+
+    def test_ignores_results_missing_from_the_baseline(self):
+        self.assertEquals(compare_results(
+            {'hot_paths': {}}, {'hot_paths': {'new_ms': 5}, 'exports': {'x_ms': 1}}, 10
+        ), [])
+
+
+
+class QueryCountTest(TestCase):
+
+    def test_counts_queries_across_requests(self):
+        seed_dataset(3)
+        client = Client()
+        self.assertEquals(count_queries(lambda: client.get('/')), 1)
+        self.assertEquals(
+            count_queries(lambda: [client.get('/') for _ in range(3)]), 3
+        )
+
+
+    def test_hot_paths_stay_within_their_budgets(self):
+        results = hot_paths({
+            'scales': '10', 'choices': 3, 'poll_votes': 10, 'seed': 1,
+        })
+        for path, budget in QUERY_BUDGETS.items():
+            queries = results['10_polls_%s_queries' % (path,)]
+            if budget:
+                self.assertTrue(0 < queries <= budget, (path, queries))
+            else:
+                self.assertEquals(queries, 0, path)
+        self.assertEquals(results['10_polls_home_page_queries'], 1)
+        self.assertEquals(results['10_polls_poll_results_queries'], 1)
+        self.assertEquals(over_budget(results), [])
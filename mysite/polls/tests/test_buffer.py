@@ -0,0 +1,234 @@
+import os
+import shutil
+import subprocess
+import tempfile
+from StringIO import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DatabaseError
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+import polls.buffer
+from polls.buffer import (
+    MemoryVoteStore, SpoolVoteStore, VoteBuffer, get_vote_buffer,
+    orphaned_spools, read_spool
+)
+from polls.management.commands.drain_vote_buffer import Command as DrainCommand
+from polls.models import Choice, Poll
+from polls.services import apply_vote_deltas
+
+
+def _poll_with_choices(*choice_texts):
+    poll = Poll(question='6 times 7', pub_date=timezone.now())
+    poll.save()
+    choices = []
+    for text in choice_texts:
+        choice = Choice(poll=poll, choice=text, votes=0)
+        choice.save()
+        choices.append(choice)
+    return poll, choices
+
+
+
+class ApplyVoteDeltasTest(TestCase):
+
+    def test_applies_all_deltas_in_a_bounded_number_of_queries(self):
+        poll, choices = _poll_with_choices('42', 'The Ultimate Answer', 'PM')
+        deltas = {
+            (poll.id, choices[0].id): 5,
+            (poll.id, choices[2].id): 2,
+        }
+
+        # one query to validate, then one update each for choices and polls
+        with self.assertNumQueries(3):
+            applied = apply_vote_deltas(deltas)
+
+        self.assertEquals(applied, 7)
+        self.assertEquals(Poll.objects.get(pk=poll.id).votes, 7)
+        self.assertEquals(
+            [c.votes for c in Choice.objects.order_by('id')], [5, 0, 2]
+        )
+
+
+    def test_drops_votes_for_choices_on_the_wrong_poll(self):
+        poll1, (choice1,) = _poll_with_choices('42')
+        poll2, (choice2,) = _poll_with_choices('PM')
+
+        applied = apply_vote_deltas({
+            (poll1.id, choice1.id): 1,
+            (poll1.id, choice2.id): 3,
+            (poll1.id, choice2.id + 100): 3,
+        })
+
+        self.assertEquals(applied, 1)
+        self.assertEquals(Choice.objects.get(pk=choice2.id).votes, 0)
+        self.assertEquals(Poll.objects.get(pk=poll1.id).votes, 1)
+        self.assertEquals(Poll.objects.get(pk=poll2.id).votes, 0)
+
+
+
+class VoteBufferTest(TestCase):
+
+    def test_votes_stay_in_the_buffer_until_it_is_flushed(self):
+        poll, (choice1, choice2) = _poll_with_choices('42', 'PM')
+        vote_buffer = VoteBuffer(MemoryVoteStore(), flush_interval=3600)
+
+        with self.assertNumQueries(0):
+            for _ in range(3):
+                vote_buffer.add(poll.id, choice1.id)
+            vote_buffer.add(poll.id, choice2.id)
+
+        self.assertEquals(vote_buffer.metrics()['depth'], 4)
+        self.assertEquals(Choice.objects.get(pk=choice1.id).votes, 0)
+
+        self.assertEquals(vote_buffer.flush(), 4)
+
+        self.assertEquals(Choice.objects.get(pk=choice1.id).votes, 3)
+        self.assertEquals(Choice.objects.get(pk=choice2.id).votes, 1)
+        metrics = vote_buffer.metrics()
+        self.assertEquals(metrics['depth'], 0)
+        self.assertEquals(metrics['flushes'], 1)
+        self.assertEquals(metrics['votes_flushed'], 4)
+        self.assertTrue(
+            metrics['max_flush_seconds'] >= metrics['last_flush_seconds']
+        )
+
+
+    def test_flushes_once_the_batch_is_full(self):
+        poll, (choice,) = _poll_with_choices('42')
+        vote_buffer = VoteBuffer(MemoryVoteStore(), flush_interval=3600, batch_size=5)
+
+        for _ in range(4):
+            vote_buffer.add(poll.id, choice.id)
+        self.assertEquals(Choice.objects.get(pk=choice.id).votes, 0)
+
+        vote_buffer.add(poll.id, choice.id)
+        self.assertEquals(Choice.objects.get(pk=choice.id).votes, 5)
+
+
+    def test_flushes_once_the_interval_has_passed(self):
+        poll, (choice,) = _poll_with_choices('42')
+        vote_buffer = VoteBuffer(MemoryVoteStore(), flush_interval=3600)
+        vote_buffer.add(poll.id, choice.id)
+
+        vote_buffer.last_flush -= 3600
+        vote_buffer.add(poll.id, choice.id)
+
+        self.assertEquals(Choice.objects.get(pk=choice.id).votes, 2)
+
+
+    def test_failed_flushes_keep_their_votes(self):
+        poll, (choice,) = _poll_with_choices('42')
+        vote_buffer = VoteBuffer(MemoryVoteStore(), flush_interval=3600)
+        vote_buffer.add(poll.id, choice.id)
+
+        def fail(deltas):
+            raise DatabaseError('database is locked')
+        self.addCleanup(setattr, polls.buffer, 'apply_vote_deltas', apply_vote_deltas)
+        polls.buffer.apply_vote_deltas = fail
+        self.assertRaises(DatabaseError, vote_buffer.flush)
+        self.assertEquals(vote_buffer.metrics()['depth'], 1)
+
+        polls.buffer.apply_vote_deltas = apply_vote_deltas
+        self.assertEquals(vote_buffer.flush(), 1)
+
+
+    def test_votes_for_ids_no_row_could_have_are_dropped(self):
+        poll, (choice,) = _poll_with_choices('42')
+        vote_buffer = VoteBuffer(MemoryVoteStore(), flush_interval=3600)
+        vote_buffer.add(poll.id, 10 ** 20)
+        vote_buffer.add(10 ** 20, choice.id)
+        vote_buffer.add(poll.id, choice.id)
+
+        self.assertEquals(vote_buffer.flush(), 1)
+        self.assertEquals(vote_buffer.metrics()['depth'], 0)
+        self.assertEquals(Choice.objects.get(pk=choice.id).votes, 1)
+
+
+
+class SpoolVoteStoreTest(TestCase):
+
+    def setUp(self):
+        self.spool_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.spool_dir)
+
+
+    def test_journals_votes_until_they_are_committed(self):
+        store = SpoolVoteStore(self.spool_dir)
+        store.add(1, 2)
+        store.add(1, 2)
+        store.add(1, 3)
+        self.assertEquals(read_spool(store.path), {(1, 2): 2, (1, 3): 1})
+
+        deltas, token = store.take()
+        self.assertEquals(deltas, {(1, 2): 2, (1, 3): 1})
+        self.assertEquals(read_spool(token), deltas)
+
+        store.commit(token)
+        self.assertEquals(os.listdir(self.spool_dir), [])
+
+
+    def test_spools_from_dead_processes_are_orphans(self):
+        dead = subprocess.Popen(['true'])
+        dead.wait()
+        orphan = os.path.join(self.spool_dir, 'votes-%d.spool' % (dead.pid,))
+        open(orphan, 'w').write('1 2\n')
+        SpoolVoteStore(self.spool_dir).add(1, 2)
+
+        self.assertEquals(orphaned_spools(self.spool_dir), [orphan])
+
+
+    def test_drain_command_replays_orphaned_spools(self):
+        poll, (choice,) = _poll_with_choices('42')
+        dead = subprocess.Popen(['true'])
+        dead.wait()
+        orphan = os.path.join(self.spool_dir, 'votes-%d.spool' % (dead.pid,))
+        open(orphan, 'w').write('%d %d\n' % (poll.id, choice.id) * 3)
+
+        config = {'FLUSH_INTERVAL': 3600, 'SPOOL_DIR': self.spool_dir}
+        with override_settings(POLLS_VOTE_BUFFER=config):
+            get_vote_buffer().add(poll.id, choice.id)
+            call_command('drain_vote_buffer', stdout=StringIO())
+
+        self.assertEquals(Choice.objects.get(pk=choice.id).votes, 4)
+        self.assertEquals(os.listdir(self.spool_dir), [])
+
+
+    def test_drain_command_needs_a_spool_to_drain(self):
+        # handle(), as call_command turns errors into sys.exit
+        drain = DrainCommand()
+        self.assertRaises(CommandError, drain.handle)
+        with override_settings(POLLS_VOTE_BUFFER={'FLUSH_INTERVAL': 3600}):
+            self.assertRaises(CommandError, drain.handle)
+
+
+
+@override_settings(POLLS_VOTE_BUFFER={'FLUSH_INTERVAL': 3600})
+class BufferedVotingViewTest(TestCase):
+
+    def test_votes_are_buffered_instead_of_written(self):
+        poll, (choice,) = _poll_with_choices('42')
+        poll_url = '/poll/%d/' % (poll.id,)
+
+        response = self.client.post(poll_url, data={'vote': str(choice.id)})
+
+        self.assertRedirects(response, poll_url)
+        self.assertEquals(Choice.objects.get(pk=choice.id).votes, 0)
+
+        get_vote_buffer().flush()
+        self.assertEquals(Choice.objects.get(pk=choice.id).votes, 1)
+
+
+    def test_ids_no_row_could_have_are_refused_before_buffering(self):
+        poll, (choice,) = _poll_with_choices('42')
+        poll_url = '/poll/%d/' % (poll.id,)
+
+        response = self.client.post(poll_url, data={'vote': '9' * 20})
+        self.assertEquals(response.status_code, 404)
+        response = self.client.post('/poll/%s/' % ('9' * 20,), data={'vote': str(choice.id)})
+        self.assertEquals(response.status_code, 404)
+        self.assertEquals(get_vote_buffer().metrics()['depth'], 0)
@@ -0,0 +1,139 @@
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+from polls.cache import DjangoResultsCache, LRUResultsCache, get_results_cache
+from polls.models import Choice, Poll
+from polls.services import apply_vote_deltas, record_vote
+
+
+
+class LRUResultsCacheTest(TestCase):
+
+    def test_renders_once_until_the_version_is_bumped(self):
+        cache = LRUResultsCache()
+        renders = []
+        def render():
+            renders.append(1)
+            return 'results %d' % (len(renders),)
+
+        self.assertEquals(cache.get_or_render(1, render), 'results 1')
+        self.assertEquals(cache.get_or_render(1, render), 'results 1')
+        self.assertEquals(cache.get_or_render(2, render), 'results 2')
+
+        cache.bump(1)
+        self.assertEquals(cache.get_or_render(1, render), 'results 3')
+        self.assertEquals(cache.get_or_render(2, render), 'results 2')
+        self.assertEquals(cache.stats(), {'hits': 2, 'misses': 3})
+
+
+    def test_holds_at_most_max_entries_fragments(self):
+        cache = LRUResultsCache(max_entries=2)
+        for poll_id in (1, 2, 3):
+            cache.get_or_render(poll_id, lambda: 'html')
+        # 1 was the least recently used
+        self.assertEquals(len(cache.fragments), 2)
+        cache.get_or_render(1, lambda: 'html')
+        self.assertEquals(cache.stats(), {'hits': 0, 'misses': 4})
+
+
+    def test_evicted_versions_are_never_reused(self):
+        cache = LRUResultsCache(max_entries=1)
+        cache.get_or_render(1, lambda: 'old')
+        cache.version(2)  # pushes poll 1's version out, but not its fragment
+
+        self.assertEquals(cache.get_or_render(1, lambda: 'new'), 'new')
+
+
+
+class DjangoResultsCacheTest(TestCase):
+
+    def test_renders_once_until_the_version_is_bumped(self):
+        cache = DjangoResultsCache()
+        cache.cache.clear()
+
+        self.assertEquals(cache.get_or_render(1, lambda: 'old'), 'old')
+        self.assertEquals(cache.get_or_render(1, lambda: 'new'), 'old')
+        cache.bump(1)
+        self.assertEquals(cache.get_or_render(1, lambda: 'new'), 'new')
+        cache.bump(5)  # never cached, so nothing to do
+        self.assertEquals(cache.stats(), {'hits': 1, 'misses': 2})
+
+
+
+@override_settings(POLLS_RESULTS_CACHE={'BACKEND': 'lru'})
+class CachedResultsViewTest(TestCase):
+
+    def setUp(self):
+        self.poll = Poll(question='6 times 7', pub_date=timezone.now())
+        self.poll.save()
+        self.choice1 = Choice(poll=self.poll, choice='42', votes=1)
+        self.choice1.save()
+        self.choice2 = Choice(poll=self.poll, choice='The Ultimate Answer', votes=3)
+        self.choice2.save()
+        self.poll_url = '/poll/%d/' % (self.poll.id,)
+
+
+    def test_cached_results_skip_the_choices_query(self):
+        with self.assertNumQueries(2):
+            self.client.get(self.poll_url)
+        # the poll, and the choices for the form
+        with self.assertNumQueries(2):
+            response = self.client.get(self.poll_url)
+        self.assertIn('75 %: The Ultimate Answer', response.content)
+        self.assertEquals(get_results_cache().stats(), {'hits': 1, 'misses': 1})
+
+
+    @override_settings(POLLS_CHOICE_CACHE={'CACHE': 'default'})
+    def test_with_cached_choices_a_page_is_one_query(self):
+        self.client.get(self.poll_url)
+        # just the poll
+        with self.assertNumQueries(1):
+            response = self.client.get(self.poll_url)
+        self.assertIn('value="%d"' % (self.choice2.id,), response.content)
+
+
+    @override_settings(POLLS_CHOICE_CACHE={'CACHE': 'default'})
+    def test_with_cached_choices_bad_votes_never_reach_the_database(self):
+        self.client.get(self.poll_url)
+        with self.assertNumQueries(0):
+            response = self.client.post(self.poll_url, data={'vote': '999'})
+        self.assertEquals(response.status_code, 404)
+
+        with self.assertNumQueries(2):
+            self.client.post(self.poll_url, data={'vote': str(self.choice1.id)})
+        self.assertEquals(Choice.objects.get(pk=self.choice1.id).votes, 2)
+
+
+    def test_votes_invalidate_the_cached_results(self):
+        self.client.get(self.poll_url)
+
+        self.client.post(self.poll_url, data={'vote': str(self.choice1.id)})
+        response = self.client.get(self.poll_url)
+        self.assertIn('40 %: 42', response.content)
+
+        apply_vote_deltas({(self.poll.id, self.choice1.id): 5})
+        response = self.client.get(self.poll_url)
+        self.assertIn('70 %: 42', response.content)
+
+
+    def test_votes_only_invalidate_their_own_poll(self):
+        other_poll = Poll(question='time', pub_date=timezone.now())
+        other_poll.save()
+        self.client.get(self.poll_url)
+        self.client.get('/poll/%d/' % (other_poll.id,))
+
+        record_vote(self.poll.id, self.choice1.id)
+
+        self.client.get(self.poll_url)
+        self.client.get('/poll/%d/' % (other_poll.id,))
+        self.assertEquals(get_results_cache().stats(), {'hits': 1, 'misses': 3})
+
+
+    def test_editing_choices_invalidates_the_cached_results(self):
+        self.client.get(self.poll_url)
+
+        self.choice2.choice = 'Forty-two'
+        self.choice2.save()
+
+        response = self.client.get(self.poll_url)
+        self.assertIn('75 %: Forty-two', response.content)
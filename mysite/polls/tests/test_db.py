@@ -0,0 +1,133 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+
+from django.core.signals import request_finished
+from django.db import close_connection, connection
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+from polls.db import (
+    ReplicaRouter, _recycle_connections, _tune_connection, reads_from_replica,
+    replica_reads, sync_sqlite_replica
+)
+from polls.models import Poll
+
+
+def _connected(func):
+    return any(ref() is func for _, ref in request_finished.receivers)
+
+
+
+@override_settings(POLLS_DATABASE={'REPLICAS': ('replica',)})
+class ReplicaRouterTest(TestCase):
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+
+
+    def test_reads_go_to_the_primary_unless_asked_for_replica_reads(self):
+        self.assertEquals(self.router.db_for_read(Poll), 'default')
+        with replica_reads():
+            self.assertEquals(self.router.db_for_read(Poll), 'replica')
+        self.assertEquals(self.router.db_for_read(Poll), 'default')
+
+
+    def test_writes_always_go_to_the_primary(self):
+        with replica_reads():
+            self.assertEquals(self.router.db_for_write(Poll), 'default')
+
+
+    def test_nothing_is_read_from_a_replica_without_replicas(self):
+        with override_settings(POLLS_DATABASE={}):
+            with replica_reads():
+                self.assertEquals(self.router.db_for_read(Poll), 'default')
+
+
+    def test_views_read_from_a_replica_for_gets_only(self):
+        @reads_from_replica
+        def view(request):
+            return self.router.db_for_read(Poll)
+
+        factory = RequestFactory()
+        self.assertEquals(view(factory.get('/')), 'replica')
+        self.assertEquals(view(factory.head('/')), 'replica')
+        self.assertEquals(view(factory.post('/')), 'default')
+
+
+    def test_replicas_are_not_synced(self):
+        self.assertEquals(self.router.allow_syncdb('replica', Poll), False)
+        self.assertEquals(self.router.allow_syncdb('default', Poll), None)
+
+
+
+class ConnectionTuningTest(TestCase):
+
+    def test_pragmas_are_run_on_new_connections(self):
+        connection.cursor()
+        with override_settings(POLLS_DATABASE={'PRAGMAS': (('cache_size', -1234),)}):
+            _tune_connection(sender=connection.__class__, connection=connection)
+        cursor = connection.cursor()
+        cursor.execute('PRAGMA cache_size')
+        self.assertEquals(cursor.fetchone()[0], -1234)
+
+
+    def test_persistent_connections_outlive_requests(self):
+        self.assertTrue(_connected(close_connection))
+        with override_settings(POLLS_DATABASE={'PERSISTENT': True}):
+            self.assertFalse(_connected(close_connection))
+            self.assertTrue(_connected(_recycle_connections))
+        self.assertTrue(_connected(close_connection))
+        self.assertFalse(_connected(_recycle_connections))
+
+
+
+class SyncReplicaTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.primary = os.path.join(self.directory, 'primary.sqlite')
+        self.replica = os.path.join(self.directory, 'replica.sqlite')
+        self.db = sqlite3.connect(self.primary)
+        self.addCleanup(self.db.close)
+        self.db.execute('CREATE TABLE poll (id integer PRIMARY KEY, question text)')
+        self.db.execute('CREATE INDEX poll_question ON poll (question)')
+        self.db.executemany(
+            'INSERT INTO poll VALUES (?, ?)', [(1, 'first'), (2, 'second')]
+        )
+        self.db.commit()
+
+
+    def read_replica(self, sql):
+        replica = sqlite3.connect(self.replica)
+        try:
+            return replica.execute(sql).fetchall()
+        finally:
+            replica.close()
+
+
+    def test_copies_tables_indexes_and_rows(self):
+        self.assertEquals(sync_sqlite_replica(self.primary, self.replica), 2)
+        self.assertEquals(
+            self.read_replica('SELECT * FROM poll ORDER BY id'),
+            [(1, 'first'), (2, 'second')]
+        )
+        self.assertEquals(
+            self.read_replica("SELECT name FROM sqlite_master WHERE type = 'index'"),
+            [('poll_question',)]
+        )
+
+
+    def test_later_syncs_catch_up_with_the_primary(self):
+        sync_sqlite_replica(self.primary, self.replica)
+        self.db.execute('DELETE FROM poll WHERE id = 1')
+        self.db.execute("INSERT INTO poll VALUES (3, 'third')")
+        self.db.commit()
+
+        sync_sqlite_replica(self.primary, self.replica)
+        self.assertEquals(
+            self.read_replica('SELECT * FROM poll ORDER BY id'),
+            [(2, 'second'), (3, 'third')]
+        )
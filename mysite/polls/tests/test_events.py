@@ -0,0 +1,147 @@
+import json
+
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+from polls.events import (
+    EventHub, EventStream, TooManyConnections, get_event_hub
+)
+from polls.models import Choice, Poll
+from polls.services import apply_vote_deltas, record_vote
+
+
+def parse_event(text):
+    event, data = text.strip().split('\n')
+    return event[len('event: '):], json.loads(data[len('data: '):])
+
+
+
+@override_settings(POLLS_EVENTS={'MAX_CONNECTIONS': 4})
+class EventStreamTest(TestCase):
+
+    def setUp(self):
+        self.poll = Poll(question='6 times 7', pub_date=timezone.now())
+        self.poll.save()
+        self.choice1 = Choice(poll=self.poll, choice='42', votes=1)
+        self.choice1.save()
+        self.choice2 = Choice(poll=self.poll, choice='The Ultimate Answer', votes=0)
+        self.choice2.save()
+        self.hub = get_event_hub()
+
+
+    def test_sends_a_snapshot_then_vote_increments(self):
+        stream = EventStream(self.hub, self.poll.id, keepalive=0.01, max_age=5)
+        events = iter(stream)
+
+        self.assertEquals(next(events), 'retry: 2000\n\n')
+        event, snapshot = parse_event(next(events))
+        self.assertEquals(event, 'snapshot')
+        self.assertEquals(snapshot['votes'], 1)
+        self.assertEquals(
+            [(c['choice'], c['votes']) for c in snapshot['choices']],
+            [('42', 1), ('The Ultimate Answer', 0)]
+        )
+
+        with self.assertNumQueries(0):
+            self.assertEquals(next(events), ': keepalive\n\n')
+
+        record_vote(self.poll.id, self.choice2.id)
+        self.assertEquals(
+            parse_event(next(events)),
+            ('votes', {'total': 1, 'choices': {str(self.choice2.id): 1}})
+        )
+        stream.close()
+        self.assertEquals(self.hub.stats(), {'connections': 0, 'channels': 0})
+
+
+    def test_slow_readers_get_votes_merged(self):
+        stream = EventStream(self.hub, self.poll.id, keepalive=0.01, max_age=5)
+        events = iter(stream)
+        next(events), next(events)
+
+        for _ in range(3):
+            record_vote(self.poll.id, self.choice1.id)
+        apply_vote_deltas({(self.poll.id, self.choice2.id): 5})
+
+        self.assertEquals(
+            parse_event(next(events)),
+            ('votes', {'total': 8, 'choices': {
+                str(self.choice1.id): 3, str(self.choice2.id): 5
+            }})
+        )
+        self.assertEquals(next(events), ': keepalive\n\n')
+        stream.close()
+
+
+    def test_watchers_of_a_poll_share_one_channel(self):
+        other = Poll(question='other', pub_date=timezone.now())
+        other.save()
+        streams = [EventStream(self.hub, self.poll.id) for _ in range(3)]
+        streams.append(EventStream(self.hub, other.id))
+        self.assertEquals(self.hub.stats(), {'connections': 4, 'channels': 2})
+
+        for stream in streams:
+            stream.close()
+            stream.close()
+        self.assertEquals(self.hub.stats(), {'connections': 0, 'channels': 0})
+
+
+    def test_refuses_streams_beyond_max_connections(self):
+        hub = EventHub(max_connections=1)
+        EventStream(hub, self.poll.id)
+        self.assertRaises(TooManyConnections, EventStream, hub, self.poll.id)
+
+
+
+class PollEventsViewTest(TestCase):
+
+    def setUp(self):
+        self.poll = Poll(question='6 times 7', pub_date=timezone.now())
+        self.poll.save()
+        Choice(poll=self.poll, choice='42', votes=2).save()
+
+
+    def test_are_off_by_default(self):
+        response = self.client.get('/poll/%d/' % (self.poll.id,))
+        self.assertNotIn('EventSource', response.content)
+        response = self.client.get('/poll/%d/events/' % (self.poll.id,))
+        self.assertEquals(response.status_code, 404)
+        self.assertEquals(get_event_hub().max_connections, 4)
+
+
+    @override_settings(POLLS_EVENTS={'MAX_AGE': 0})
+    def test_poll_page_follows_the_events_when_on(self):
+        response = self.client.get('/poll/%d/' % (self.poll.id,))
+        self.assertIn(
+            "new EventSource('/poll/%d/events/')" % (self.poll.id,), response.content
+        )
+
+
+    @override_settings(POLLS_EVENTS={'MAX_AGE': 0})
+    def test_streams_events_for_a_poll(self):
+        response = self.client.get('/poll/%d/events/' % (self.poll.id,))
+
+        self.assertEquals(response['Content-Type'], 'text/event-stream')
+        self.assertEquals(response['Cache-Control'], 'no-cache')
+        retry, snapshot = response.content.split('\n\n', 1)
+        self.assertEquals(parse_event(snapshot)[1]['votes'], 2)
+        self.assertEquals(get_event_hub().stats()['connections'], 0)
+
+
+    @override_settings(POLLS_EVENTS={'MAX_AGE': 0})
+    def test_404s_for_a_missing_poll(self):
+        for poll_id in (self.poll.id + 1, 2 ** 64):
+            response = self.client.get('/poll/%d/events/' % (poll_id,))
+            self.assertEquals(response.status_code, 404)
+        self.assertEquals(get_event_hub().stats()['connections'], 0)
+
+
+    @override_settings(POLLS_EVENTS={'MAX_CONNECTIONS': 1})
+    def test_503s_beyond_max_connections(self):
+        stream = EventStream(get_event_hub(), self.poll.id)
+        try:
+            response = self.client.get('/poll/%d/events/' % (self.poll.id,))
+        finally:
+            stream.close()
+        self.assertEquals(response.status_code, 503)
+        self.assertEquals(response['Retry-After'], '2')
@@ -0,0 +1,88 @@
+import json
+from StringIO import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from polls.export import export_lines
+from polls.models import Choice, Poll
+
+
+
+class ExportTest(TestCase):
+
+    def setUp(self):
+        self.poll1 = Poll(question=u'6 times 7 \u2013 really?', pub_date=timezone.now())
+        self.poll1.save()
+        self.choice1 = Choice(poll=self.poll1, choice='42', votes=3)
+        self.choice1.save()
+        self.choice2 = Choice(poll=self.poll1, choice='The Ultimate Answer', votes=1)
+        self.choice2.save()
+        self.poll2 = Poll(question='time', pub_date=timezone.now())
+        self.poll2.save()
+
+
+    def test_csv_has_a_row_per_choice(self):
+        rows = list(export_lines('csv'))
+
+        self.assertEquals(rows[0], 'poll_id,question,pub_date,poll_votes,'
+                                   'choice_id,choice,votes,percentage\r\n')
+        pub_date = self.poll1.pub_date.isoformat()
+        self.assertEquals(rows[1:], [
+            '%d,6 times 7 \xe2\x80\x93 really?,%s,4,%d,42,3,75.00\r\n'
+                % (self.poll1.id, pub_date, self.choice1.id),
+            '%d,6 times 7 \xe2\x80\x93 really?,%s,4,%d,The Ultimate Answer,1,25.00\r\n'
+                % (self.poll1.id, pub_date, self.choice2.id),
+            '%d,time,%s,0,,,,\r\n'
+                % (self.poll2.id, self.poll2.pub_date.isoformat()),
+        ])
+
+
+    def test_ndjson_has_a_line_per_poll(self):
+        polls = [json.loads(line) for line in export_lines('ndjson')]
+
+        self.assertEquals([p['id'] for p in polls], [self.poll1.id, self.poll2.id])
+        self.assertEquals(
+            [(c['choice'], c['percentage']) for c in polls[0]['choices']],
+            [('42', 75.0), ('The Ultimate Answer', 25.0)]
+        )
+        self.assertEquals(polls[1]['choices'], [])
+
+
+    def test_reads_a_chunk_of_polls_at_a_time(self):
+        for i in range(8):
+            Poll(question='poll %d' % (i,), pub_date=timezone.now()).save()
+
+        lines = export_lines('ndjson', chunk_size=4)
+        with self.assertNumQueries(0):
+            lines = iter(lines)
+        # ids, then polls, then choices, for the first chunk only
+        with self.assertNumQueries(3):
+            for _ in range(4):
+                next(lines)
+        # 10 polls is three chunks, plus one query to find there are no more
+        with self.assertNumQueries(3 * 2 + 1):
+            self.assertEquals(len(list(lines)), 6)
+
+
+    def test_command_writes_an_export(self):
+        out = StringIO()
+        call_command('export_polls', format='ndjson', stdout=out)
+        self.assertEquals(len(out.getvalue().splitlines()), 2)
+
+
+    def test_admin_exports_the_selected_polls(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'adm1n')
+        self.client.login(username='admin', password='adm1n')
+
+        response = self.client.post('/admin/polls/poll/', {
+            'action': 'export_as_csv',
+            '_selected_action': [self.poll2.id],
+        })
+
+        self.assertEquals(response['Content-Type'], 'text/csv')
+        self.assertEquals(
+            response['Content-Disposition'], 'attachment; filename=polls.csv'
+        )
+        self.assertEquals(len(response.content.splitlines()), 2)
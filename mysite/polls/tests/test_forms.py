@@ -1,5 +1,7 @@
+from polls.cache import cached_choice_labels, choice_labels
 from polls.forms import PollVoteForm
 from django.test import TestCase
+from django.test.utils import override_settings
 from django.utils import timezone
 from polls.models import Choice, Poll
 
@@ -56,3 +58,70 @@ class PollsVoteFormTest(TestCase):
         # by checking for the choice text
         self.assertIn(choice1.choice, response.content.replace('&#39;', "'"))
         self.assertIn(choice2.choice, response.content.replace('&#39;', "'"))
+
+
+    def test_form_can_use_choices_that_are_already_loaded(self):
+        poll = Poll(question='6 times 7', pub_date=timezone.now())
+        poll.save()
+        choice1 = Choice(poll=poll, choice='42', votes=0)
+        choice1.save()
+        choices = poll.results()
+
+        with self.assertNumQueries(0):
+            form = PollVoteForm(choices=choices)
+            form.as_p()
+            self.assertEquals(PollVoteForm(choices=[(7, 'PM')]).fields['vote'].choices, [(7, 'PM')])
+        self.assertEquals(form.fields['vote'].choices, [(choice1.id, '42')])
+
+
+    def test_form_validates_votes_without_the_database(self):
+        labels = [(3, '42'), (4, 'The Ultimate Answer')]
+        with self.assertNumQueries(0):
+            form = PollVoteForm(choices=labels, data={'vote': '4'})
+            self.assertTrue(form.is_valid())
+            self.assertEquals(form.cleaned_data['vote'], 4)
+            self.assertFalse(PollVoteForm(choices=labels, data={'vote': '5'}).is_valid())
+            self.assertFalse(PollVoteForm(choices=labels, data={}).is_valid())
+
+
+
+@override_settings(POLLS_CHOICE_CACHE={'CACHE': 'default'})
+class ChoiceLabelCacheTest(TestCase):
+
+    def setUp(self):
+        self.poll = Poll(question='6 times 7', pub_date=timezone.now())
+        self.poll.save()
+        self.choice1 = Choice(poll=self.poll, choice='42', votes=0)
+        self.choice1.save()
+
+
+    def test_labels_are_loaded_once(self):
+        with self.assertNumQueries(1):
+            self.assertEquals(choice_labels(self.poll.id), [(self.choice1.id, '42')])
+        with self.assertNumQueries(0):
+            self.assertEquals(choice_labels(self.poll.id), [(self.choice1.id, '42')])
+            self.assertEquals(
+                cached_choice_labels(self.poll.id), [(self.choice1.id, '42')]
+            )
+
+
+    def test_editing_choices_clears_the_cached_labels(self):
+        choice_labels(self.poll.id)
+        choice2 = Choice(poll=self.poll, choice='The Ultimate Answer', votes=0)
+        choice2.save()
+        self.assertEquals(
+            choice_labels(self.poll.id),
+            [(self.choice1.id, '42'), (choice2.id, 'The Ultimate Answer')]
+        )
+
+        self.choice1.choice = 'forty-two'
+        self.choice1.save()
+        self.assertEquals(choice_labels(self.poll.id)[0], (self.choice1.id, 'forty-two'))
+
+        choice2.delete()
+        self.assertEquals(choice_labels(self.poll.id), [(self.choice1.id, 'forty-two')])
+
+
+    def test_cached_labels_are_off_by_default(self):
+        with override_settings(POLLS_CHOICE_CACHE=None):
+            self.assertEquals(cached_choice_labels(self.poll.id), None)
@@ -0,0 +1,171 @@
+from django.test import TestCase
+from django.test.client import Client
+from django.test.utils import override_settings
+from django.utils import timezone
+from polls.guard import (
+    BloomFilter, LRUSet, RotatingBloomFilter, capacity_for_memory, voter_digest
+)
+from polls.models import Choice, Poll, VoteRecord
+
+
+def digests(prefix, count):
+    return [voter_digest(1, '%s %d' % (prefix, i)) for i in range(count)]
+
+
+
+class BloomFilterTest(TestCase):
+
+    def test_remembers_everything_added(self):
+        bloom = BloomFilter.for_capacity(1000, 0.01)
+        added = digests('voter', 1000)
+        for digest in added:
+            bloom.add(digest)
+        self.assertTrue(all(digest in bloom for digest in added))
+
+
+    def test_false_positives_stay_near_the_error_rate(self):
+        bloom = BloomFilter.for_capacity(2000, 0.01)
+        for digest in digests('voter', 2000):
+            bloom.add(digest)
+        mistaken = sum(1 for digest in digests('stranger', 2000) if digest in bloom)
+        self.assertTrue(mistaken < 2000 * 0.02)
+
+
+    def test_rotates_once_full(self):
+        seen = RotatingBloomFilter(capacity=10)
+        first = digests('first', 10)
+        for digest in first:
+            self.assertFalse(seen.check_and_add(digest))
+        self.assertTrue(seen.check_and_add(first[0]))
+
+        seen.check_and_add(voter_digest(1, 'eleventh'))
+        self.assertEquals(seen.current.count, 1)
+        self.assertEquals(seen.previous.count, 10)
+        self.assertTrue(all(digest in seen for digest in first))
+
+
+    def test_can_be_sized_by_memory(self):
+        capacity = capacity_for_memory(64 * 1024, 0.0005)
+        seen = RotatingBloomFilter(capacity, 0.001)
+        self.assertTrue(60 * 1024 < seen.memory <= 65 * 1024)
+
+
+
+class LRUSetTest(TestCase):
+
+    def test_forgets_the_least_recently_added(self):
+        seen = LRUSet(max_entries=2)
+        first, second, third = digests('voter', 3)
+        seen.check_and_add(first)
+        seen.check_and_add(second)
+        seen.check_and_add(third)
+        self.assertFalse(first in seen)
+        self.assertTrue(second in seen)
+        self.assertTrue(third in seen)
+
+
+    def test_entries_expire(self):
+        seen = LRUSet(ttl=0)
+        self.assertFalse(seen.check_and_add(voter_digest(1, 'voter')))
+        self.assertFalse(seen.check_and_add(voter_digest(1, 'voter')))
+
+
+
+class VoteGuardViewTest(TestCase):
+
+    def setUp(self):
+        self.poll = Poll(question='6 times 7', pub_date=timezone.now())
+        self.poll.save()
+        self.choice = Choice(poll=self.poll, choice='42')
+        self.choice.save()
+        self.url = '/poll/%d/' % (self.poll.id,)
+
+
+    def vote(self, client=None, choice_id=None):
+        return (client or self.client).post(
+            self.url, {'vote': str(choice_id or self.choice.id)}
+        )
+
+
+    def votes(self):
+        return Choice.objects.get(pk=self.choice.id).votes
+
+
+    def test_votes_are_unguarded_by_default(self):
+        self.vote()
+        self.vote()
+        self.assertEquals(self.votes(), 2)
+
+
+    @override_settings(POLLS_VOTE_GUARD={'KEY': 'cookie'})
+    def test_each_voter_cookie_votes_once_per_poll(self):
+        response = self.client.get(self.url)
+        self.assertIn('polls_voter', response.cookies)
+        self.assertNotIn('polls_voter', self.client.get(self.url).cookies)
+
+        self.assertRedirects(self.vote(), self.url)
+        response = self.vote()
+        self.assertEquals(response.status_code, 403)
+        self.assertEquals(self.votes(), 1)
+
+        other = Client()
+        other.get(self.url)
+        self.vote(client=other)
+        self.assertEquals(self.votes(), 2)
+
+
+    @override_settings(POLLS_VOTE_GUARD={'KEY': 'cookie'})
+    def test_votes_without_the_cookie_are_keyed_by_ip_address(self):
+        self.assertRedirects(self.vote(client=Client()), self.url)
+        response = self.vote(client=Client())
+        self.assertEquals(response.status_code, 403)
+        self.assertEquals(self.votes(), 1)
+
+
+    @override_settings(POLLS_VOTE_GUARD={'KEY': 'cookie'})
+    def test_made_up_cookies_are_keyed_by_ip_address(self):
+        for voter in ('made up', 'made up too'):
+            client = Client()
+            client.cookies['polls_voter'] = voter
+            self.vote(client=client)
+        self.assertEquals(self.votes(), 1)
+
+        # and get a real one with the poll page
+        self.assertIn('polls_voter', client.get(self.url).cookies)
+
+
+    @override_settings(POLLS_VOTE_GUARD={'KEY': 'ip', 'BACKEND': 'lru'})
+    def test_voters_can_be_keyed_by_ip_address(self):
+        self.vote()
+        response = self.vote(client=Client())
+        self.assertEquals(response.status_code, 403)
+        self.assertEquals(self.votes(), 1)
+
+
+    @override_settings(POLLS_VOTE_GUARD={'KEY': 'ip'})
+    def test_the_guard_doesnt_add_queries(self):
+        with self.assertNumQueries(2):
+            self.vote()
+
+
+    @override_settings(POLLS_VOTE_GUARD={'KEY': 'ip', 'PERSISTENT': True})
+    def test_persistent_guards_outlast_the_process_memory(self):
+        self.vote()
+        self.assertEquals(VoteRecord.objects.filter(poll=self.poll).count(), 1)
+
+        # as if another process: changing the setting starts a new guard,
+        # with nothing in memory
+        with override_settings(POLLS_VOTE_GUARD={'KEY': 'ip', 'PERSISTENT': True}):
+            response = self.vote()
+        self.assertEquals(response.status_code, 403)
+        self.assertEquals(self.votes(), 1)
+
+
+    @override_settings(POLLS_VOTE_GUARD={'KEY': 'ip', 'PERSISTENT': True})
+    def test_votes_that_fail_dont_use_up_the_voters_vote(self):
+        response = self.vote(choice_id=self.choice.id + 1000)
+        self.assertEquals(response.status_code, 404)
+        self.assertEquals(VoteRecord.objects.count(), 0)
+
+        self.assertRedirects(self.vote(), self.url)
+        self.assertEquals(self.votes(), 1)
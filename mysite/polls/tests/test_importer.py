@@ -0,0 +1,181 @@
+import json
+import os
+import shutil
+import tempfile
+from StringIO import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+import polls.importer
+from polls.export import export_lines
+from polls.importer import (
+    import_polls, read_csv, read_json_array, read_ndjson
+)
+from polls.models import Choice, Poll
+
+
+NDJSON = '\n'.join([
+    '{"question": "6 times 7", "pub_date": "2012-06-01T09:00:00Z",'
+    ' "choices": ["42", {"choice": "The Ultimate Answer", "votes": 3}]}',
+    '{"question": "time", "choices": [{"choice": "PM", "votes": 1}]}',
+    '{"question": "torn line", "cho',
+    '{"choices": ["no question"]}',
+    '{"question": "negative", "choices": [{"choice": "x", "votes": -1}]}',
+    '',
+    '{"question": "no choices yet"}',
+])
+
+
+def polls_and_choices():
+    return [
+        (poll.question, poll.votes,
+         [(c.choice, c.votes) for c in poll.choice_set.order_by('id')])
+        for poll in Poll.objects.order_by('id')
+    ]
+
+
+
+class ImportPollsTest(TestCase):
+
+    def test_imports_good_records_and_rejects_bad_ones(self):
+        rejects = []
+        stats = import_polls(
+            read_ndjson(StringIO(NDJSON)), batch_size=2,
+            reject=lambda position, record, reason: rejects.append((position, reason)),
+        )
+
+        self.assertEquals(polls_and_choices(), [
+            ('6 times 7', 3, [('42', 0), ('The Ultimate Answer', 3)]),
+            ('time', 1, [('PM', 1)]),
+            ('no choices yet', 0, []),
+        ])
+        self.assertEquals(
+            Poll.objects.order_by('id')[0].pub_date.isoformat(),
+            '2012-06-01T09:00:00+00:00'
+        )
+        self.assertEquals((stats.polls, stats.choices, stats.rejected), (3, 3, 3))
+        self.assertEquals([position for position, _ in rejects], [3, 4, 5])
+        self.assertTrue(rejects[1][1].startswith('question must be'))
+
+
+    def test_rejects_vote_counts_too_big_for_the_database(self):
+        rejects = []
+        stats = import_polls(
+            read_csv(StringIO(
+                'question,pub_date,choice,votes\n'
+                'big,,a,2147483647\n'
+                'bigger,,a,2147483648\n'
+                'too big in all,,a,2147483647\n'
+                'too big in all,,b,1\n'
+            )),
+            reject=lambda position, record, reason: rejects.append((position, reason)),
+        )
+
+        self.assertEquals(polls_and_choices(), [('big', 2 ** 31 - 1, [('a', 2 ** 31 - 1)])])
+        self.assertEquals(stats.rejected, 2)
+        self.assertEquals(rejects, [
+            (3, 'bad vote count: 2147483648'),
+            (4, 'too many votes in all: 2147483648'),
+        ])
+
+
+    def test_rejects_csv_rows_that_arent_utf8(self):
+        rejects = []
+        stats = import_polls(
+            read_csv(StringIO(
+                'question,pub_date,choice,votes\n'
+                'caf\xc3\xa9,,yes,1\n'
+                'caf\xe9,,no,2\n'
+                'caf\xc3\xa9,,no,\n'
+                'tea,,\xff,3\n'
+            )),
+            reject=lambda position, record, reason: rejects.append((position, reason)),
+        )
+
+        self.assertEquals(
+            polls_and_choices(), [(u'caf\xe9', 1, [('yes', 1), ('no', 0)])]
+        )
+        self.assertEquals(stats.rejected, 2)
+        self.assertEquals([position for position, _ in rejects], [3, 5])
+        self.assertTrue(rejects[0][1].startswith('not UTF-8'))
+
+
+    def test_inserts_a_batch_at_a_time(self):
+        records = [
+            (i, {'question': 'poll %d' % (i,), 'choices': ['a', 'b']})
+            for i in range(10)
+        ]
+        # per batch: the highest id, then one INSERT each of polls and choices
+        with self.assertNumQueries(5 * 3):
+            import_polls(records, batch_size=2)
+
+        self.assertEquals(Choice.objects.filter(poll__question='poll 7').count(), 2)
+        # the id sequence has moved past the ids the import handed out
+        Poll(question='made later', pub_date=timezone.now()).save()
+        self.assertEquals(Poll.objects.count(), 11)
+
+
+    def test_reads_a_json_array_a_piece_at_a_time(self):
+        self.addCleanup(setattr, polls.importer, 'READ_SIZE', polls.importer.READ_SIZE)
+        polls.importer.READ_SIZE = 7
+        stream = StringIO(
+            ' [ {"question": "one", "choices": ["a"]},\n'
+            '   "not a poll", {"question": "two"} ]'
+        )
+        self.assertEquals(list(read_json_array(stream)), [
+            (1, {'question': 'one', 'choices': ['a']}),
+            (2, 'not a poll'),
+            (3, {'question': 'two'}),
+        ])
+
+
+    def test_imports_its_own_csv_export(self):
+        poll = Poll(question='6 times 7', pub_date=timezone.now())
+        poll.save()
+        Choice(poll=poll, choice='42', votes=5).save()
+        Choice(poll=poll, choice='The Ultimate Answer', votes=1).save()
+        Poll(question='time', pub_date=timezone.now()).save()
+        exported = ''.join(export_lines('csv'))
+        before = polls_and_choices()
+
+        stats = import_polls(read_csv(StringIO(exported)))
+
+        self.assertEquals(stats.polls, 2)
+        self.assertEquals(polls_and_choices(), before + before)
+
+
+
+class ImportPollsCommandTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+
+    def test_imports_a_file_and_writes_rejects(self):
+        path = os.path.join(self.directory, 'polls.ndjson')
+        with open(path, 'w') as f:
+            f.write(NDJSON)
+        out = StringIO()
+
+        call_command('import_polls', path, stdout=out)
+
+        self.assertEquals(Poll.objects.count(), 3)
+        self.assertIn('Imported 3 polls and 3 choices', out.getvalue())
+        self.assertIn('Skipped 3 records', out.getvalue())
+        with open(path + '.rejects') as f:
+            rejected = [json.loads(line) for line in f]
+        self.assertEquals([r['position'] for r in rejected], [3, 4, 5])
+        self.assertEquals(rejected[2]['record']['question'], 'negative')
+
+
+    def test_writes_no_rejects_file_when_nothing_is_rejected(self):
+        path = os.path.join(self.directory, 'polls.ndjson')
+        with open(path, 'w') as f:
+            f.write('{"question": "fine"}\n')
+
+        call_command('import_polls', path, stdout=StringIO())
+
+        self.assertEquals(Poll.objects.count(), 1)
+        self.assertFalse(os.path.exists(path + '.rejects'))
@@ -1,6 +1,11 @@
+from StringIO import StringIO
+
+from django.core.management import call_command
 from django.test import TestCase
+from django.test.utils import override_settings
 from django.utils import timezone
 from polls.models import Choice, Poll
+from polls.services import record_vote
 
 class PollModelTest(TestCase):
     def test_creating_a_new_poll_and_saving_it_to_the_database(self):
@@ -53,6 +58,88 @@ class PollModelTest(TestCase):
         self.assertEquals(p.total_votes(), 1022)
 
 
+    def test_total_votes_are_stored_on_the_poll(self):
+        p = Poll(question='where', pub_date=timezone.now())
+        p.save()
+        c1 = Choice(poll=p, choice='here', votes=3)
+        c1.save()
+        c2 = Choice(poll=p, choice='there', votes=0)
+        c2.save()
+
+        p = Poll.objects.get(pk=p.id)
+        with self.assertNumQueries(0):
+            self.assertEquals(p.total_votes(), 3)
+
+        # editing a choice's votes moves the total...
+        c2 = Choice.objects.get(pk=c2.id)
+        c2.votes = 5
+        c2.save()
+        self.assertEquals(Poll.objects.get(pk=p.id).votes, 8)
+
+        # ...and so does deleting it
+        c1.delete()
+        self.assertEquals(Poll.objects.get(pk=p.id).votes, 5)
+
+
+    def test_saving_a_stale_poll_keeps_the_votes_cast_since_it_was_loaded(self):
+        p = Poll(question='where', pub_date=timezone.now())
+        p.save()
+        c = Choice(poll=p, choice='here')
+        c.save()
+
+        stale = Poll.objects.get(pk=p.id)
+        record_vote(p.id, c.id)
+        record_vote(p.id, c.id)
+        stale.question = 'where now'
+        stale.save()
+
+        p = Poll.objects.get(pk=p.id)
+        self.assertEquals(p.question, 'where now')
+        self.assertEquals(p.votes, 2)
+        self.assertEquals(stale.votes, 0)
+
+
+    def test_repair_command_fixes_drifted_totals(self):
+        p1 = Poll(question='where', pub_date=timezone.now())
+        p1.save()
+        Choice(poll=p1, choice='here', votes=3).save()
+        p2 = Poll(question='when', pub_date=timezone.now())
+        p2.save()
+        Choice(poll=p2, choice='now', votes=2).save()
+        Choice.objects.filter(poll=p2).update(votes=7)
+        Poll.objects.filter(pk=p1.id).update(votes=0)
+
+        self.assertEquals(
+            list(Poll.objects.drifted().order_by('id').values_list(
+                'id', 'votes', 'vote_total'
+            )),
+            [(p1.id, 0, 3), (p2.id, 2, 7)]
+        )
+        output = StringIO()
+        call_command('repair_poll_totals', stdout=output)
+
+        self.assertIn('2 polls repaired, 8 votes of drift', output.getvalue())
+        self.assertEquals(Poll.objects.get(pk=p1.id).votes, 3)
+        self.assertEquals(Poll.objects.get(pk=p2.id).votes, 7)
+        self.assertEquals(Poll.objects.drifted().count(), 0)
+
+
+    def test_results_work_out_totals_and_percentages_in_one_query(self):
+        poll = Poll(question='who?', pub_date=timezone.now())
+        poll.save()
+        Choice(poll=poll, choice='me', votes=2).save()
+        Choice(poll=poll, choice='you', votes=1).save()
+
+        poll = Poll.objects.get(pk=poll.id)
+        with self.assertNumQueries(1):
+            choices = poll.results()
+            self.assertEquals(poll.total_votes(), 3)
+            self.assertEquals(
+                [(c.choice, c.percentage()) for c in choices],
+                [('me', 100 * 2 / 3.0), ('you', 100 * 1 / 3.0)]
+            )
+
+
 
 class ChoiceModelTest(TestCase):
 
@@ -113,3 +200,60 @@ class ChoiceModelTest(TestCase):
         choice2.save()
         self.assertEquals(choice1.percentage(), 0)
         self.assertEquals(choice2.percentage(), 0)
+
+
+
+class VoteAggregationTest(TestCase):
+
+    def setUp(self):
+        self.poll1 = Poll(question='who?', pub_date=timezone.now())
+        self.poll1.save()
+        self.choice1 = Choice(poll=self.poll1, choice='me', votes=2)
+        self.choice1.save()
+        self.choice2 = Choice(poll=self.poll1, choice='you', votes=1)
+        self.choice2.save()
+        self.poll2 = Poll(question='what?', pub_date=timezone.now())
+        self.poll2.save()
+        Choice(poll=self.poll2, choice='that', votes=0).save()
+        self.poll3 = Poll(question='no choices yet', pub_date=timezone.now())
+        self.poll3.save()
+
+
+    def test_polls_can_be_annotated_with_their_totals_in_one_query(self):
+        with self.assertNumQueries(1):
+            polls = list(Poll.objects.with_totals().order_by('id'))
+            self.assertEquals([p.total_votes() for p in polls], [3, 0, 0])
+
+
+    def test_choices_can_be_annotated_with_their_percentages(self):
+        with self.assertNumQueries(1):
+            choices = list(Choice.objects.with_percentages().order_by('id'))
+            self.assertEquals(
+                [c.percentage() for c in choices],
+                [100 * 2 / 3.0, 100 * 1 / 3.0, 0]
+            )
+
+
+    def test_related_managers_get_the_annotations_too(self):
+        choices = self.poll1.choice_set.with_percentages().order_by('id')
+        self.assertEquals(
+            [c.percentage() for c in choices], [100 * 2 / 3.0, 100 * 1 / 3.0]
+        )
+
+
+    @override_settings(POLLS_VOTE_SHARDS=4)
+    def test_annotations_include_sharded_votes(self):
+        for _ in range(3):
+            record_vote(self.poll1.id, self.choice2.id)
+
+        with self.assertNumQueries(1):
+            polls = list(Poll.objects.with_totals().order_by('id'))
+            self.assertEquals([p.total_votes() for p in polls], [6, 0, 0])
+
+        with self.assertNumQueries(1):
+            choices = list(self.poll1.choice_set.with_percentages().order_by('id'))
+            self.assertEquals([c.vote_count() for c in choices], [2, 4])
+            self.assertEquals(
+                [c.percentage() for c in choices],
+                [100 * 2 / 6.0, 100 * 4 / 6.0]
+            )
@@ -0,0 +1,105 @@
+import json
+import logging
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+from polls.models import Choice, Poll
+from polls.performance import PerformanceStats
+
+
+class RecordingHandler(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(json.loads(record.getMessage()))
+
+
+
+@override_settings(
+    MIDDLEWARE_CLASSES=('polls.performance.PerformanceMiddleware',)
+        + settings.MIDDLEWARE_CLASSES,
+    POLLS_PERFORMANCE={},
+)
+class PerformanceMiddlewareTest(TestCase):
+
+    def setUp(self):
+        self.poll = Poll(question='6 times 7', pub_date=timezone.now())
+        self.poll.save()
+        Choice(poll=self.poll, choice='42', votes=1).save()
+        self.poll_url = '/poll/%d/' % (self.poll.id,)
+
+        self.log = RecordingHandler()
+        logger = logging.getLogger('polls.performance')
+        old_level = logger.level
+        logger.setLevel(logging.INFO)
+        logger.addHandler(self.log)
+        self.addCleanup(logger.setLevel, old_level)
+        self.addCleanup(logger.removeHandler, self.log)
+
+
+    def test_sends_server_timing_headers(self):
+        response = self.client.get(self.poll_url)
+        timing = response['Server-Timing']
+        self.assertTrue(timing.startswith('total;dur='))
+        self.assertIn('db;dur=', timing)
+        self.assertIn('desc="2 queries"', timing)
+        self.assertIn('tpl;dur=', timing)
+
+
+    def test_logs_a_line_per_request(self):
+        response = self.client.get(self.poll_url)
+
+        [line] = self.log.records
+        self.assertEquals(line['view'], 'polls.views.poll')
+        self.assertEquals(line['path'], self.poll_url)
+        self.assertEquals(line['status'], 200)
+        self.assertEquals(line['db_queries'], 2)
+        self.assertEquals(line['bytes'], len(response.content))
+        self.assertTrue(0 < line['template_ms'] <= line['ms'])
+
+
+    def test_staff_can_see_percentiles_per_view(self):
+        for _ in range(3):
+            self.client.get(self.poll_url)
+        self.client.get('/')
+
+        response = self.client.get('/performance/')
+        self.assertNotEquals(response['Content-Type'], 'application/json')
+
+        User.objects.create_superuser('admin', 'admin@example.com', 'adm1n')
+        self.client.login(username='admin', password='adm1n')
+        views = json.loads(self.client.get('/performance/').content)['views']
+
+        self.assertEquals(views['polls.views.poll']['requests'], 3)
+        self.assertEquals(views['polls.views.home']['requests'], 1)
+        self.assertEquals(
+            sorted(views['polls.views.home'].keys()),
+            ['p50_ms', 'p95_ms', 'p99_ms', 'requests']
+        )
+
+
+
+class PerformanceStatsTest(TestCase):
+
+    def test_works_out_percentiles(self):
+        stats = PerformanceStats()
+        for ms in range(100, 0, -1):
+            stats.add('view', ms)
+        self.assertEquals(stats.percentiles(), {'view': {
+            'requests': 100, 'p50_ms': 50, 'p95_ms': 95, 'p99_ms': 99,
+        }})
+
+
+    def test_keeps_a_rolling_window(self):
+        stats = PerformanceStats(window=10)
+        for ms in range(1, 101):
+            stats.add('view', ms)
+        figures = stats.percentiles()['view']
+        self.assertEquals(figures['requests'], 100)
+        self.assertEquals(figures['p50_ms'], 95)
@@ -0,0 +1,96 @@
+from django.core.cache import get_cache
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+from polls.models import Choice, Poll
+from polls.ratelimit import CacheBucketStore, MemoryBucketStore, parse_rate
+
+
+class BucketStoreTest(TestCase):
+
+    def check_store(self, store):
+        limits = [('client', 3, 60)]
+        for _ in range(3):
+            self.assertEquals(store.take(limits, now=1000), 0)
+        self.assertEquals(store.take(limits, now=1000), 20)
+        self.assertEquals(store.take(limits, now=1010), 10)
+        self.assertEquals(store.take(limits, now=1020), 0)
+        self.assertEquals(store.take(limits, now=1020), 20)
+
+
+    def test_memory_buckets_refill_at_the_rate(self):
+        self.check_store(MemoryBucketStore())
+
+
+    def test_cache_buckets_refill_at_the_rate(self):
+        self.check_store(CacheBucketStore(get_cache(
+            'django.core.cache.backends.locmem.LocMemCache', LOCATION='ratelimit-test'
+        )))
+
+
+    def test_takes_from_every_bucket_or_none(self):
+        store = MemoryBucketStore()
+        store.take([('poll', 1, 60)], now=1000)
+        self.assertEquals(store.take([('client', 1, 60), ('poll', 1, 60)], now=1000), 60)
+        self.assertEquals(store.take([('client', 1, 60)], now=1000), 0)
+
+
+    def test_keeps_a_bounded_number_of_buckets(self):
+        store = MemoryBucketStore(max_buckets=2)
+        for client in ('a', 'b', 'c'):
+            store.take([(client, 1, 60)], now=1000)
+        self.assertEquals(list(store.buckets), ['b', 'c'])
+        # a forgotten bucket is a full one
+        self.assertEquals(store.take([('a', 1, 60)], now=1000), 0)
+
+
+    def test_parses_rates(self):
+        self.assertEquals(parse_rate('10/minute'), (10, 60))
+        self.assertEquals(parse_rate('5/s'), (5, 1))
+        self.assertRaises(ValueError, parse_rate, '5/fortnight')
+        self.assertRaises(ValueError, parse_rate, 'lots')
+
+
+
+class RateLimitedViewTest(TestCase):
+
+    def setUp(self):
+        self.poll = Poll(question='6 times 7', pub_date=timezone.now())
+        self.poll.save()
+        self.choice = Choice(poll=self.poll, choice='42')
+        self.choice.save()
+        self.url = '/poll/%d/' % (self.poll.id,)
+
+
+    def vote(self):
+        return self.client.post(self.url, {'vote': str(self.choice.id)})
+
+
+    @override_settings(POLLS_RATE_LIMITS={'LIMITS': {'vote': {'CLIENT': '2/minute'}}})
+    def test_votes_over_the_limit_are_429s_without_queries(self):
+        self.assertRedirects(self.vote(), self.url)
+        self.assertRedirects(self.vote(), self.url)
+
+        with self.assertNumQueries(0):
+            response = self.vote()
+        self.assertEquals(response.status_code, 429)
+        self.assertEquals(response['Retry-After'], '30')
+        self.assertEquals(Choice.objects.get(pk=self.choice.id).votes, 2)
+
+        # reading the results is limited separately
+        self.assertEquals(self.client.get(self.url).status_code, 200)
+
+
+    @override_settings(POLLS_RATE_LIMITS={
+        'STORE': 'cache', 'LIMITS': {'results': {'POLL': '1/minute'}},
+    })
+    def test_each_poll_has_its_own_bucket(self):
+        other = Poll(question='other', pub_date=timezone.now())
+        other.save()
+
+        self.assertEquals(self.client.get(self.url).status_code, 200)
+        self.assertEquals(self.client.get(self.url).status_code, 429)
+        self.assertEquals(self.client.get('/poll/%d/' % (other.id,)).status_code, 200)
+        self.assertEquals(
+            self.client.get('/api/polls/%d/' % (self.poll.id,)).status_code, 429
+        )
@@ -0,0 +1,112 @@
+import json
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+from polls.models import Choice, Poll
+from polls.search import (
+    SEARCH_TABLE, has_search_index, match_expression, rebuild_search_index,
+    search_polls
+)
+
+
+def make_poll(question, *choices):
+    poll = Poll(question=question, pub_date=timezone.now())
+    poll.save()
+    for choice in choices:
+        Choice(poll=poll, choice=choice).save()
+    return poll
+
+
+
+class SearchTest(TestCase):
+
+    def setUp(self):
+        self.editors = make_poll('Best editor?', 'vim', 'emacs')
+        self.colours = make_poll('Favourite colour?', 'red', 'blue')
+
+
+    def test_finds_polls_by_question_or_choice_and_word_prefix(self):
+        self.assertEquals(list(search_polls('favourite')), [self.colours])
+        self.assertEquals(list(search_polls('emac')), [self.editors])
+        self.assertEquals(list(search_polls('best vim')), [self.editors])
+        self.assertEquals(list(search_polls('best red')), [])
+        self.assertEquals(list(search_polls('  ?! ')), [])
+
+
+    def test_follows_edits_to_polls_and_choices(self):
+        self.editors.question = 'Best IDE?'
+        self.editors.save()
+        Choice.objects.filter(choice='red').update(choice='green')
+        Choice.objects.filter(choice='blue').delete()
+
+        self.assertEquals(list(search_polls('ide')), [self.editors])
+        self.assertEquals(list(search_polls('green')), [self.colours])
+        self.assertEquals(list(search_polls('red')), [])
+        self.assertEquals(list(search_polls('blue')), [])
+
+        self.colours.delete()
+        self.assertEquals(list(search_polls('favourite')), [])
+
+
+    @override_settings(POLLS_PAGE_SIZE=2)
+    def test_results_are_paginated(self):
+        pizza = make_poll('Best pizza?')
+        film = make_poll('Best film?')
+        first_page = search_polls('best')
+        self.assertEquals(len(first_page), 2)
+        self.assertTrue(first_page.has_next)
+        self.assertFalse(first_page.has_previous)
+
+        second_page = search_polls('best', page=2)
+        self.assertEquals(len(second_page), 1)
+        self.assertEquals(
+            set(first_page.items + second_page.items),
+            set([self.editors, pizza, film])
+        )
+        self.assertFalse(second_page.has_next)
+        self.assertTrue(second_page.has_previous)
+
+
+    def test_search_page(self):
+        response = self.client.get('/search/', {'q': 'colour'})
+        self.assertTemplateUsed(response, 'search.html')
+        self.assertEquals(list(response.context['polls']), [self.colours])
+        self.assertIn('Favourite colour?', response.content)
+
+        self.assertEquals(self.client.get('/search/?q=x&page=0').status_code, 404)
+
+
+    def test_search_api(self):
+        response = self.client.get('/api/polls/search/', {'q': 'vim'})
+        found = json.loads(response.content)
+        self.assertEquals([poll['id'] for poll in found['polls']], [self.editors.id])
+        self.assertEquals(found['has_next'], False)
+
+
+    def test_words_are_quoted_for_fts(self):
+        self.assertEquals(match_expression(['a', 'b"c']), '"a"* "b""c"*')
+
+
+
+class SearchIndexTest(TestCase):
+
+    def setUp(self):
+        if not has_search_index():
+            self.skipTest('SQLite was built without FTS5')
+
+
+    def test_question_matches_rank_above_choice_matches(self):
+        in_choice = make_poll('Which jumper?', 'the colourful one')
+        in_question = make_poll('Favourite colour?')
+        self.assertEquals(list(search_polls('colour')), [in_question, in_choice])
+
+
+    def test_rebuild_refills_the_index(self):
+        poll = make_poll('Favourite colour?', 'red')
+        connection.cursor().execute('DELETE FROM %s' % (SEARCH_TABLE,))
+        self.assertEquals(list(search_polls('red')), [])
+
+        self.assertEquals(rebuild_search_index(), 1)
+        self.assertEquals(list(search_polls('red')), [poll])
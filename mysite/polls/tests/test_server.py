@@ -0,0 +1,114 @@
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+import urllib2
+
+from django.test import TestCase
+
+from polls.server import PooledWSGIServer, QuietRequestHandler
+
+
+
+class PooledWSGIServerTest(TestCase):
+
+    def serve(self, app, **kwargs):
+        server = PooledWSGIServer(
+            ('127.0.0.1', 0), QuietRequestHandler, **kwargs
+        )
+        server.set_app(app)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server, 'http://127.0.0.1:%d/' % (server.server_address[1],)
+
+
+    def test_handles_requests_concurrently(self):
+        lock = threading.Lock()
+        in_flight = [0]
+        most_in_flight = [0]
+
+        def slow_app(environ, start_response):
+            with lock:
+                in_flight[0] += 1
+                most_in_flight[0] = max(most_in_flight[0], in_flight[0])
+            time.sleep(0.1)
+            with lock:
+                in_flight[0] -= 1
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            return ['done']
+
+        server, url = self.serve(slow_app, workers=4)
+        bodies = []
+        clients = [
+            threading.Thread(target=lambda: bodies.append(urllib2.urlopen(url).read()))
+            for _ in range(4)
+        ]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+
+        self.assertEquals(bodies, ['done'] * 4)
+        self.assertTrue(most_in_flight[0] > 1)
+        self.assertTrue(most_in_flight[0] <= 4)
+
+
+    def test_turns_away_requests_beyond_the_backlog(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def blocking_app(environ, start_response):
+            started.set()
+            release.wait(5)
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            return ['done']
+
+        server, url = self.serve(blocking_app, workers=1, backlog=1)
+        bodies = []
+        fetch = lambda: bodies.append(urllib2.urlopen(url).read())
+        busy = threading.Thread(target=fetch)
+        busy.start()
+        started.wait(5)
+        queued = threading.Thread(target=fetch)
+        queued.start()
+        for _ in range(500):
+            if server.requests.qsize():
+                break
+            time.sleep(0.01)
+
+        try:
+            urllib2.urlopen(url)
+            self.fail('expected a 503')
+        except urllib2.HTTPError as e:
+            self.assertEquals(e.code, 503)
+            self.assertEquals(e.info()['Retry-After'], '1')
+        finally:
+            release.set()
+            busy.join()
+            queued.join()
+
+        self.assertEquals(bodies, ['done', 'done'])
+        self.assertEquals(server.rejected, 1)
+
+
+    def test_sigterm_stops_the_server_and_runs_exit_handlers(self):
+        server = subprocess.Popen([sys.executable, '-c', (
+            'import atexit, sys\n'
+            'from polls.server import run_pooled\n'
+            'atexit.register(lambda: sys.stdout.write("exit handlers ran\\n"))\n'
+            'sys.stdout.write("serving\\n"); sys.stdout.flush()\n'
+            'run_pooled("127.0.0.1", 0, None, workers=1)\n'
+        )], stdout=subprocess.PIPE, env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)))
+        self.assertEquals(server.stdout.readline(), 'serving\n')
+        # time to get from writing that to installing the signal handler
+        time.sleep(0.5)
+
+        server.send_signal(signal.SIGTERM)
+
+        self.assertEquals(server.stdout.read(), 'exit handlers ran\n')
+        self.assertEquals(server.wait(), 0)
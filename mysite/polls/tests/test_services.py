@@ -0,0 +1,276 @@
+import threading
+from StringIO import StringIO
+
+from django.core.management import call_command
+from django.db import connections
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+from polls.models import Choice, ChoiceVoteShard, Poll
+from polls.services import (
+    InvalidVotes, apply_vote_deltas, create_vote_shards, fold_vote_shards,
+    pick_shard, record_vote, record_votes
+)
+
+
+def run_in_threads(target, num_threads):
+    # each thread opens a connection of its own, to the test database file
+    errors = []
+
+    def worker():
+        try:
+            target()
+        except Exception as e:
+            errors.append(e)
+        finally:
+            connections['default'].close()
+
+    threads = [threading.Thread(target=worker) for _ in range(num_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+
+
+class RecordVoteTest(TestCase):
+
+    def test_adds_one_vote_to_the_choice(self):
+        poll = Poll(question='6 times 7', pub_date=timezone.now())
+        poll.save()
+        choice = Choice(poll=poll, choice='42', votes=3)
+        choice.save()
+
+        self.assertTrue(record_vote(poll.id, choice.id))
+
+        self.assertEquals(Choice.objects.get(pk=choice.id).votes, 4)
+        self.assertEquals(Poll.objects.get(pk=poll.id).votes, 4)
+
+
+    def test_uses_one_update_for_the_choice_and_one_for_the_poll(self):
+        poll = Poll(question='6 times 7', pub_date=timezone.now())
+        poll.save()
+        choice = Choice(poll=poll, choice='42', votes=0)
+        choice.save()
+
+        with self.assertNumQueries(2):
+            record_vote(poll.id, choice.id)
+
+
+    def test_refuses_choices_from_another_poll(self):
+        poll1 = Poll(question='6 times 7', pub_date=timezone.now())
+        poll1.save()
+        poll2 = Poll(question='time', pub_date=timezone.now())
+        poll2.save()
+        choice = Choice(poll=poll2, choice='PM', votes=0)
+        choice.save()
+
+        self.assertFalse(record_vote(poll1.id, choice.id))
+        self.assertFalse(record_vote(poll1.id, choice.id + 1000))
+
+        self.assertEquals(Choice.objects.get(pk=choice.id).votes, 0)
+        self.assertEquals(Poll.objects.get(pk=poll1.id).votes, 0)
+
+
+
+class ApplyVoteDeltasTest(TestCase):
+
+    def test_applies_deltas_for_more_choices_than_sqlite_takes_parameters(self):
+        poll = Poll(question='time', pub_date=timezone.now())
+        poll.save()
+        Choice.objects.bulk_create([
+            Choice(poll=poll, choice=str(i), votes=0) for i in range(1200)
+        ])
+        deltas = dict(
+            ((poll.id, choice_id), 1)
+            for choice_id in Choice.objects.filter(poll=poll).values_list('id', flat=True)
+        )
+
+        self.assertEquals(apply_vote_deltas(deltas), 1200)
+        self.assertEquals(Poll.objects.get(pk=poll.id).votes, 1200)
+        self.assertEquals(Choice.objects.filter(poll=poll, votes=1).count(), 1200)
+
+
+
+class RecordVotesTest(TestCase):
+
+    def setUp(self):
+        self.poll1 = Poll(question='6 times 7', pub_date=timezone.now())
+        self.poll1.save()
+        self.choice1 = Choice(poll=self.poll1, choice='42', votes=0)
+        self.choice1.save()
+        self.choice2 = Choice(poll=self.poll1, choice='The Ultimate Answer', votes=0)
+        self.choice2.save()
+        self.poll2 = Poll(question='time', pub_date=timezone.now())
+        self.poll2.save()
+        self.choice3 = Choice(poll=self.poll2, choice='PM', votes=0)
+        self.choice3.save()
+
+
+    def test_records_a_batch_in_a_fixed_number_of_queries(self):
+        votes = [
+            (self.poll1.id, self.choice1.id, 100),
+            (self.poll1.id, self.choice2.id, 20),
+            (self.poll2.id, self.choice3.id, 3),
+            (self.poll1.id, self.choice1.id, 1),
+        ]
+        with self.assertNumQueries(3):
+            self.assertEquals(record_votes(votes), 124)
+
+        self.assertEquals(
+            [c.votes for c in Choice.objects.order_by('id')], [101, 20, 3]
+        )
+        self.assertEquals(Poll.objects.get(pk=self.poll1.id).votes, 121)
+        self.assertEquals(Poll.objects.get(pk=self.poll2.id).votes, 3)
+
+
+    def test_records_nothing_if_any_choice_is_on_the_wrong_poll(self):
+        votes = [
+            (self.poll1.id, self.choice1.id, 100),
+            (self.poll1.id, self.choice3.id, 1),
+        ]
+        try:
+            record_votes(votes)
+            self.fail('expected InvalidVotes')
+        except InvalidVotes as e:
+            self.assertEquals(e.invalid, set([(self.poll1.id, self.choice3.id)]))
+
+        self.assertEquals(Choice.objects.get(pk=self.choice1.id).votes, 0)
+        self.assertEquals(Poll.objects.get(pk=self.poll1.id).votes, 0)
+
+
+    def test_refuses_negative_counts(self):
+        self.assertRaises(
+            ValueError, record_votes, [(self.poll1.id, self.choice1.id, -5)]
+        )
+
+
+
+@override_settings(POLLS_VOTE_SHARDS=4)
+class ShardedVoteTest(TestCase):
+
+    def test_votes_are_spread_over_shards_and_summed_on_read(self):
+        poll = Poll(question='6 times 7', pub_date=timezone.now())
+        poll.save()
+        choice1 = Choice(poll=poll, choice='42', votes=2)
+        choice1.save()
+        choice2 = Choice(poll=poll, choice='The Ultimate Answer', votes=0)
+        choice2.save()
+
+        for _ in range(10):
+            self.assertTrue(record_vote(poll.id, choice1.id))
+        record_vote(poll.id, choice2.id)
+
+        # the choice row itself is left alone...
+        self.assertEquals(Choice.objects.get(pk=choice1.id).votes, 2)
+        # ...but reads add the shards back in
+        self.assertEquals(choice1.vote_count(), 12)
+        self.assertEquals(Poll.objects.get(pk=poll.id).total_votes(), 13)
+        self.assertEquals(
+            Choice.objects.get(pk=choice2.id).percentage(), 100.0 / 13
+        )
+        self.assertTrue(choice1.shards.count() <= 4)
+
+
+    def test_hashed_shard_keys_always_pick_the_same_shard(self):
+        self.assertEquals(pick_shard(4, 'session1'), pick_shard(4, 'session1'))
+        self.assertTrue(0 <= pick_shard(4, 'session2') < 4)
+        self.assertTrue(0 <= pick_shard(4) < 4)
+
+
+    def test_refuses_choices_from_another_poll(self):
+        poll1 = Poll(question='6 times 7', pub_date=timezone.now())
+        poll1.save()
+        poll2 = Poll(question='time', pub_date=timezone.now())
+        poll2.save()
+        choice = Choice(poll=poll2, choice='PM', votes=0)
+        choice.save()
+
+        self.assertFalse(record_vote(poll1.id, choice.id))
+        self.assertEquals(ChoiceVoteShard.objects.count(), 0)
+
+
+    def test_prebuilt_shards_make_a_vote_a_single_update(self):
+        poll = Poll(question='6 times 7', pub_date=timezone.now())
+        poll.save()
+        choice = Choice(poll=poll, choice='42', votes=0)
+        choice.save()
+
+        self.assertEquals(create_vote_shards(4), 4)
+        self.assertEquals(create_vote_shards(4), 0)
+
+        with self.assertNumQueries(2):
+            record_vote(poll.id, choice.id)
+
+
+    def test_folding_moves_shard_votes_back_onto_choices(self):
+        poll = Poll(question='6 times 7', pub_date=timezone.now())
+        poll.save()
+        choice = Choice(poll=poll, choice='42', votes=1)
+        choice.save()
+        for _ in range(5):
+            record_vote(poll.id, choice.id)
+
+        fold_vote_shards()
+
+        self.assertEquals(ChoiceVoteShard.objects.count(), 0)
+        self.assertEquals(Choice.objects.get(pk=choice.id).votes, 6)
+
+
+    def test_backfill_command_creates_shards(self):
+        poll = Poll(question='6 times 7', pub_date=timezone.now())
+        poll.save()
+        Choice(poll=poll, choice='42').save()
+        Choice(poll=poll, choice='The Ultimate Answer').save()
+
+        call_command('backfill_vote_shards', stdout=StringIO())
+
+        self.assertEquals(ChoiceVoteShard.objects.count(), 8)
+
+
+
+class ConcurrentVotingTest(TransactionTestCase):
+
+    def test_no_votes_are_lost_when_many_threads_vote_at_once(self):
+        poll = Poll(question='6 times 7', pub_date=timezone.now())
+        poll.save()
+        choice = Choice(poll=poll, choice='42', votes=0)
+        choice.save()
+
+        num_threads, votes_per_thread = 8, 50
+
+        def vote_lots():
+            for _ in range(votes_per_thread):
+                record_vote(poll.id, choice.id)
+
+        errors = run_in_threads(vote_lots, num_threads)
+
+        self.assertEquals(errors, [])
+        self.assertEquals(
+                Choice.objects.get(pk=choice.id).votes,
+                num_threads * votes_per_thread
+        )
+        self.assertEquals(
+                Poll.objects.get(pk=poll.id).votes,
+                num_threads * votes_per_thread
+        )
+
+
+    @override_settings(POLLS_VOTE_SHARDS=4)
+    def test_no_votes_are_lost_with_sharded_counters(self):
+        poll = Poll(question='6 times 7', pub_date=timezone.now())
+        poll.save()
+        choice = Choice(poll=poll, choice='42', votes=0)
+        choice.save()
+
+        num_threads, votes_per_thread = 8, 50
+
+        def vote_lots():
+            for _ in range(votes_per_thread):
+                record_vote(poll.id, choice.id)
+
+        errors = run_in_threads(vote_lots, num_threads)
+
+        self.assertEquals(errors, [])
+        self.assertEquals(choice.vote_count(), num_threads * votes_per_thread)
@@ -0,0 +1,184 @@
+import json
+import time
+
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+from polls.models import Choice, Poll, TrendScore
+from polls.services import record_vote
+from polls.trending import TrendingBoard, add_logs, get_trending_board
+
+HOUR = 60 * 60
+
+TRENDING = {'HALF_LIFE': HOUR, 'SIZE': 2, 'SYNC_INTERVAL': HOUR}
+
+
+def make_poll(question):
+    poll = Poll(question=question, pub_date=timezone.now())
+    poll.save()
+    choice = Choice(poll=poll, choice='yes')
+    choice.save()
+    return poll, choice
+
+
+
+class TrendingBoardTest(TestCase):
+
+    def test_adds_scores_as_logs(self):
+        self.assertEquals(add_logs(None, 3.0), 3.0)
+        self.assertAlmostEqual(add_logs(3.0, 3.0), 4.0)
+        self.assertAlmostEqual(add_logs(1.0, 2000.0), 2000.0)
+
+
+    def test_ranks_by_votes_decayed_by_age(self):
+        board = TrendingBoard(half_life=HOUR)
+        board.record({1: 10}, now=0)
+        board.record({2: 5}, now=2 * HOUR)
+        board.record({3: 1}, now=2 * HOUR)
+
+        top = board.top(2, now=2 * HOUR)
+        self.assertEquals([poll_id for poll_id, _ in top], [2, 1])
+        self.assertAlmostEqual(top[0][1], 5.0)
+        self.assertAlmostEqual(top[1][1], 2.5)
+
+        board.record({1: 3}, now=2 * HOUR)
+        self.assertEquals([poll_id for poll_id, _ in board.top(3, now=2 * HOUR)], [1, 2, 3])
+
+
+    def test_keeps_only_the_top_max_polls(self):
+        board = TrendingBoard(half_life=HOUR, max_polls=2)
+        board.record({1: 3, 2: 1, 3: 2}, now=0)
+        self.assertEquals(sorted(board.scores), [1, 3])
+        self.assertEquals([poll_id for poll_id, _ in board.top(10, now=0)], [1, 3])
+
+
+    def test_polls_stop_trending_once_their_votes_decay(self):
+        board = TrendingBoard(half_life=HOUR)
+        board.record({1: 1}, now=0)
+        self.assertEquals(len(board.top(10, now=9 * HOUR)), 1)
+        self.assertEquals(board.top(10, now=11 * HOUR), [])
+
+
+
+class TrendingScoresTest(TestCase):
+
+    def setUp(self):
+        self.first, _ = make_poll('first')
+        self.second, _ = make_poll('second')
+
+
+    def test_syncing_shares_votes_between_boards(self):
+        now = time.time()
+        one, other = TrendingBoard(half_life=HOUR), TrendingBoard(half_life=HOUR)
+        one.record({self.first.id: 4}, now=now)
+        other.record({self.second.id: 2}, now=now)
+        one.sync(now)
+        other.sync(now)
+
+        top = other.top(10, now=now)
+        self.assertEquals(
+            [poll_id for poll_id, _ in top], [self.first.id, self.second.id]
+        )
+        self.assertAlmostEqual(top[0][1], 4.0)
+
+        # added to what's saved, rather than overwriting it
+        other.record({self.first.id: 4}, now=now)
+        other.sync(now)
+        self.assertAlmostEqual(
+            TrendScore.objects.get(poll=self.first).score, 3 + now / HOUR
+        )
+
+
+    def test_syncing_forgets_decayed_scores_and_deleted_polls(self):
+        now = time.time()
+        board = TrendingBoard(half_life=HOUR)
+        board.record({self.first.id: 1}, now=now - 11 * HOUR)
+        board.record({self.second.id: 1, 12345: 1}, now=now)
+        board.sync(now)
+
+        self.assertEquals(
+            list(TrendScore.objects.values_list('poll_id', flat=True)),
+            [self.second.id]
+        )
+        self.assertEquals(board.top(10, now=now)[0][0], self.second.id)
+
+
+    @override_settings(POLLS_TRENDING=TRENDING)
+    def test_recorded_votes_reach_the_board(self):
+        _, choice = make_poll('third')
+        record_vote(self.second.id, self.second.choice_set.get().id)
+        record_vote(choice.poll_id, choice.id)
+        record_vote(choice.poll_id, choice.id)
+
+        top = get_trending_board().top(10)
+        self.assertEquals([poll_id for poll_id, _ in top], [choice.poll_id, self.second.id])
+
+
+
+class TrendingViewsTest(TestCase):
+
+    def setUp(self):
+        self.polls = []
+        for question in ('quiet', 'busy', 'busier'):
+            poll, choice = make_poll(question)
+            self.polls.append((poll, choice))
+
+
+    def vote(self, index, times):
+        poll, choice = self.polls[index]
+        for _ in range(times):
+            record_vote(poll.id, choice.id)
+
+
+    @override_settings(POLLS_TRENDING=TRENDING)
+    def test_home_page_lists_trending_polls(self):
+        self.vote(1, 2)
+        self.vote(2, 3)
+
+        # the polls page, and the trending polls
+        with self.assertNumQueries(2):
+            response = self.client.get('/')
+        self.assertEquals(
+            [poll.question for poll in response.context['trending']],
+            ['busier', 'busy']
+        )
+        self.assertIn('<h2>Trending</h2>', response.content)
+
+        etag = response['ETag']
+        self.vote(0, 4)
+        response = self.client.get('/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(
+            [poll.question for poll in response.context['trending']],
+            ['quiet', 'busier']
+        )
+
+
+    def test_home_page_has_no_trending_polls_when_off(self):
+        self.vote(1, 2)
+        response = self.client.get('/')
+        self.assertEquals(response.context['trending'], [])
+        self.assertNotIn('Trending', response.content)
+
+
+    @override_settings(POLLS_TRENDING=TRENDING)
+    def test_api_serves_trending_polls(self):
+        self.vote(1, 2)
+        self.vote(2, 3)
+
+        response = self.client.get('/api/polls/trending/', {'n': 1})
+        self.assertEquals(response['Content-Type'], 'application/json')
+        polls = json.loads(response.content)['polls']
+        self.assertEquals([poll['question'] for poll in polls], ['busier'])
+        self.assertAlmostEqual(polls[0]['score'], 3, places=2)
+
+        polls = json.loads(self.client.get('/api/polls/trending/').content)['polls']
+        self.assertEquals([poll['question'] for poll in polls], ['busier', 'busy'])
+
+        response = self.client.get('/api/polls/trending/', {'n': 'lots'})
+        self.assertEquals(response.status_code, 400)
+
+
+    def test_api_is_not_found_when_off(self):
+        response = self.client.get('/api/polls/trending/')
+        self.assertEquals(response.status_code, 404)
@@ -1,7 +1,14 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import get_cache
 from django.core.urlresolvers import reverse
 from django.test import TestCase
+from django.test.client import Client
+from django.test.utils import override_settings
 from django.utils import timezone
 from polls.models import Choice, Poll
+from polls.services import record_vote
 
 
 class HomePageViewTest(TestCase):
@@ -33,6 +40,65 @@ class HomePageViewTest(TestCase):
         self.assertIn(poll2_url, response.content)
 
 
+    @override_settings(POLLS_PAGE_SIZE=2)
+    def test_home_page_is_paginated_with_cursors(self):
+        start = timezone.now()
+        polls = []
+        for i in range(5):
+            poll = Poll(question='poll %d' % (i,), pub_date=start + timedelta(minutes=i))
+            poll.save()
+            polls.append(poll)
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/')
+        page = response.context['page']
+        self.assertEquals(list(response.context['polls']), polls[:2])
+        self.assertEquals(page.previous_cursor, None)
+        self.assertIn('?after=%s' % (page.next_cursor,), response.content)
+
+        response = self.client.get('/', {'after': page.next_cursor})
+        page = response.context['page']
+        self.assertEquals(list(response.context['polls']), polls[2:4])
+
+        response = self.client.get('/', {'after': page.next_cursor})
+        last_page = response.context['page']
+        self.assertEquals(list(response.context['polls']), polls[4:])
+        self.assertEquals(last_page.next_cursor, None)
+
+        # and back again
+        response = self.client.get('/', {'before': last_page.previous_cursor})
+        self.assertEquals(list(response.context['polls']), polls[2:4])
+        response = self.client.get('/', {'before': page.previous_cursor})
+        self.assertEquals(list(response.context['polls']), polls[:2])
+        self.assertEquals(response.context['page'].previous_cursor, None)
+
+
+    def test_polls_published_at_the_same_moment_are_not_skipped(self):
+        pub_date = timezone.now()
+        polls = []
+        for i in range(3):
+            poll = Poll(question='poll %d' % (i,), pub_date=pub_date)
+            poll.save()
+            polls.append(poll)
+
+        with self.settings(POLLS_PAGE_SIZE=1):
+            seen = []
+            cursor = None
+            while True:
+                response = self.client.get('/', {'after': cursor} if cursor else {})
+                seen.extend(response.context['polls'])
+                cursor = response.context['page'].next_cursor
+                if cursor is None:
+                    break
+        self.assertEquals(seen, polls)
+
+
+    def test_bad_cursors_are_404s(self):
+        for cursor in ('not-a-cursor', '1_%d' % (2 ** 64,), '%d_1' % (10 ** 30,)):
+            response = self.client.get('/', {'after': cursor})
+            self.assertEquals(response.status_code, 404)
+
+
 
 class SinglePollViewTest(TestCase):
 
@@ -96,6 +162,34 @@ class SinglePollViewTest(TestCase):
         self.assertNotIn('1 votes', response.content)
 
 
+    def test_query_count_does_not_grow_with_the_number_of_choices(self):
+        for num_choices in (2, 20):
+            poll = Poll(question='6 times 7', pub_date=timezone.now())
+            poll.save()
+            for i in range(num_choices):
+                Choice(poll=poll, choice='choice %d' % (i,), votes=i).save()
+
+            # the poll, and its choices, for both the results and the form
+            with self.assertNumQueries(2):
+                response = self.client.get('/poll/%d/' % (poll.id,))
+            self.assertIn('<p>%d vote' % (poll.total_votes(),), response.content)
+
+
+    @override_settings(POLLS_VOTE_SHARDS=4)
+    def test_sharded_query_count_does_not_grow_with_the_number_of_choices(self):
+        for num_choices in (2, 20):
+            poll = Poll(question='6 times 7', pub_date=timezone.now())
+            poll.save()
+            for i in range(num_choices):
+                choice = Choice(poll=poll, choice='choice %d' % (i,), votes=0)
+                choice.save()
+                record_vote(poll.id, choice.id)
+
+            with self.assertNumQueries(2):
+                response = self.client.get('/poll/%d/' % (poll.id,))
+            self.assertIn('%d votes' % (num_choices,), response.content)
+
+
     def test_view_can_handle_votes_via_POST(self):
         # set up a poll with choices
         poll1 = Poll(question='6 times 7', pub_date=timezone.now())
@@ -121,3 +215,158 @@ class SinglePollViewTest(TestCase):
         # always redirect after a POST - even if, in this case, we go back
         # to the same page.
         self.assertRedirects(response, poll_url)
+
+
+    def test_view_rejects_votes_for_a_choice_on_another_poll(self):
+        poll1 = Poll(question='6 times 7', pub_date=timezone.now())
+        poll1.save()
+        poll2 = Poll(question='time', pub_date=timezone.now())
+        poll2.save()
+        other_choice = Choice(poll=poll2, choice='PM', votes=0)
+        other_choice.save()
+
+        response = self.client.post(
+                '/poll/%d/' % (poll1.id,), data={'vote': str(other_choice.id)}
+        )
+
+        self.assertEquals(response.status_code, 404)
+        self.assertEquals(Choice.objects.get(pk=other_choice.id).votes, 0)
+
+
+    def test_view_rejects_missing_or_malformed_votes(self):
+        poll1 = Poll(question='6 times 7', pub_date=timezone.now())
+        poll1.save()
+
+        poll_url = '/poll/%d/' % (poll1.id,)
+        self.assertEquals(self.client.post(poll_url).status_code, 404)
+        self.assertEquals(
+                self.client.post(poll_url, data={'vote': 'lots'}).status_code,
+                404
+        )
+
+
+
+class ConditionalGetTest(TestCase):
+
+    def setUp(self):
+        self.poll = Poll(question='6 times 7', pub_date=timezone.now())
+        self.poll.save()
+        self.choice = Choice(poll=self.poll, choice='42', votes=0)
+        self.choice.save()
+        self.poll_url = '/poll/%d/' % (self.poll.id,)
+
+
+    def test_unchanged_poll_pages_are_304s_for_one_query(self):
+        response = self.client.get(self.poll_url)
+        self.assertTrue(response.has_header('Last-Modified'))
+        etag = response['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.poll_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, 304)
+        self.assertEquals(response.content, '')
+
+
+    def test_votes_change_the_etag(self):
+        etag = self.client.get(self.poll_url)['ETag']
+
+        self.client.post(self.poll_url, data={'vote': str(self.choice.id)})
+
+        response = self.client.get(self.poll_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, 200)
+        self.assertNotEquals(response['ETag'], etag)
+        self.assertIn('1 vote', response.content)
+
+
+    def test_editing_a_choice_changes_the_etag(self):
+        etag = self.client.get(self.poll_url)['ETag']
+
+        self.choice.choice = 'Forty-two'
+        self.choice.save()
+
+        response = self.client.get(self.poll_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, 200)
+
+
+    def test_if_modified_since_is_honoured(self):
+        last_modified = self.client.get(self.poll_url)['Last-Modified']
+
+        response = self.client.get(
+                self.poll_url, HTTP_IF_MODIFIED_SINCE=last_modified
+        )
+        self.assertEquals(response.status_code, 304)
+
+
+    def test_votes_dont_pay_for_the_etag(self):
+        with self.assertNumQueries(2):
+            self.client.post(self.poll_url, data={'vote': str(self.choice.id)})
+
+
+    def test_missing_polls_are_404s(self):
+        response = self.client.get('/poll/%d/' % (self.poll.id + 1,))
+        self.assertEquals(response.status_code, 404)
+
+
+    def test_unchanged_home_pages_are_304s_for_one_query(self):
+        etag = self.client.get('/')['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, 304)
+
+        Poll(question='time', pub_date=timezone.now()).save()
+        response = self.client.get('/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, 200)
+
+
+
+@override_settings(POLLS_PAGE_CACHE={'CACHE': 'default'})
+class FullPageCacheTest(TestCase):
+
+    def setUp(self):
+        get_cache('default').clear()
+        self.poll = Poll(question='6 times 7', pub_date=timezone.now())
+        self.poll.save()
+        self.choice = Choice(poll=self.poll, choice='42', votes=0)
+        self.choice.save()
+        self.poll_url = '/poll/%d/' % (self.poll.id,)
+
+
+    def test_anonymous_visitors_get_cached_pages(self):
+        self.client.get(self.poll_url)
+
+        # just the query for the ETag
+        with self.assertNumQueries(1):
+            response = Client().get(self.poll_url)
+        self.assertEquals(response.status_code, 200)
+        self.assertIn('6 times 7', response.content)
+
+
+    def test_each_visitor_gets_their_own_csrf_token(self):
+        first = self.client.get(self.poll_url)
+        first_token = first.cookies['csrftoken'].value
+
+        second = Client().get(self.poll_url)
+        second_token = second.cookies['csrftoken'].value
+
+        self.assertNotEquals(first_token, second_token)
+        self.assertIn(second_token, second.content)
+        self.assertNotIn(first_token, second.content)
+
+
+    def test_votes_mean_a_fresh_page(self):
+        self.client.get(self.poll_url)
+        self.client.post(self.poll_url, data={'vote': str(self.choice.id)})
+
+        response = Client().get(self.poll_url)
+        self.assertIn('1 vote', response.content)
+
+
+    def test_visitors_with_sessions_are_not_served_from_the_cache(self):
+        self.client.get(self.poll_url)
+        client = Client()
+        client.cookies[settings.SESSION_COOKIE_NAME] = 'somesession'
+
+        # the poll, and its choices
+        with self.assertNumQueries(2):
+            client.get(self.poll_url)
@@ -0,0 +1,284 @@
+"""
+Trending polls: the polls with the most votes lately.
+
+With ``POLLS_TRENDING`` set, every vote adds to its poll's score, and a
+vote's weight halves every ``HALF_LIFE`` seconds, so a poll's score is
+roughly its votes over the last half-life or so.  The home page lists
+the top ``SIZE`` polls, and ``/api/polls/trending/`` serves them as JSON::
+
+    POLLS_TRENDING = {
+        'HALF_LIFE': 3600,     # seconds for a vote's weight to halve
+        'SIZE': 10,            # polls on the home page
+        'MAX_POLLS': 10000,    # polls ranked in each process
+        'SYNC_INTERVAL': 60,   # seconds between saves to the database
+    }
+
+Each process keeps its polls in a list sorted by score, so the top ``n``
+are the first ``n`` of it, and a vote moves one poll within it.  Rather
+than decaying every score as time passes, a vote at time ``t`` counts
+``2 ** (t / HALF_LIFE)``: later votes count for more, which comes to the
+same ranking, and scores never need touching between votes.  They are
+kept as logs, base 2, so they don't overflow.
+
+Every ``SYNC_INTERVAL`` seconds, the next vote or read adds the votes the
+process has seen since the last sync to the ``TrendScore`` table, and
+reloads the ranking from it, which brings in everyone else's votes.
+Polls whose scores have decayed below ``FORGET_BELOW`` votes are dropped.
+The saved scores depend on ``HALF_LIFE``; after changing it, empty the
+table, or its scores will be off until they decay away.
+"""
+import atexit
+import bisect
+import logging
+import math
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import DatabaseError, router, transaction
+from django.dispatch import receiver
+from django.test.signals import setting_changed
+
+from polls.models import Poll, TrendScore
+from polls.services import _batches, _bulk_set
+from polls.signals import votes_recorded
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HALF_LIFE = 60 * 60
+DEFAULT_SIZE = 10
+DEFAULT_MAX_POLLS = 10000
+DEFAULT_SYNC_INTERVAL = 60
+
+# decayed votes below which a poll has stopped trending
+FORGET_BELOW = 2 ** -10
+
+# two parameters per row, under sqlite's limit of 999
+CREATE_BATCH_SIZE = 400
+
+
+def add_logs(a, b):
+    """``log2(2 ** a + 2 ** b)``, worked out without leaving the logs."""
+    if a is None:
+        return b
+    high, low = max(a, b), min(a, b)
+    return high + math.log1p(2 ** (low - high)) / math.log(2)
+
+
+
+class TrendingBoard(object):
+    """
+    Polls ranked by their votes, decayed by ``half_life``.  ``scores``
+    maps each poll to its score, and ``ranked`` holds ``(-score, poll_id)``
+    for each, in order.
+    """
+
+    def __init__(self, half_life=DEFAULT_HALF_LIFE, size=DEFAULT_SIZE,
+                 max_polls=DEFAULT_MAX_POLLS, sync_interval=DEFAULT_SYNC_INTERVAL):
+        self.half_life = float(half_life)
+        self.size = size
+        self.max_polls = max_polls
+        self.sync_interval = sync_interval
+        self.lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self.scores = {}
+        self.ranked = []
+        # what this process has added to each score since the last sync
+        self.pending = {}
+        # never, so the first vote or read loads the saved scores
+        self.synced_at = 0
+
+    def floor(self, now):
+        """The score of ``FORGET_BELOW`` votes at ``now``."""
+        return now / self.half_life + math.log(FORGET_BELOW, 2)
+
+    def _set(self, poll_id, score):
+        old = self.scores.get(poll_id)
+        if old is not None:
+            del self.ranked[bisect.bisect_left(self.ranked, (-old, poll_id))]
+        self.scores[poll_id] = score
+        bisect.insort(self.ranked, (-score, poll_id))
+        while len(self.ranked) > self.max_polls:
+            _, dropped = self.ranked.pop()
+            del self.scores[dropped]
+
+    def record(self, votes, now=None):
+        """Adds ``{poll_id: votes}``, cast at ``now``, to the scores."""
+        now = time.time() if now is None else now
+        with self.lock:
+            for poll_id, count in votes.items():
+                if count <= 0:
+                    continue
+                score = math.log(count, 2) + now / self.half_life
+                self._set(poll_id, add_logs(self.scores.get(poll_id), score))
+                self.pending[poll_id] = add_logs(self.pending.get(poll_id), score)
+
+    def top(self, n, now=None):
+        """
+        ``(poll_id, decayed votes)`` for the ``n`` top polls, leaving out
+        any that have stopped trending.
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            leaders = self.ranked[:n]
+        floor = self.floor(now)
+        return [
+            (poll_id, 2 ** (-negated - now / self.half_life))
+            for negated, poll_id in leaders
+            if -negated >= floor
+        ]
+
+    def sync(self, now=None):
+        """
+        Saves the votes recorded since the last sync, then reloads the
+        ranking from the saved scores.  If saving fails, they are kept
+        for the next sync.
+        """
+        now = time.time() if now is None else now
+        with self._sync_lock:
+            with self.lock:
+                pending, self.pending = self.pending, {}
+                self.synced_at = now
+            floor = self.floor(now)
+            try:
+                save_scores(pending, floor)
+                saved = load_scores(floor, self.max_polls)
+            except DatabaseError:
+                with self.lock:
+                    for poll_id, score in pending.items():
+                        self.pending[poll_id] = add_logs(self.pending.get(poll_id), score)
+                raise
+            with self.lock:
+                scores = dict(saved)
+                # votes recorded while we were saving
+                for poll_id, score in self.pending.items():
+                    scores[poll_id] = add_logs(scores.get(poll_id), score)
+                self.ranked = sorted(
+                    (-score, poll_id) for poll_id, score in scores.items()
+                )[:self.max_polls]
+                self.scores = dict((poll_id, -negated) for negated, poll_id in self.ranked)
+
+    def sync_if_due(self, now=None):
+        now = time.time() if now is None else now
+        if now - self.synced_at < self.sync_interval:
+            return
+        try:
+            self.sync(now)
+        except DatabaseError:
+            logger.exception('trending scores sync failed')
+
+    def save(self):
+        """Saves the votes recorded since the last sync, as the process exits."""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return
+        try:
+            save_scores(pending, self.floor(time.time()))
+        except DatabaseError:
+            logger.exception('saving trending scores failed')
+
+
+
+@transaction.commit_on_success
+def save_scores(increments, floor):
+    """
+    Adds ``{poll_id: score}`` to the saved scores, and deletes those
+    below ``floor``.  Rows are locked while they're added to, where the
+    database can, so that processes syncing at once don't lose votes.
+    """
+    using = router.db_for_write(TrendScore)
+    saved = {}
+    for batch in _batches(increments):
+        saved.update(
+            TrendScore.objects.using(using).select_for_update()
+            .filter(poll__in=batch).values_list('poll_id', 'score')
+        )
+    _bulk_set(TrendScore, 'score', dict(
+        (poll_id, add_logs(score, increments[poll_id]))
+        for poll_id, score in saved.items()
+    ))
+    # leaving out polls deleted since they were voted on
+    new = set()
+    for batch in _batches(set(increments) - set(saved)):
+        new.update(
+            Poll.objects.using(using).filter(pk__in=batch)
+            .values_list('id', flat=True)
+        )
+    created = [
+        TrendScore(poll_id=poll_id, score=increments[poll_id])
+        for poll_id in sorted(new)
+    ]
+    for start in range(0, len(created), CREATE_BATCH_SIZE):
+        TrendScore.objects.using(using).bulk_create(
+            created[start:start + CREATE_BATCH_SIZE]
+        )
+    TrendScore.objects.using(using).filter(score__lt=floor).delete()
+
+
+def load_scores(floor, limit):
+    """The ``limit`` top saved scores, as ``(poll_id, score)``."""
+    # from the primary, even for a view reading from a replica, which
+    # wouldn't have the scores just saved
+    return list(
+        TrendScore.objects.using(router.db_for_write(TrendScore))
+        .filter(score__gte=floor).order_by('-score')[:limit]
+        .values_list('poll_id', 'score')
+    )
+
+
+def trending(n=None):
+    """
+    ``(poll_id, decayed votes)`` for the top ``n`` polls, or ``SIZE`` of
+    them, or an empty list if ``POLLS_TRENDING`` is unset.
+    """
+    board = get_trending_board()
+    if board is None:
+        return []
+    board.sync_if_due()
+    return board.top(board.size if n is None else n)
+
+
+@receiver(votes_recorded)
+def _rank_votes(sender, deltas, **kwargs):
+    board = get_trending_board()
+    if board is None:
+        return
+    votes = defaultdict(int)
+    for (poll_id, _), count in deltas.items():
+        votes[poll_id] += count
+    board.record(votes)
+    board.sync_if_due()
+
+
+
+_board = None
+_board_lock = threading.Lock()
+
+def get_trending_board():
+    """
+    The process's trending board, or None if ``POLLS_TRENDING`` is unset.
+    """
+    global _board
+    config = getattr(settings, 'POLLS_TRENDING', None)
+    if not config:
+        return None
+    with _board_lock:
+        if _board is None:
+            _board = TrendingBoard(
+                half_life=config.get('HALF_LIFE', DEFAULT_HALF_LIFE),
+                size=config.get('SIZE', DEFAULT_SIZE),
+                max_polls=config.get('MAX_POLLS', DEFAULT_MAX_POLLS),
+                sync_interval=config.get('SYNC_INTERVAL', DEFAULT_SYNC_INTERVAL),
+            )
+            atexit.register(_board.save)
+        return _board
+
+
+@receiver(setting_changed)
+def _reset_trending_board(sender, setting, **kwargs):
+    global _board
+    if setting == 'POLLS_TRENDING':
+        with _board_lock:
+            _board = None
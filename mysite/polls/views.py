@@ -1,21 +1,245 @@
+import calendar
+import hashlib
+
+from django.conf import settings
+from django.core.cache import get_cache
 from django.core.urlresolvers import reverse
-from django.http import HttpResponseRedirect
+from django.http import Http404, HttpResponse, HttpResponseForbidden, HttpResponseRedirect
+from django.middleware.csrf import get_token
 from django.shortcuts import render
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from django.views.decorators.http import condition
 
+from polls.buffer import get_vote_buffer
+from polls.cache import cached_choice_labels, choice_labels, get_results_cache
+from polls.db import reads_from_replica
+from polls.events import events_enabled
 from polls.forms import PollVoteForm
-from polls.models import Choice, Poll
+from polls.guard import get_vote_guard, set_voter_cookie, voter_id
+from polls.models import MAX_INTEGER, Poll
+from polls.pagination import keyset_page
+from polls.ratelimit import rate_limited
+from polls.search import search_polls
+from polls.services import record_vote
+from polls.trending import trending
+
+def _microseconds(dt):
+    return calendar.timegm(dt.utctimetuple()) * 1000000 + dt.microsecond
+
+
+# The ETag and Last-Modified functions below are worked out before the
+# view runs, and both need the same rows, so the rows are fetched once
+# and kept on the request.  On a 304, that one query is all we do.
+
+def _home_page(request):
+    if not hasattr(request, '_polls_page'):
+        try:
+            request._polls_page = keyset_page(
+                Poll.objects.all(),
+                after=request.GET.get('after'),
+                before=request.GET.get('before'),
+            )
+        except ValueError:
+            request._polls_page = None
+    return request._polls_page
+
+
+def _trending(request):
+    if not hasattr(request, '_trending'):
+        request._trending = [poll_id for poll_id, _ in trending()]
+    return request._trending
+
+
+def _home_etag(request):
+    page = _home_page(request)
+    if page is None:
+        return None
+    state = ' '.join(
+        ['%d:%d' % (poll.id, _microseconds(poll.updated)) for poll in page]
+        + [page.previous_cursor or '', page.next_cursor or '']
+        + ['trending:' + ','.join(str(poll_id) for poll_id in _trending(request))]
+    )
+    return hashlib.md5(state).hexdigest()
+
 
+def _home_last_modified(request):
+    page = _home_page(request)
+    if page:
+        return max(poll.updated for poll in page)
+
+
+@reads_from_replica
+@condition(etag_func=_home_etag, last_modified_func=_home_last_modified)
 def home(request):
-    context = {'polls': Poll.objects.all()}
-    return render(request, 'home.html', context)
+    page = _home_page(request)
+    if page is None:
+        raise Http404
+
+    def render_page():
+        trending_ids = _trending(request)
+        # one more query, and only when some polls are trending
+        found = Poll.objects.in_bulk(trending_ids) if trending_ids else {}
+        context = {
+            'polls': page.items,
+            'page': page,
+            'trending': [found[pk] for pk in trending_ids if pk in found],
+        }
+        return render(request, 'home.html', context)
+    return _cached_page(request, 'home:' + _home_etag(request), render_page)
+
+
+def _get_poll(request, poll_id):
+    if not hasattr(request, '_poll'):
+        polls = list(Poll.objects.filter(pk=poll_id)[:1])
+        request._poll = polls[0] if polls else None
+    return request._poll
+
+
+def _poll_etag(request, poll_id):
+    poll = _get_poll(request, poll_id)
+    if poll is not None:
+        return '%d-%d-%d' % (poll.id, poll.votes, _microseconds(poll.updated))
+
+
+def _poll_last_modified(request, poll_id):
+    poll = _get_poll(request, poll_id)
+    if poll is not None:
+        return poll.updated
 
 
+@rate_limited('vote', methods=('POST',))
+@rate_limited('results', methods=('GET', 'HEAD'))
 def poll(request, poll_id):
+    if int(poll_id) > MAX_INTEGER:
+        raise Http404
     if request.method == 'POST':
-        choice = Choice.objects.get(id=request.POST['vote'])
-        choice.votes += 1
-        choice.save()
-        return HttpResponseRedirect(reverse('polls.views.poll', args=[poll_id,]))
-    poll = Poll.objects.get(pk=poll_id)
-    form = PollVoteForm(poll=poll)
-    return render(request, 'poll.html', {'poll': poll, 'form': form})
+        return _vote(request, poll_id)
+    response = _show_poll(request, poll_id)
+    guard = get_vote_guard()
+    if guard is not None:
+        set_voter_cookie(request, response, guard.key)
+    return response
+
+
+def _vote(request, poll_id):
+    labels = cached_choice_labels(poll_id)
+    if labels is not None:
+        # a vote for a choice that isn't on the poll goes no further
+        form = PollVoteForm(choices=labels, data=request.POST)
+        if not form.is_valid():
+            raise Http404
+        choice_id = form.cleaned_data['vote']
+    else:
+        try:
+            choice_id = int(request.POST['vote'])
+        except (KeyError, ValueError):
+            raise Http404
+        # checked before it can be buffered, as the flush can't refuse it
+        if not 0 <= choice_id <= MAX_INTEGER:
+            raise Http404
+    guard = get_vote_guard()
+    if guard is not None:
+        voter = voter_id(request, guard.key)
+        if not guard.admit(int(poll_id), voter):
+            return HttpResponseForbidden('You have already voted on this poll')
+    vote_buffer = get_vote_buffer()
+    if vote_buffer is not None:
+        # checked against the poll when the buffer is flushed
+        vote_buffer.add(int(poll_id), choice_id)
+    elif not record_vote(poll_id, choice_id):
+        if guard is not None:
+            guard.release(int(poll_id), voter)
+        raise Http404
+    return HttpResponseRedirect(reverse('polls.views.poll', args=[poll_id,]))
+
+
+@condition(etag_func=_poll_etag, last_modified_func=_poll_last_modified)
+def _show_poll(request, poll_id):
+    poll = _get_poll(request, poll_id)
+    if poll is None:
+        raise Http404
+
+    def render_page():
+        results, choices = _render_results(poll)
+        # the choices the results were rendered from, if they weren't cached
+        form = PollVoteForm(choices=choice_labels(poll.id, choices))
+        context = {
+            'poll': poll, 'results': results, 'form': form,
+            'live_results': events_enabled(),
+        }
+        return render(request, 'poll.html', context)
+    return _cached_page(request, 'poll:' + _poll_etag(request, poll_id), render_page)
+
+
+def _render_results(poll):
+    """
+    Returns the rendered results, and the poll's choices if they had to
+    be loaded to render them, or None if the results came from the cache.
+    """
+    loaded = []
+    def render_results():
+        choices = poll.results()
+        loaded.append(choices)
+        context = {'poll': poll, 'choices': choices}
+        return render_to_string('poll_results.html', context)
+
+    results_cache = get_results_cache()
+    if results_cache is None:
+        html = render_results()
+    else:
+        html = results_cache.get_or_render(poll.id, render_results)
+    return mark_safe(html), (loaded[0] if loaded else None)
+
+
+CSRF_PLACEHOLDER = '__polls_csrf_token__'
+
+def _cached_page(request, key, render_page):
+    """
+    With ``POLLS_PAGE_CACHE`` set, serves whole pages to anonymous visitors
+    from the cache, under a key made from the page's ETag, so a page is
+    rendered once per change to what it shows::
+
+        POLLS_PAGE_CACHE = {'CACHE': 'default', 'TIMEOUT': 300}
+
+    Each visitor's own CSRF token is swapped into the cached copy.
+    """
+    config = getattr(settings, 'POLLS_PAGE_CACHE', None)
+    if not config or settings.SESSION_COOKIE_NAME in request.COOKIES:
+        return render_page()
+
+    cache = get_cache(config.get('CACHE', 'default'))
+    key = 'polls:page:%s' % (key,)
+    content = cache.get(key)
+    if content is not None:
+        if CSRF_PLACEHOLDER in content:
+            content = content.replace(CSRF_PLACEHOLDER, get_token(request))
+        return HttpResponse(content)
+
+    response = render_page()
+    if response.status_code == 200:
+        content = response.content
+        token = request.META.get('CSRF_COOKIE')
+        if token:
+            content = content.replace(token, CSRF_PLACEHOLDER)
+        cache.set(key, content, config.get('TIMEOUT', 300))
+    return response
+
+
+def _page_number(request):
+    try:
+        number = int(request.GET.get('page', 1))
+    except ValueError:
+        raise Http404
+    if number < 1:
+        raise Http404
+    return number
+
+
+@rate_limited('search')
+@reads_from_replica
+def search(request):
+    query = request.GET.get('q', '')
+    page = search_polls(query, _page_number(request))
+    context = {'query': query, 'polls': page.items, 'page': page}
+    return render(request, 'search.html', context)